@@ -1,55 +1,360 @@
 #!/usr/bin/env python
 
+import os
+import glob
 import time
-import io
 import threading
-import picamera
 
-class Camera(object):
-    thread = None  # background thread that reads frames from camera
-    frame = None  # current frame is stored here by background thread
-    last_access = 0  # time of last client access to the camera
+try:
+    import picamera
+except ImportError:  # off-device, only the fake backend is available
+    picamera = None
 
-    def initialize(self):
-        if Camera.thread is None:
-            # start background frame thread
-            Camera.thread = threading.Thread(target=self._thread)
-            Camera.thread.start()
+MAX_FPS = 15  # default per-client frame rate cap (None for no cap)
+FRAME_TIMEOUT = 5  # seconds a client waits for a frame before retrying
+IDLE_TIMEOUT = 10  # seconds without clients before capture stops
+WARMUP_SECS = 2  # camera warm-up before the first frame
+FRAME_BUFFER_BYTES = 256 * 1024  # initial JPEG buffer size, grows if needed
+RESOLUTION = (620, 460)
 
-            # wait until frames start to be available
-            while self.frame is None:
-                time.sleep(0)
+# backend selection: 'pi', 'fake' or 'fake:<dir of .jpg frames>'
+CAMERA_ENV = 'HOMEPIXEL_CAMERA'
+FAKE_FPS = 30
+FAKE_BYTES_PER_PIXEL = 0.15  # synthetic frame size, about a 620x460 JPEG
 
-    def get_frame(self):
-        Camera.last_access = time.time()
-        self.initialize()
-        return self.frame
+# multipart/x-mixed-replace framing, yielded around each frame without copying
+FRAME_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+FRAME_TRAILER = b'\r\n'
+MJPEG_MIMETYPE = 'multipart/x-mixed-replace; boundary=frame'
+
+
+class FrameBuffer(object):
+    """Writable stream the camera encodes each JPEG into.
+
+    The bytearray is allocated once and reused for every frame (grown if
+    a frame doesn't fit), so capture doesn't allocate per chunk. frame()
+    takes the one copy per frame that all clients then share.
+    """
+
+    def __init__(self, size=FRAME_BUFFER_BYTES):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.length = 0
+
+    def write(self, data):
+        end = self.length + len(data)
+        if end > len(self.buffer):
+            self._grow(end)
+        self.view[self.length:end] = data
+        self.length = end
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def frame(self):
+        return bytes(self.view[:self.length])
+
+    def reset(self):
+        self.length = 0
+
+    def _grow(self, size):
+        # a bytearray can't be resized while a memoryview of it exists
+        self.view.release()
+        self.buffer.extend(bytes(max(size, 2 * len(self.buffer)) -
+                                 len(self.buffer)))
+        self.view = memoryview(self.buffer)
+
+
+class FrameBroadcaster(object):
+    """Publishes sequence-numbered frames to any number of waiting clients.
+
+    Only the latest frame is kept, so a client that falls behind skips
+    straight to it and the frames in between are dropped for that client.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.frame = None
+        self.sequence = 0
+
+    def publish(self, frame):
+        with self.condition:
+            self.frame = frame
+            self.sequence += 1
+            self.condition.notify_all()
+
+    def wait(self, last_sequence, timeout=FRAME_TIMEOUT):
+        """Block until a frame newer than last_sequence is published.
+
+        Returns (sequence, frame), or (last_sequence, None) on timeout.
+        """
+        with self.condition:
+            if not self.condition.wait_for(
+                    lambda: self.sequence > last_sequence, timeout):
+                return last_sequence, None
+            return self.sequence, self.frame
+
+
+class CaptureLifecycle(object):
+    """Starts the background capture thread on demand and stops it when idle.
+
+    Events: started (thread running), ready (first frame published) and
+    stopped (thread exited). The idle check and client arrivals share a
+    lock, so a client arriving as the thread decides to stop gets a new
+    thread, which waits for the old one to release the camera.
+    """
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.thread = None
+        self.thread_exiting = None  # thread that has decided to stop
+        self.started = threading.Event()
+        self.ready = threading.Event()
+        self.stopped = threading.Event()
+        self.stopped.set()  # no thread yet
+        self.stop_requested = threading.Event()
+        self.last_access = 0
+        self.start_time = None
+        self.ready_time = None
+        self.warmup_secs = None  # start to first frame of last run
+        self.frames = 0  # frames published in current run
+        self.restarts = 0
+
+    def ensure_running(self, target):
+        """Record a client access and start target in a thread if needed."""
+        with self.lock:
+            self.last_access = time.time()
+            if self.thread is not None:
+                return
+
+            previous = self.thread_exiting
+            self.started.clear()
+            self.ready.clear()
+            self.stopped.clear()
+            self.stop_requested.clear()
+            self.thread = threading.Thread(target=self._run,
+                                           args=(target, previous))
+            self.thread.daemon = True
+            self.thread.start()
+
+    def wait_ready(self, timeout=None):
+        return self.ready.wait(timeout)
+
+    def frame_published(self):
+        """Called by the capture loop after each frame."""
+        if not self.ready.is_set():
+            self.ready_time = time.time()
+            self.warmup_secs = self.ready_time - self.start_time
+            self.ready.set()
+        self.frames += 1
+
+    def should_stop(self):
+        """Called by the capture loop: True once idle or stop requested."""
+        with self.lock:
+            # warm-up doesn't count as idle time
+            last_access = max(self.last_access, self.ready_time or 0)
+            idle = time.time() - last_access > self.idle_timeout
+            if not (idle or self.stop_requested.is_set()):
+                return False
+
+            # new clients from here on start a new thread
+            self.thread_exiting = self.thread
+            self.thread = None
+            return True
+
+    def stop(self, timeout=None):
+        """Stop the capture thread and wait for it to exit."""
+        self.stop_requested.set()
+        return self.stopped.wait(timeout)
+
+    def restart(self, target, timeout=None):
+        self.stop(timeout)
+        self.restarts += 1
+        self.ensure_running(target)
+
+    def get_metrics(self):
+        running_secs = time.time() - self.ready_time if self.ready_time else 0
+        return {'running': self.thread is not None,
+                'warmup_secs': self.warmup_secs,
+                'frames': self.frames,
+                'fps': self.frames / running_secs if running_secs else 0,
+                'restarts': self.restarts}
+
+    def _run(self, target, previous):
+        if previous is not None:
+            previous.join()  # camera is only released when it exits
+
+        self.start_time = time.time()
+        self.ready_time = None
+        self.frames = 0
+        self.started.set()
+        try:
+            target()
+        finally:
+            with self.lock:
+                if self.thread is threading.current_thread():
+                    self.thread = None  # target exited without should_stop
+            self.stopped.set()
+
+
+class PiCameraBackend(object):
+    """Captures JPEGs from the Pi camera module."""
+
+    def capture(self, stream, stop_requested):
+        """Encode frames into stream, yielding after each one."""
+        if picamera is None:
+            raise RuntimeError('picamera not installed, use {}=fake'.format(
+                CAMERA_ENV))
 
-    @classmethod
-    def _thread(cls):
         with picamera.PiCamera() as camera:
             # camera setup
-            camera.resolution = (620, 460)
+            camera.resolution = RESOLUTION
             camera.hflip = True
             camera.vflip = True
 
-            # let camera warm up
+            # let camera warm up (cut short by a stop request)
             camera.start_preview()
-            time.sleep(2)
+            if stop_requested.wait(WARMUP_SECS):
+                return
 
-            stream = io.BytesIO()
             for foo in camera.capture_continuous(stream, 'jpeg',
                                                  use_video_port=True):
-                # store frame
-                stream.seek(0)
-                cls.frame = stream.read()
-
-                # reset stream for next frame
-                stream.seek(0)
-                stream.truncate()
-
-                # if there hasn't been any clients asking for frames in
-                # the last 10 seconds stop the thread
-                if time.time() - cls.last_access > 10:
-                    break
-        cls.thread = None
\ No newline at end of file
+                yield foo
+
+
+class FakeCameraBackend(object):
+    """Replays a sequence of frames at a fixed rate, no hardware needed.
+
+    Without frames, generates placeholder frames sized like a JPEG at the
+    given resolution (SOI/EOI markers around a frame counter & publish
+    time, enough to benchmark streaming but not a decodable image).
+    """
+
+    def __init__(self, fps=FAKE_FPS, resolution=RESOLUTION, frames=None,
+                 warmup_secs=0):
+        self.interval = 1.0 / fps
+        self.resolution = resolution
+        self.frames = frames
+        self.warmup_secs = warmup_secs
+
+    @classmethod
+    def from_directory(cls, path, **kwargs):
+        """Replay the .jpg files in a directory, in name order."""
+        frames = []
+        for name in sorted(glob.glob(os.path.join(path, '*.jpg'))):
+            with open(name, 'rb') as f:
+                frames.append(f.read())
+        if not frames:
+            raise ValueError('No .jpg frames in {}'.format(path))
+        return cls(frames=frames, **kwargs)
+
+    def capture(self, stream, stop_requested):
+        """Write a frame into stream every interval, yielding after each."""
+        if stop_requested.wait(self.warmup_secs):
+            return
+
+        width, height = self.resolution
+        padding = bytes(int(width * height * FAKE_BYTES_PER_PIXEL))
+        count = 0
+        next_time = time.time()
+        while True:
+            if self.frames:
+                stream.write(self.frames[count % len(self.frames)])
+            else:
+                stream.write(b'\xff\xd8')
+                stream.write('{} {:.6f}\n'.format(count, time.time()).encode())
+                stream.write(padding)
+                stream.write(b'\xff\xd9')
+            count += 1
+            yield stream
+
+            next_time += self.interval
+            if stop_requested.wait(max(next_time - time.time(), 0)):
+                return
+
+
+class Camera(object):
+    backend = None  # frame source, see get_backend()
+    lifecycle = CaptureLifecycle()  # background thread that reads frames
+    broadcaster = FrameBroadcaster()  # latest frame published by thread
+
+    def __init__(self, max_fps=MAX_FPS):
+        # per-client state, one Camera per /video_feed client
+        self.interval = 1.0 / max_fps if max_fps else 0
+        self.sequence = 0  # sequence number of last frame sent
+        self.next_time = 0  # earliest time the next frame may be sent
+        self.sent = 0
+        self.dropped = 0  # frames skipped because client was slow
+
+    @property
+    def frame(self):
+        return Camera.broadcaster.frame
+
+    def initialize(self, timeout=WARMUP_SECS + FRAME_TIMEOUT):
+        # start background frame thread & wait for its first frame
+        Camera.lifecycle.ensure_running(self._thread)
+        return Camera.lifecycle.wait_ready(timeout)
+
+    def get_frame(self):
+        """Block until a frame this client hasn't seen yet is available."""
+        delay = self.next_time - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+        frame = None
+        while frame is None:
+            Camera.lifecycle.ensure_running(self._thread)
+            sequence, frame = Camera.broadcaster.wait(self.sequence)
+
+        if self.sequence:
+            self.dropped += sequence - self.sequence - 1
+        self.sequence = sequence
+        self.sent += 1
+        self.next_time = time.time() + self.interval
+        return frame
+
+    @classmethod
+    def _thread(cls):
+        stream = FrameBuffer()
+        for foo in cls.backend.capture(stream, cls.lifecycle.stop_requested):
+            # publish frame to waiting clients
+            cls.broadcaster.publish(stream.frame())
+            cls.lifecycle.frame_published()
+
+            # reuse buffer for next frame
+            stream.reset()
+
+            # stop if there hasn't been any clients asking for frames
+            # in the last idle_timeout seconds (or stop was requested)
+            if cls.lifecycle.should_stop():
+                break
+
+
+def mjpeg_stream(camera):
+    """Video streaming generator function.
+
+    Header, frame & trailer are yielded separately so the frame shared by
+    all clients isn't copied into a new bytes object per client.
+    """
+    while True:
+        frame = camera.get_frame()
+        yield FRAME_HEADER
+        yield frame
+        yield FRAME_TRAILER
+
+
+def get_backend(name=None):
+    """Backend named by name or $HOMEPIXEL_CAMERA (default 'pi')."""
+    name = name or os.environ.get(CAMERA_ENV, 'pi')
+    if name == 'pi':
+        return PiCameraBackend()
+    if name == 'fake':
+        return FakeCameraBackend()
+    if name.startswith('fake:'):
+        return FakeCameraBackend.from_directory(name[len('fake:'):])
+    raise ValueError('Unknown camera backend: {}'.format(name))
+
+
+Camera.backend = get_backend()
@@ -26,6 +26,14 @@ READ_URL = 'https://api.thingspeak.com/channels/' + \
 READ_URL_LIMITED = 'https://api.thingspeak.com/channels/' + \
                    '{CHANNEL_FEED}/fields/1.json?results={RESULTS}' +\
                    '&timezone=America%2FNew_York'
+READ_URL_RESULTS = 'https://api.thingspeak.com/channels/' + \
+                   '{CHANNEL_FEED}/feeds.json?api_key=' + \
+                   '{READ_KEY}&results={RESULTS}' + \
+                   '&timezone=America%2FNew_York'
+
+# ThingSpeak read limits
+MAX_RESULTS = 8000
+NO_ENTRY_ID = 0
 
 # LightClapper constants
 SOUND_DETECTED = True
@@ -41,6 +49,8 @@ LIGHT_CLAPPER_NAME = 'lightclapper'
 # LightClapper DB constants
 LIGHT_CLAPPER_DB_FILE = 'lightclapper.db'
 LIGHT_CLAPPER_TABLE = 'LightClapper'
+SYNC_CURSOR_TABLE = 'SyncCursor'
+THINGSPEAK_OUTBOX_DB = 'thingspeak_outbox.db'
 
 # Logging Constants
 LOGGING_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
@@ -49,3 +59,4 @@ LOGGING_TEST_LEVEL = INFO
 
 # Other constants
 GOOD_STATUS = 200
+QUEUED_STATUS = 202  # ThingSpeak bulk update accepted / reading buffered for a batch
@@ -15,7 +15,7 @@ import logging
 from time import sleep
 from led import Led
 from mic import Microphone
-from thingspeakwriter import ThingSpeakWriter
+from thingspeakwriter import ThingSpeakWriter, BatchWriter
 import constants as c
 
 DEFAULT_ID = 0
@@ -40,8 +40,8 @@ class LightClapper:
         The LED light
     __write_mode : bool
         True if write to ThingSpeak channel
-    __writer : ThingSpeakWriter
-        Writer to write to ThingSpeak channel if __write_mode True
+    __writer : BatchWriter
+        Writer batching writes to ThingSpeak channel if __write_mode True
 
     Methods
     -------
@@ -55,7 +55,8 @@ class LightClapper:
     light_clapper_id = DEFAULT_ID   # Class variable (static)
 
     def __init__(self, location, mic=Microphone(), led=Led(),
-                 write=False, write_key=c.L2_M_5C1_WRITE_KEY):
+                 write=False, write_key=c.L2_M_5C1_WRITE_KEY,
+                 channel=c.L2_M_5C1_FEED):
         """
         Initializes the attributes
 
@@ -71,6 +72,8 @@ class LightClapper:
             True if write to ThingSpeak channel
         write_key : str
             Optional key if writing to ThingSpeak channel
+        channel : str
+            ID of ThingSpeak channel (for bulk updates)
         """
         LightClapper.light_clapper_id += ID_INCREMENT
         self.__node_id = '{node}_{id}'.format(
@@ -81,7 +84,7 @@ class LightClapper:
         self.__mic = mic
         self.__led = led
         self.__write_mode = write
-        self.__writer = ThingSpeakWriter(write_key) if write else None
+        self.__writer = BatchWriter(ThingSpeakWriter(write_key, channel)) if write else None
 
     def poll(self):
         """
@@ -118,6 +121,9 @@ class LightClapper:
                 self.__led.invert_status()
                 if self.__write_mode:
                     self.__write_status_to_channel()
+            if self.__write_mode:
+                # Send buffered writes before exiting
+                self.__writer.close()
             GPIO.cleanup()
 
     def check_and_update_status(self):
@@ -148,7 +154,7 @@ class LightClapper:
                   c.LIGHT_STATUS_FIELD: led_status}
 
         status, reason = self.__writer.write_to_channel(fields)
-        if status != c.GOOD_STATUS:
+        if status not in (c.GOOD_STATUS, c.QUEUED_STATUS):
             logging.error('Write to ThingSpeak channel was unsuccessful')
 
 
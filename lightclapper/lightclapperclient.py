@@ -35,22 +35,37 @@ class LightClapperClient:
     ----------
     __reader : ThingSpeakReader
         Reader of ThingSpeak channel
+    __feed : str
+        Feed number for channel
+    __db_file : str
+        file name of sqlite DB file
     __latest_data : dict
         Latest data read from ThingSpeak channel
+    __incremental : bool
+        True if only entries after the stored entry_id are read
+    __last_entry_id : int
+        entry_id of the last entry stored in the DB
+    __next_entry_id : int
+        entry_id of the last entry read, stored on next DB update
 
     Methods
     -------
     poll_channel()
         polls for new data from channel
+    sync_channel()
+        Read new data from channel & add it to DB
     read_from_channel()
         Read & parse data from channel
+    __read_new_from_channel()
+        Read & parse only entries after the last synced entry_id
     __parse_data(feed)
         Parse data for LightClapper fields
     __add_data_from_channel(channel_data)
         Add data from channel if it's not in DB table
     """
 
-    def __init__(self, key=c.L2_M_5C1_READ_KEY, feed=c.L2_M_5C1_FEED):
+    def __init__(self, key=c.L2_M_5C1_READ_KEY, feed=c.L2_M_5C1_FEED,
+                 incremental=False, db_file=c.LIGHT_CLAPPER_DB_FILE):
         """
         Initialize LightClapperClient
 
@@ -60,14 +75,27 @@ class LightClapperClient:
             Read API key
         feed : str
             Feed number for channel
+        incremental : bool
+            True to only read entries after the last synced entry_id
+        db_file : str
+            file name of sqlite DB file
         """
         self.__reader = ThingSpeakReader(key, feed)
+        self.__feed = feed
+        self.__db_file = db_file
         self.__latest_data = None
+        self.__incremental = incremental
+        self.__last_entry_id = c.NO_ENTRY_ID
 
-        with LightClapperDB(db_file=c.LIGHT_CLAPPER_DB_FILE,
+        with LightClapperDB(db_file=self.__db_file,
                             name=c.LIGHT_CLAPPER_TABLE) as db_obj:
-            if not db_obj.table_exists():
-                db_obj.create_table()
+            db_obj.migrate()
+
+            # Resume from the cursor saved by a previous run
+            if self.__incremental:
+                self.__last_entry_id = db_obj.get_last_entry_id(feed)
+
+        self.__next_entry_id = self.__last_entry_id
 
     def poll_channel(self):
         """
@@ -75,14 +103,11 @@ class LightClapperClient:
         If new data found, add to DB
         """
         logging.info('LightClapperClient program running')
+        logging.info('Incremental sync mode enabled?: {}'.format(
+            self.__incremental))
         try:
             while POLLING:
-                channel_data = self.read_from_channel()
-
-                if channel_data:
-                    logging.info('New data parsed from channel')
-                    self.__add_data_from_channel(channel_data)
-
+                self.sync_channel()
                 sleep(POLL_TIME_SECS)
 
         except KeyboardInterrupt:
@@ -92,6 +117,26 @@ class LightClapperClient:
             logging.error('An error or exception occurred!')
             logging.error('Error traceback: {}'.format(e))
 
+    def sync_channel(self):
+        """
+        Read new data from channel and add it to DB
+
+        Returns
+        -------
+        channel_data : list
+            data parsed from channel
+        """
+        channel_data = self.read_from_channel()
+
+        if channel_data:
+            logging.info('New data parsed from channel')
+
+        # Also store the cursor if only unparseable entries were read
+        if channel_data or self.__next_entry_id != self.__last_entry_id:
+            self.__add_data_from_channel(channel_data)
+
+        return channel_data
+
     def read_from_channel(self):
         """
         Parses data read from channel related to the
@@ -102,6 +147,9 @@ class LightClapperClient:
         parsed_data : list
             data parsed from JSON dict read from channel
         """
+        if self.__incremental:
+            return self.__read_new_from_channel()
+
         parsed_data = []
         read_data = self.__reader.read_from_channel()
         feeds = read_data.get('feeds', '')
@@ -128,6 +176,34 @@ class LightClapperClient:
 
         return parsed_data
 
+    def __read_new_from_channel(self):
+        """
+        Parses only the entries added to the channel after the
+        last synced entry_id
+
+        Returns
+        -------
+        parsed_data : list
+            data parsed from JSON dict read from channel
+        """
+        parsed_data = []
+        feeds = self.__reader.read_new_entries(self.__last_entry_id)
+
+        if not feeds:
+            logging.debug('No new data parsed from channel')
+            return parsed_data
+
+        for f in feeds:
+            parse_status, data = self.__parse_data(f)
+            if parse_status:
+                parsed_data.append(data)
+
+        # Cursor is stored with the data in __add_data_from_channel
+        self.__next_entry_id = max(
+            f.get('entry_id', c.NO_ENTRY_ID) for f in feeds)
+
+        return parsed_data
+
     def __parse_data(self, feed):
         """
         Parse data from given feed
@@ -177,24 +253,32 @@ class LightClapperClient:
 
     def __add_data_from_channel(self, channel_data):
         """
-        Compares existing DB table with data read from channel.
-        Add data if not in Table
+        Add data read from channel to DB table in one batch.
+        Data already in Table is skipped
 
         Parameters
         ----------
         channel_data : list
             data read from the channel
         """
-        with LightClapperDB(db_file=c.LIGHT_CLAPPER_DB_FILE,
+        with LightClapperDB(db_file=self.__db_file,
                             name=c.LIGHT_CLAPPER_TABLE) as db_obj:
-            for data in channel_data:
-                if not db_obj.record_exists(data):
-                    db_obj.add_record(data)
+            db_obj.add_records(channel_data)
+
+            if self.__next_entry_id != self.__last_entry_id:
+                db_obj.set_last_entry_id(self.__feed, self.__next_entry_id)
+
+        self.__last_entry_id = self.__next_entry_id
 
 
-def light_clapper_client_test():
+def light_clapper_client_test(incremental):
     """
     Creates a LightClapperClient object for manual verification
+
+    Parameters
+    ----------
+    incremental : bool
+        True to only read entries after the last synced entry_id
     """
     url = c.READ_URL.format(
         CHANNEL_FEED=c.L2_M_5C1_FEED,
@@ -203,7 +287,8 @@ def light_clapper_client_test():
 
     light_clapper_client = LightClapperClient(
         key=c.L2_M_5C1_READ_KEY,
-        feed=c.L2_M_5C1_FEED)
+        feed=c.L2_M_5C1_FEED,
+        incremental=incremental)
     light_clapper_client.poll_channel()
 
 
@@ -225,6 +310,12 @@ def parse_args():
                         action='store_true',
                         help='Print all debug logs')
 
+    parser.add_argument('-i',
+                        '--incremental',
+                        default=False,
+                        action='store_true',
+                        help='Only read entries after last synced entry')
+
     args = parser.parse_args()
     return args
 
@@ -233,4 +324,4 @@ if __name__ == '__main__':
     args = parse_args()
     logging_level = logging.DEBUG if args.verbose else logging.INFO
     logging.basicConfig(format=c.LOGGING_FORMAT, level=logging_level)
-    light_clapper_client_test()
+    light_clapper_client_test(args.incremental)
@@ -0,0 +1,256 @@
+"""
+sqlitepool.py
+
+Notes
+-----
+- Docstrings follow the numpydoc style:
+  https://numpydoc.readthedocs.io/en/latest/format.html
+- Code follows the PEP 8 style guide:
+  https://www.python.org/dev/peps/pep-0008/
+"""
+import sqlite3
+import threading
+import logging
+import os
+from contextlib import contextmanager
+
+# Per-connection tuning (WAL itself is persistent, see enable_wal())
+SYNCHRONOUS = 'NORMAL'
+CACHE_SIZE_KIB = 8000
+MMAP_SIZE_BYTES = 64 * 1024 * 1024
+BUSY_TIMEOUT_SECS = 5
+MAX_IDLE_PER_DB = 4
+WAL_MODE = 'wal'
+
+
+class ConnectionPool:
+    """
+    Pool of long-lived sqlite connections shared by the threads of a
+    process. A connection is used by one thread at a time: it is
+    acquired for a unit of work & released back for the next thread
+
+    Attributes
+    ----------
+    __max_idle : int
+        max idle connections kept per DB file
+    __idle : dict
+        idle connections (with file ID) keyed by DB file path
+    __open : dict
+        DB file path & file ID of connections in use, keyed by id()
+    __lock : Lock
+        guards idle connections & stats
+    __stats : dict
+        hits, misses, stale & discarded connection counts
+
+    Methods
+    -------
+    acquire(db_file)
+        Get a connection to a DB file
+    release(conn)
+        Return a connection to the pool
+    connection(db_file)
+        Context manager to acquire & release a connection
+    get_stats()
+        Get pool hit/miss stats
+    close_all()
+        Close all idle connections
+    """
+
+    def __init__(self, max_idle=MAX_IDLE_PER_DB):
+        """
+        Initialize ConnectionPool
+
+        Parameters
+        ----------
+        max_idle : int
+            max idle connections kept per DB file
+        """
+        self.__max_idle = max_idle
+        self.__idle = {}
+        self.__open = {}
+        self.__lock = threading.Lock()
+        self.__stats = {'hits': 0, 'misses': 0, 'stale': 0, 'discarded': 0}
+
+    def acquire(self, db_file):
+        """
+        Get an idle connection to a DB file, or open a new one.
+        Idle connections to a file since deleted or replaced are closed
+
+        Parameters
+        ----------
+        db_file : str
+            file name of sqlite DB file
+
+        Returns
+        -------
+        conn : Connection
+            sqlite connection object
+        """
+        path = os.path.abspath(db_file)
+        file_id = _file_id(path)
+
+        with self.__lock:
+            idle = self.__idle.get(path, [])
+            while idle:
+                conn, conn_file_id = idle.pop()
+                if conn_file_id == file_id:
+                    self.__stats['hits'] += 1
+                    self.__open[id(conn)] = (path, conn_file_id)
+                    return conn
+
+                self.__stats['stale'] += 1
+                conn.close()
+
+            self.__stats['misses'] += 1
+
+        conn = self.__connect(path)
+        with self.__lock:
+            self.__open[id(conn)] = (path, _file_id(path))
+        return conn
+
+    def release(self, conn):
+        """
+        Return a connection to the pool, closing it if the pool
+        already holds enough idle connections to its DB file
+
+        Parameters
+        ----------
+        conn : Connection
+            sqlite connection object from acquire()
+        """
+        if conn.in_transaction:
+            conn.rollback()
+
+        with self.__lock:
+            path, file_id = self.__open.pop(id(conn), (None, None))
+            if path is not None:
+                idle = self.__idle.setdefault(path, [])
+                if len(idle) < self.__max_idle:
+                    idle.append((conn, file_id))
+                    return
+
+            self.__stats['discarded'] += 1
+        conn.close()
+
+    @contextmanager
+    def connection(self, db_file):
+        """
+        Context manager to acquire & release a connection
+
+        Parameters
+        ----------
+        db_file : str
+            file name of sqlite DB file
+
+        Yields
+        ------
+        conn : Connection
+            sqlite connection object
+        """
+        conn = self.acquire(db_file)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def get_stats(self):
+        """
+        Get pool hit/miss stats
+
+        Returns
+        -------
+        stats : dict
+            hits, misses, stale & discarded connection counts,
+            connections in use & idle
+        """
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats['in_use'] = len(self.__open)
+            stats['idle'] = sum(len(i) for i in self.__idle.values())
+
+        logging.debug('Connection pool stats: {}'.format(stats))
+        return stats
+
+    def close_all(self):
+        """
+        Close all idle connections
+        """
+        with self.__lock:
+            idle, self.__idle = self.__idle, {}
+
+        for connections in idle.values():
+            for conn, _ in connections:
+                conn.close()
+
+    def __connect(self, path):
+        """
+        Open a new tuned connection
+
+        Parameters
+        ----------
+        path : str
+            absolute path of sqlite DB file
+
+        Returns
+        -------
+        conn : Connection
+            sqlite connection object
+        """
+        logging.debug('Opening new connection to {}'.format(path))
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECS,
+                               check_same_thread=False)
+
+        # Set row_factory to access columns by name
+        conn.row_factory = sqlite3.Row
+
+        conn.execute('PRAGMA synchronous = {}'.format(SYNCHRONOUS))
+        conn.execute('PRAGMA cache_size = -{:d}'.format(CACHE_SIZE_KIB))
+        conn.execute('PRAGMA mmap_size = {:d}'.format(MMAP_SIZE_BYTES))
+        return conn
+
+
+def enable_wal(conn):
+    """
+    Helper function:
+    Switch a DB file to write-ahead logging so readers don't block the
+    writer (and vice versa). Persistent, so only needed once per file
+
+    Parameters
+    ----------
+    conn : Connection
+        sqlite connection object (no open transaction)
+
+    Returns
+    -------
+    bool
+        True if DB file is in WAL mode
+    """
+    mode = conn.execute('PRAGMA journal_mode = {}'.format(WAL_MODE))
+    return mode.fetchone()[0] == WAL_MODE
+
+
+def _file_id(path):
+    """
+    Helper function:
+    Identify a DB file so connections to a replaced file are not reused
+
+    Parameters
+    ----------
+    path : str
+        absolute path of sqlite DB file
+
+    Returns
+    -------
+    tuple
+        device & inode of file, None if file does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return stat.st_dev, stat.st_ino
+
+
+# Pool shared by every SqliteDB & the dashboard in this process
+DB_POOL = ConnectionPool()
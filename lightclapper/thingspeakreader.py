@@ -14,6 +14,8 @@ import argparse
 import logging
 import constants as c
 
+CHANNEL_INFO_RESULTS = 0
+
 
 class ThingSpeakReader():
     """
@@ -30,6 +32,8 @@ class ThingSpeakReader():
     -------
     read_from_channel(num_entries)
         Read data from ThingSpeak channel
+    read_new_entries(last_entry_id)
+        Read only the entries added after last_entry_id
     """
 
     def __init__(self, key, feed):
@@ -72,6 +76,64 @@ class ThingSpeakReader():
         fields = requests.get(read_url).json()
         return fields
 
+    def read_new_entries(self, last_entry_id):
+        """
+        Read only the entries added to the channel after last_entry_id.
+        The channel's own last_entry_id is read first (no feeds) so that
+        only the missing entries are requested, rather than the full feed
+
+        Parameters
+        ----------
+        last_entry_id : int
+            entry_id of the last entry already read
+
+        Returns
+        -------
+        feeds : list
+            entries newer than last_entry_id, oldest first
+        """
+        channel = self.__read_results(CHANNEL_INFO_RESULTS).get('channel', {})
+        channel_last_id = channel.get('last_entry_id') or c.NO_ENTRY_ID
+
+        if channel_last_id < last_entry_id:
+            logging.warning('Channel entry IDs went backwards, re-reading')
+            last_entry_id = c.NO_ENTRY_ID
+
+        num_entries = channel_last_id - last_entry_id
+        if num_entries <= 0:
+            return []
+
+        if num_entries > c.MAX_RESULTS:
+            logging.warning('Only the last {} entries can be read'.format(
+                c.MAX_RESULTS))
+            num_entries = c.MAX_RESULTS
+
+        feeds = self.__read_results(num_entries).get('feeds', [])
+        return [f for f in feeds
+                if f.get('entry_id', c.NO_ENTRY_ID) > last_entry_id]
+
+    def __read_results(self, num_entries):
+        """
+        Read the last N entries of all fields in the channel
+
+        Parameters
+        ----------
+        num_entries : int
+            Number of entries to read back (0 for channel info only)
+
+        Returns
+        -------
+        fields : dict
+            channel info and feeds read from ThingSpeak channel
+        """
+        read_url = c.READ_URL_RESULTS.format(
+            CHANNEL_FEED=self.__feed,
+            READ_KEY=self.__key,
+            RESULTS=num_entries)
+
+        fields = requests.get(read_url).json()
+        return fields
+
 
 def read_test(number_of_entries):
     """
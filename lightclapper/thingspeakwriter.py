@@ -11,28 +11,233 @@ Notes
 """
 import http.client
 import urllib
-import random
-import argparse
+import json
 import logging
+import argparse
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from sqlitepool import DB_POOL, enable_wal
 import constants as c
 
+THINGSPEAK_HOST = 'api.thingspeak.com'
+THINGSPEAK_PORT = 80
+TIMEOUT_SECS = 10
+BULK_URL = '/channels/{CHANNEL}/bulk_update.json'
+BATCH_SIZE = 20  # readings flushed at once
+BATCH_AGE_SECS = 60  # oldest reading waits at most this long (unless rate limited)
+UPDATE_INTERVAL_SECS = 15  # ThingSpeak accepts an update (or bulk update) per channel this often
+UPDATE_BURST = 1  # updates allowed back to back after a quiet spell
+MAX_BULK_UPDATES = 960  # ThingSpeak limit of updates per bulk update
+MAX_OUTBOX_ROWS = 10000  # readings kept while offline (about 1MB), oldest dropped beyond it
+RETRY_SECS = 15  # first retry of a failed flush, doubled per failure
+MAX_RETRY_SECS = 600
+
+
+class WriteScheduler():
+    """
+    Token bucket per write API key, shared by all writers of a node (WRITE_SCHEDULER),
+    so requests to a channel are spaced by its update interval instead of being rejected
+
+    Attributes
+    ----------
+    __interval_secs : float
+        Seconds per token (0 for no limit)
+    __burst : int
+        Max tokens saved up
+    __buckets : dict
+        (tokens, time last refilled) keyed by write API key
+    __lock : Lock
+        Guards buckets & stats
+    __stats : dict
+        Slots granted, waits & seconds waited
+
+    Methods
+    -------
+    acquire(key)
+        Waits for a slot
+    get_wait_secs(key)
+        Gets seconds until a slot is free
+    get_stats()
+        Gets slot & wait counts
+    """
+
+    def __init__(self, interval_secs=UPDATE_INTERVAL_SECS, burst=UPDATE_BURST):
+        """
+        Initializes the WriteScheduler
+
+        Parameters
+        ----------
+        interval_secs : float
+            Seconds per token (0 for no limit)
+        burst : int
+            Max tokens saved up
+        """
+        self.__interval_secs = interval_secs
+        self.__burst = burst
+        self.__buckets = {}
+        self.__lock = threading.Lock()
+        self.__stats = {'granted': 0, 'waits': 0, 'wait_secs': 0}
+
+    @property
+    def interval_secs(self):
+        """
+        Seconds per token
+        """
+        return self.__interval_secs
+
+    def acquire(self, key):
+        """
+        Takes a slot, waiting for one if the bucket is empty (slots are reserved in call order)
+
+        Parameters
+        ----------
+        key : str
+            Write API key
+
+        Returns
+        -------
+        float
+            Seconds waited
+        """
+        with self.__lock:
+            wait = self.__wait(key)
+            tokens, refilled = self.__buckets[key]
+            self.__buckets[key] = (tokens - 1, refilled)
+            self.__stats['granted'] += 1
+            if wait > 0:
+                self.__stats['waits'] += 1
+                self.__stats['wait_secs'] += wait
+        if wait > 0:
+            logging.debug('Waiting {:.1f}s for a ThingSpeak update slot'.format(wait))
+            time.sleep(wait)
+        return wait
+
+    def get_wait_secs(self, key):
+        """
+        Gets seconds until a slot is free
+
+        Parameters
+        ----------
+        key : str
+            Write API key
+
+        Returns
+        -------
+        float
+            Seconds to wait, 0 if a slot is free
+        """
+        with self.__lock:
+            return self.__wait(key)
+
+    def get_stats(self):
+        """
+        Gets slot & wait counts
+
+        Returns
+        -------
+        stats : dict
+            Slots granted, waits & seconds waited
+        """
+        with self.__lock:
+            return dict(self.__stats)
+
+    def __wait(self, key):
+        """
+        Refills a bucket & gets seconds until it has a token (called with lock held)
+
+        Parameters
+        ----------
+        key : str
+            Write API key
+
+        Returns
+        -------
+        float
+            Seconds to wait, 0 if a token is free
+        """
+        now = time.monotonic()
+        if self.__interval_secs <= 0:
+            self.__buckets[key] = (self.__burst, now)
+            return 0
+        tokens, refilled = self.__buckets.get(key, (self.__burst, now))
+        tokens = min(self.__burst, tokens + (now - refilled) / self.__interval_secs)
+        self.__buckets[key] = (tokens, now)
+        return max(0, (1 - tokens) * self.__interval_secs)
+
+
+WRITE_SCHEDULER = WriteScheduler()
+
+
+def merge_updates(updates, slot_secs=None):
+    """
+    Merges updates made within slot_secs of the first of a slot into one, later
+    field values winning, so each slot costs one ThingSpeak message
+
+    Parameters
+    ----------
+    updates : list
+        dicts of fields with created_at, oldest first
+    slot_secs : float
+        Length of a slot, None to merge all updates into one
+
+    Returns
+    -------
+    merged : list
+        dicts of fields with created_at of the latest update merged in
+    """
+    merged = []
+    slot_start = None
+    for update in updates:
+        created_at = datetime.fromisoformat(update['created_at']).timestamp()
+        if merged and (slot_secs is None or created_at - slot_start < slot_secs):
+            merged[-1].update(update)
+        else:
+            merged.append(dict(update))
+            slot_start = created_at
+    return merged
+
 
 class ThingSpeakWriter():
     """
-    Class to write to ThingSpeak channel
+    Class to write to ThingSpeak channel over one persistent (keep-alive) connection
 
     Attributes
     ----------
     __key : str
         Write API key
+    __channel : str
+        Channel ID, needed for bulk updates
+    __host : str
+        ThingSpeak host
+    __port : int
+        ThingSpeak port
+    __conn : HTTPConnection
+        Open connection, None until first request or after a failure
+    __scheduler : WriteScheduler
+        Spaces requests by the channel's update interval
+    __lock : Lock
+        One request at a time on the connection
+    __stats : dict
+        Requests & connections opened
 
     Methods
     -------
-    write_to_channel(fields)
+    write(fields)
         Writes data to ThingSpeak channel
+    bulk_write(updates)
+        Writes timestamped updates in one request
+    get_wait_secs()
+        Gets seconds until the scheduler allows a request
+    get_stats()
+        Gets request & connection counts
+    close()
+        Closes the connection
     """
 
-    def __init__(self, key):
+    def __init__(self, key, channel=None, host=THINGSPEAK_HOST, port=THINGSPEAK_PORT, scheduler=None):
         """
         Initializes the ThingSpeakWriter
 
@@ -40,8 +245,37 @@ class ThingSpeakWriter():
         ----------
         key : str
             Write API key
+        channel : str
+            Channel ID, needed for bulk updates
+        host : str
+            ThingSpeak host
+        port : int
+            ThingSpeak port
+        scheduler : WriteScheduler
+            Spaces requests, WRITE_SCHEDULER (shared by the node's writers) if None
         """
         self.__key = key
+        self.__channel = channel
+        self.__host = host
+        self.__port = port
+        self.__conn = None
+        self.__scheduler = scheduler if scheduler is not None else WRITE_SCHEDULER
+        self.__lock = threading.Lock()
+        self.__stats = {'requests': 0, 'connections': 0}
+
+    @property
+    def channel(self):
+        """
+        Channel ID, None if unknown (no bulk updates)
+        """
+        return self.__channel
+
+    @property
+    def slot_secs(self):
+        """
+        Seconds between requests the channel accepts
+        """
+        return self.__scheduler.interval_secs
 
     def write_to_channel(self, fields):
         """
@@ -59,29 +293,532 @@ class ThingSpeakWriter():
         reason : str
             reason for status of write
         """
-        headers = {'Content-typZZe': 'application/x-www-form-urlencoded',
-                   'Accept': 'text/plain'}
         fields['key'] = self.__key
-        status = None
-        reason = None
         params = urllib.parse.urlencode(fields)
+
         logging.debug('Fields to write: {}'.format(fields))
 
-        try:
-            conn = http.client.HTTPConnection('api.thingspeak.com:80')
-            conn.request('POST', '/update', params, headers)
-            response = conn.getresponse()
-            status = response.status
-            reason = response.reason
-            conn.close()
-        except Exception:
-            logging.error("Connection failed!")
-
-        logging.debug('{response_status}, {response_reason}'.format(
-            response_status=status,
-            response_reason=reason))
+        headers = {'Content-Type': 'application/x-www-form-urlencoded',
+                   'Accept': 'text/plain'}
+
+        status, reason = self.__request('/update', params, headers)
+        logging.debug('({}, {})'.format(status, reason))
         return status, reason
 
+    def bulk_write(self, updates):
+        """
+        Writes timestamped updates to the channel in one request (bulk update JSON)
+
+        Parameters
+        ----------
+        updates : list
+            dicts of fields, each with a created_at timestamp
+
+        Returns
+        -------
+        status : int
+            status of write (202 if accepted)
+        reason : str
+            reason for status of write
+        """
+        body = json.dumps({'write_api_key': self.__key, 'updates': updates}, default=str)
+        headers = {'Content-Type': 'application/json',
+                   'Accept': 'application/json'}
+
+        status, reason = self.__request(BULK_URL.format(CHANNEL=self.__channel), body, headers)
+        logging.debug('Bulk write of {} updates: ({}, {})'.format(len(updates), status, reason))
+        return status, reason
+
+    def get_wait_secs(self):
+        """
+        Gets seconds until the scheduler allows a request
+
+        Returns
+        -------
+        float
+            Seconds to wait, 0 if a request may be made now
+        """
+        return self.__scheduler.get_wait_secs(self.__key)
+
+    def get_stats(self):
+        """
+        Gets request & connection counts
+
+        Returns
+        -------
+        stats : dict
+            Requests made & connections opened
+        """
+        with self.__lock:
+            return dict(self.__stats)
+
+    def close(self):
+        """
+        Closes the connection
+        """
+        with self.__lock:
+            if self.__conn is not None:
+                self.__conn.close()
+                self.__conn = None
+
+    def __request(self, url, body, headers):
+        """
+        POSTs on the open connection once the scheduler allows, reconnecting once if the server dropped it
+
+        Parameters
+        ----------
+        url : str
+            Path to POST to
+        body : str
+            Request body
+        headers : dict
+            Request headers
+
+        Returns
+        -------
+        status : int
+            status of response, None if the connection failed
+        reason : str
+            reason of response, None if the connection failed
+        """
+        self.__scheduler.acquire(self.__key)
+        with self.__lock:
+            self.__stats['requests'] += 1
+            for attempt in range(2):
+                reused = self.__conn is not None
+                if not reused:
+                    self.__conn = http.client.HTTPConnection(self.__host, self.__port, timeout=TIMEOUT_SECS)
+                    self.__stats['connections'] += 1
+                try:
+                    self.__conn.request('POST', url, body, headers)
+                    response = self.__conn.getresponse()
+                    response.read()  # must be read before the connection is reused
+                    if response.will_close:
+                        self.__conn.close()
+                        self.__conn = None
+                    return response.status, response.reason
+                except (http.client.HTTPException, OSError) as e:
+                    self.__conn.close()
+                    self.__conn = None
+                    if not reused:
+                        logging.error('Connection failed! {}'.format(e))
+                        return None, None
+                    # idle keep-alive connection was closed by the server: retry on a new one
+        return None, None
+
+
+class Outbox():
+    """
+    Durable first-in first-out queue of readings not yet sent to ThingSpeak, kept
+    in SQLite so readings survive network drops & restarts. Holds at most
+    max_rows readings (bounded disk use), dropping the oldest beyond that
+
+    Attributes
+    ----------
+    __db_file : str
+        sqlite DB file of the outbox
+    __max_rows : int
+        Max readings kept
+    __lock : Lock
+        One change at a time, so the row limit holds
+    __ready : bool
+        True once the table is created (on first use, not at import)
+
+    Methods
+    -------
+    add(update)
+        Appends a reading
+    peek(limit)
+        Gets the oldest readings
+    remove(last_id)
+        Removes readings up to an ID
+    count()
+        Gets number of readings
+    """
+
+    def __init__(self, db_file=c.THINGSPEAK_OUTBOX_DB, max_rows=MAX_OUTBOX_ROWS):
+        """
+        Initializes the Outbox
+
+        Parameters
+        ----------
+        db_file : str
+            sqlite DB file of the outbox
+        max_rows : int
+            Max readings kept
+        """
+        self.__db_file = db_file
+        self.__max_rows = max_rows
+        self.__lock = threading.Lock()
+        self.__ready = False
+
+    def add(self, update):
+        """
+        Appends a reading, dropping the oldest readings beyond max_rows
+
+        Parameters
+        ----------
+        update : dict
+            Fields of reading with created_at
+
+        Returns
+        -------
+        dropped : int
+            Number of old readings dropped
+        """
+        with self.__lock, self.__connection() as conn:
+            conn.execute('INSERT INTO outbox (body) VALUES (?)', (json.dumps(update, default=str),))
+            dropped = conn.execute('DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id DESC LIMIT -1 OFFSET ?)',
+                                   (self.__max_rows,)).rowcount
+            conn.commit()
+        return dropped
+
+    def peek(self, limit):
+        """
+        Gets the oldest readings (left in the outbox until removed)
+
+        Parameters
+        ----------
+        limit : int
+            Max readings
+
+        Returns
+        -------
+        readings : list
+            (id, update) of readings, oldest first
+        """
+        with self.__connection() as conn:
+            rows = conn.execute('SELECT id, body FROM outbox ORDER BY id LIMIT ?', (limit,)).fetchall()
+        return [(row['id'], json.loads(row['body'])) for row in rows]
+
+    def remove(self, last_id):
+        """
+        Removes sent readings
+
+        Parameters
+        ----------
+        last_id : int
+            ID of last reading sent
+        """
+        with self.__lock, self.__connection() as conn:
+            conn.execute('DELETE FROM outbox WHERE id <= ?', (last_id,))
+            conn.commit()
+
+    def count(self):
+        """
+        Gets number of readings
+
+        Returns
+        -------
+        int
+            Readings in the outbox
+        """
+        with self.__connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+    @contextmanager
+    def __connection(self):
+        """
+        Pooled connection to the outbox, creating the table on first use
+
+        Yields
+        ------
+        conn : Connection
+            sqlite connection object
+        """
+        with DB_POOL.connection(self.__db_file) as conn:
+            if not self.__ready:
+                # AUTOINCREMENT: IDs never reused, so they keep readings in order
+                conn.execute('CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, body TEXT NOT NULL)')
+                conn.commit()
+                enable_wal(conn)
+                self.__ready = True
+            yield conn
+
+
+class BatchWriter():
+    """
+    Stores readings in a durable outbox first, and drains it to ThingSpeak from
+    a background thread as bulk updates, once BATCH_SIZE readings are waiting
+    or the oldest is BATCH_AGE_SECS old, in the next slot the writer's
+    WriteScheduler allows. Readings within an update interval of each other are
+    merged into one update (later fields win), so none are rejected by the rate
+    limit. Readings leave the outbox only once accepted, oldest first, so a failed
+    write is retried (with backoff) in order, also after a restart. Without a
+    channel ID all waiting readings are merged into one update. Without merging
+    (event streams, where each reading is its own event) every reading is sent
+    as its own entry, one write each without a channel ID
+
+    Attributes
+    ----------
+    __writer : ThingSpeakWriter
+        Writer flushed to
+    __outbox : Outbox
+        Readings not yet sent
+    __batch_size : int
+        Readings flushed at once
+    __max_age_secs : float
+        Max seconds the oldest reading waits
+    __retry_secs : float
+        Seconds before retrying a failed flush, doubled per failure
+    __max_retry_secs : float
+        Max seconds between retries
+    __merge : bool
+        True if readings of an update slot are merged into one update
+    __pending : int
+        Readings in the outbox, None until the thread starts
+    __first_buffered : float
+        Time oldest waiting reading was stored, None if none
+    __retry_at : float
+        Time failed flush may be retried, None if last flush succeeded
+    __failures : int
+        Flushes failed in a row
+    __changed : Condition
+        Guards state, notified when readings are stored or on close
+    __sending : Lock
+        One flush at a time
+    __closing : bool
+        True once close() is called
+    __thread : Thread
+        Flushing thread, started on first write
+    __stats : dict
+        Readings stored, sent, merged & dropped, batches sent & failed
+
+    Methods
+    -------
+    write_to_channel(fields)
+        Stores a reading in the outbox
+    flush()
+        Sends waiting readings now
+    get_stats()
+        Gets reading & batch counts
+    close()
+        Sends a last batch and stops the thread
+    """
+
+    def __init__(self, writer, outbox=None, batch_size=BATCH_SIZE, max_age_secs=BATCH_AGE_SECS,
+                 retry_secs=RETRY_SECS, max_retry_secs=MAX_RETRY_SECS, merge=True):
+        """
+        Initializes the BatchWriter
+
+        Parameters
+        ----------
+        writer : ThingSpeakWriter
+            Writer flushed to
+        outbox : Outbox
+            Readings not yet sent, Outbox() if None
+        batch_size : int
+            Readings flushed at once
+        max_age_secs : float
+            Max seconds the oldest reading waits
+        retry_secs : float
+            Seconds before retrying a failed flush, doubled per failure
+        max_retry_secs : float
+            Max seconds between retries
+        merge : bool
+            True if readings of an update slot are merged into one update,
+            False to send each reading as its own entry
+        """
+        self.__writer = writer
+        self.__outbox = outbox if outbox is not None else Outbox()
+        self.__batch_size = batch_size
+        self.__max_age_secs = max_age_secs
+        self.__retry_secs = retry_secs
+        self.__max_retry_secs = max_retry_secs
+        self.__merge = merge
+        self.__pending = None
+        self.__first_buffered = None
+        self.__retry_at = None
+        self.__failures = 0
+        self.__changed = threading.Condition()
+        self.__sending = threading.Lock()
+        self.__closing = False
+        self.__thread = None
+        self.__stats = {'buffered': 0, 'sent': 0, 'merged': 0, 'dropped': 0, 'batches': 0, 'failed': 0}
+
+    def write_to_channel(self, fields):
+        """
+        Stores a reading, timestamped now, in the outbox (returns without waiting for the network)
+
+        Parameters
+        ----------
+        fields : dict
+            fields to write to ThingSpeak channel
+
+        Returns
+        -------
+        status : int
+            c.QUEUED_STATUS
+        reason : str
+            'Queued'
+        """
+        update = dict(fields, created_at=datetime.now(timezone.utc).isoformat(timespec='seconds'))
+        with self.__changed:
+            self.__start()
+        dropped = self.__outbox.add(update)
+        with self.__changed:
+            self.__pending += 1 - dropped
+            if self.__first_buffered is None:
+                self.__first_buffered = time.monotonic()
+            self.__stats['buffered'] += 1
+            self.__stats['dropped'] += dropped
+            self.__changed.notify_all()
+        if dropped:
+            logging.warning('ThingSpeak outbox full, dropped {} oldest readings'.format(dropped))
+        return c.QUEUED_STATUS, 'Queued'
+
+    def flush(self):
+        """
+        Sends waiting readings now (in the calling thread), until the outbox is empty or a write fails
+
+        Returns
+        -------
+        bool
+            True if the outbox is empty
+        """
+        while True:
+            sent, empty = self.__send_batch()
+            if not sent or empty:
+                return empty
+
+    def get_stats(self):
+        """
+        Gets reading & batch counts
+
+        Returns
+        -------
+        stats : dict
+            Readings stored, sent, merged (into another update of their slot) & dropped (outbox full),
+            batches sent & failed, readings waiting in the outbox
+        """
+        with self.__changed:
+            pending = self.__pending
+        if pending is None:
+            pending = self.__outbox.count()
+        with self.__changed:
+            return dict(self.__stats, pending=pending)
+
+    def close(self):
+        """
+        Sends a last batch, stops the thread and closes the connection
+        (readings that could not be sent stay in the outbox for the next run)
+        """
+        with self.__changed:
+            self.__closing = True
+            self.__changed.notify_all()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        self.__send_batch()  # waits for at most one slot, a backlog is sent by the next run
+        self.__writer.close()
+
+    def __start(self):
+        """
+        Starts the flushing thread, picking up readings left in the outbox by a previous run (called with lock held)
+        """
+        if self.__pending is not None:
+            return
+        self.__pending = self.__outbox.count()
+        if self.__pending:
+            logging.info('{} ThingSpeak readings left from last run'.format(self.__pending))
+            self.__first_buffered = time.monotonic() - self.__max_age_secs
+        if not self.__closing:
+            self.__thread = threading.Thread(target=self.__work, name='thingspeak-batch', daemon=True)
+            self.__thread.start()
+
+    def __due(self, now):
+        """
+        Gets seconds until waiting readings should be flushed (called with lock held)
+
+        Parameters
+        ----------
+        now : float
+            Current monotonic time
+
+        Returns
+        -------
+        float
+            Seconds to wait (<= 0 if due), None if nothing is waiting
+        """
+        if not self.__pending:
+            return None
+        due = now if self.__pending >= self.__batch_size else self.__first_buffered + self.__max_age_secs
+        due = max(due, now + self.__writer.get_wait_secs())
+        if self.__retry_at is not None:
+            due = max(due, self.__retry_at)
+        return due - now
+
+    def __work(self):
+        """
+        Flushing thread: flushes waiting readings when due, until closed
+        """
+        while True:
+            with self.__changed:
+                wait = self.__due(time.monotonic())
+                if self.__closing:
+                    return
+                if wait is None or wait > 0:
+                    self.__changed.wait(wait)
+                    continue
+            self.__send_batch()
+
+    def __send_batch(self):
+        """
+        Sends the oldest readings, merged per update slot if merging, as one bulk update (or
+        merged into one update without a channel ID, the oldest alone if not merging),
+        removing them from the outbox once accepted
+
+        Returns
+        -------
+        sent : bool
+            True if all readings taken were sent
+        empty : bool
+            True if the outbox is now empty
+        """
+        with self.__sending:
+            with self.__changed:
+                self.__start()
+            batch = self.__outbox.peek(MAX_BULK_UPDATES)
+            if not batch:
+                return True, True
+
+            if self.__writer.channel is None and not self.__merge:
+                batch = batch[:1]  # one write per reading
+            updates = [update for _, update in batch]
+            if self.__writer.channel is not None:
+                if self.__merge:
+                    updates = merge_updates(updates, self.__writer.slot_secs)
+                status, reason = self.__writer.bulk_write(updates)
+                sent = len(batch) if status == c.QUEUED_STATUS else 0
+            else:
+                updates = merge_updates(updates)
+                fields = {name: value for name, value in updates[0].items() if name != 'created_at'}
+                status, reason = self.__writer.write_to_channel(fields)
+                sent = len(batch) if status == c.GOOD_STATUS else 0
+            if sent:
+                self.__outbox.remove(batch[-1][0])
+            pending = self.__outbox.count()
+
+            now = time.monotonic()
+            with self.__changed:
+                self.__pending = pending
+                if sent:
+                    self.__stats['sent'] += sent
+                    self.__stats['merged'] += len(batch) - len(updates)
+                    self.__stats['batches'] += 1
+                    self.__failures = 0
+                    self.__retry_at = None
+                    # any backlog is sent in the next slot
+                    self.__first_buffered = now - self.__max_age_secs if pending else None
+                else:
+                    self.__stats['failed'] += 1
+                    self.__failures += 1
+                    retry_secs = min(self.__max_retry_secs, self.__retry_secs * 2 ** (self.__failures - 1))
+                    self.__retry_at = now + retry_secs
+                    logging.error('Write of {} readings to ThingSpeak failed: ({}, {}), retrying in {}s'.format(
+                        len(batch), status, reason, retry_secs))
+        return sent > 0, pending == 0
+
 
 def write_test(test_data):
     """
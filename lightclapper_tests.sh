@@ -5,3 +5,4 @@ python3 tests/test_lightclapper.py -v
 python3 tests/test_lightclapperclient.py -v
 python3 tests/test_lightclapperdb.py -v
 python3 tests/test_lightclapperthingspeak.py -v
+python3 tests/test_lightclapperthingspeakbatch.py -v
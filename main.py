@@ -1,47 +1,147 @@
 # import required modules
-from flask import Flask, render_template, url_for, redirect, Response, request
-import sqlite3
+from flask import Flask, render_template, url_for, redirect, Response, request, jsonify, abort
 import os
 from random import randint
-from camera_pi import Camera
+from camera_pi import Camera, MAX_FPS, MJPEG_MIMETYPE, mjpeg_stream
 from securitysystem.pantilt import PanTilt
+from securitysystem.servocontroller import ServoController
+from securitysystem.patrol import PresetStore, PatrolScheduler, PATROL_DB
 from lightclapper.constants import ON_INT
+from lightclapper.sqlitepool import DB_POOL
 import math
 
 app = Flask(__name__)
 
 app.config['SECRET_KEY'] = '5791628bb0b13ce0c676dfde280ba245'
+app.config['ROWS_PER_PAGE'] = 100
 
-# Global variables definition and initialization
-global panServoAngle
-global tiltServoAngle
-panServoAngle = 90
-tiltServoAngle = 90
-
-#start up pantilt servos
+#start up pantilt servos, steered by a background thread so requests don't wait for them
+SERVO_STEP_DEGREES = 10
+PATROL_PAUSE_SECS = 3600
 servo_control = PanTilt()
 servo_control.start_servo()
-servo_control.change_pan_angle(panServoAngle)
-servo_control.change_tilt_angle(tiltServoAngle)
+servo_controller = ServoController(servo_control, initial_angle=90)
+servo_controller.start()
+
+#patrol through saved presets (paused by the SecuritySystem node while it records)
+preset_store = PresetStore(os.path.join('securitysystem', PATROL_DB))
+patrol = PatrolScheduler(servo_controller, preset_store)
+patrol.start()
 
 # RUN ALL THREE NODE_CLIENTS to create three local databases 
 # ALL info should be updated on the tables of all pages
 
+# Dashboard table paging (default page size is app.config['ROWS_PER_PAGE'])
+MAX_ROWS_PER_PAGE = 1000
+SS_COLUMNS = ('date', 'time', 'location', 'nodeID')
+LP_COLUMNS = ('date', 'time', 'location', 'nodeID', 'lightStatus')
+TS_COLUMNS = ('date', 'time', 'location', 'nodeID', 'fanStatus', 'tempVal')
+
 #methods to access all databases
+#connections are pooled & reused across requests (use as: with get_xx_db_connection() as conn)
 def get_ss_db_connection():
-    conn = sqlite3.connect('securitysystem/securitysystem.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return DB_POOL.connection('securitysystem/securitysystem.db')
 
 def get_lp_db_connection():
-    conn = sqlite3.connect('lightclapper/lightclapper.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return DB_POOL.connection('lightclapper/lightclapper.db')
 
 def get_ts_db_connection():
-    conn = sqlite3.connect('tempsensor/tempsensor.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return DB_POOL.connection('tempsensor/tempsensor.db')
+
+#tables known to have the timestamp column (added by the node DB migration, never removed)
+timestamped_tables = set()
+
+def get_timestamp_column(conn, table):
+    """
+    SQL for a table's timestamp: the column once the node client has migrated
+    the DB, else NULL (records then ordered by rowid alone, like untimestamped ones).
+    """
+    key = (conn.execute('PRAGMA database_list').fetchone()[2], table)
+    if key not in timestamped_tables:
+        if 'timestamp' not in [column[1] for column in conn.execute('PRAGMA table_info({})'.format(table))]:
+            return 'NULL'
+        timestamped_tables.add(key)
+    return 'timestamp'
+
+#aggregation queries, so pages don't pull every row into python
+def get_light_summary(conn):
+    """Per location: sum of LED on & latest LED status (newest timestamp, then rowid)."""
+    return conn.execute(
+        'WITH ranked AS ('
+        '  SELECT location, lightStatus, row_number() OVER ('
+        '    PARTITION BY location ORDER BY {} DESC, rowid DESC) AS recency'
+        '  FROM lightclapper) '
+        'SELECT location, sum(lightStatus) AS activity, '
+        '  max(CASE WHEN recency = 1 THEN lightStatus END) AS latestStatus '
+        'FROM ranked GROUP BY location ORDER BY location'.format(
+            get_timestamp_column(conn, 'lightclapper'))).fetchall()
+
+def get_temperature_summary(conn):
+    """Per location: latest temperature & fan status (newest timestamp, then rowid)."""
+    return conn.execute(
+        'SELECT location, tempVal, fanStatus FROM ('
+        '  SELECT location, tempVal, fanStatus, row_number() OVER ('
+        '    PARTITION BY location ORDER BY {} DESC, rowid DESC) AS recency'
+        '  FROM tempsensor) '
+        'WHERE recency = 1 ORDER BY location'.format(
+            get_timestamp_column(conn, 'tempsensor'))).fetchall()
+
+def get_rows_page(conn, table, columns, cursor=None, per_page=None):
+    """
+    One page of records newest first, keyset paged on (timestamp, rowid) so every
+    page is an index seek however deep. Records without a timestamp come last
+    (all of them, in rowid order, until the node client migrates an old DB).
+    """
+    per_page = per_page or app.config['ROWS_PER_PAGE']
+    timestamp = get_timestamp_column(conn, table)
+    select = 'SELECT rowid, {0} AS timestamp, {1} FROM {2} '.format(timestamp, ', '.join(columns), table)
+    order = ' ORDER BY {0} DESC, rowid DESC LIMIT ?'.format(timestamp)
+
+    if cursor is None:
+        return conn.execute(select + order, (per_page,)).fetchall()
+
+    after_timestamp, rowid = cursor
+    if after_timestamp is None:
+        return conn.execute(select + 'WHERE {} IS NULL AND rowid < ?'.format(timestamp) + order,
+                            (rowid, per_page)).fetchall()
+
+    rows = conn.execute(select + 'WHERE ({}, rowid) < (?, ?)'.format(timestamp) + order,
+                        (after_timestamp, rowid, per_page)).fetchall()
+    if len(rows) < per_page:
+        rows += conn.execute(select + 'WHERE {} IS NULL'.format(timestamp) + order,
+                             (per_page - len(rows),)).fetchall()
+    return rows
+
+def get_next_cursor(rows, per_page=None):
+    """Cursor ('timestamp_rowid') after the last row of a full page, else None."""
+    if len(rows) < (per_page or app.config['ROWS_PER_PAGE']):
+        return None
+    timestamp = rows[-1]['timestamp']
+    return '{}_{}'.format('' if timestamp is None else timestamp, rows[-1]['rowid'])
+
+def get_page_args():
+    """Cursor & clamped page size from the query string (?cursor=...&per_page=M)."""
+    per_page = request.args.get('per_page', app.config['ROWS_PER_PAGE'], type=int)
+    per_page = min(max(per_page, 1), MAX_ROWS_PER_PAGE)
+
+    cursor = request.args.get('cursor')
+    if not cursor:
+        return None, per_page
+    try:
+        timestamp, _, rowid = cursor.partition('_')
+        return (int(timestamp) if timestamp else None, int(rowid)), per_page
+    except ValueError:
+        abort(400)
+
+def rows_page_response(get_db_connection, table, columns):
+    """JSON page of records, newest first, with the cursor of the next page."""
+    cursor, per_page = get_page_args()
+
+    with get_db_connection() as conn:
+        rows = get_rows_page(conn, table, columns, cursor, per_page)
+
+    return jsonify(rows=[dict(row) for row in rows],
+                   next_cursor=get_next_cursor(rows, per_page))
 
 @app.route("/")
 def index():
@@ -55,147 +155,189 @@ def about():
 
 # *************************************************************************************************
 
+def get_servo_template_data():
+    targets = servo_controller.get_targets()
+    return {'panServoAngle': targets['pan'], 'tiltServoAngle': targets['tilt']}
+
 @app.route("/security")
 def security():
-    templateData = {
-      'panServoAngle'	: panServoAngle,
-      'tiltServoAngle'	: tiltServoAngle
-	}
+    templateData = get_servo_template_data()
 
-    conn = get_ss_db_connection()
-    rows = conn.execute('SELECT * FROM securitysystem').fetchall()
-    conn.close()
+    with get_ss_db_connection() as conn:
+        rows = get_rows_page(conn, 'securitysystem', SS_COLUMNS)
 
-    return render_template("security.html", title='SecuritySystem', rows=rows, **templateData)
+    return render_template("security.html", title='SecuritySystem', rows=rows,
+        next_cursor=get_next_cursor(rows), **templateData)
 
+@app.route("/security/rows")
+def security_rows():
+    """JSON page of security records (lazily loaded by the analytics table)."""
+    return rows_page_response(get_ss_db_connection, 'securitysystem', SS_COLUMNS)
 
-def gen(camera):
-   """Video streaming generator function."""
-   while True:
-        frame = camera.get_frame()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
 
 @app.route("/video_feed")
 def video_feed():
-   """Video streaming route. Put this in the src attribute of an img tag."""
-   return Response(gen(Camera()),
-                   mimetype='multipart/x-mixed-replace; boundary=frame')
+   """Video streaming route. Put this in the src attribute of an img tag.
+
+   Each client blocks until the camera publishes a new frame, capped at
+   ?fps=N frames per second (0 for no cap).
+   """
+   max_fps = request.args.get('fps', MAX_FPS, type=int)
+   return Response(mjpeg_stream(Camera(max_fps=max(max_fps, 0))),
+                   mimetype=MJPEG_MIMETYPE)
+
+@app.route("/video_stats")
+def video_stats():
+   """Capture thread warm-up latency, frame rate & restarts."""
+   return jsonify(Camera.lifecycle.get_metrics())
 
 @app.route("/<servo>/<angle>")
 def move(servo, angle):
-	global panServoAngle
-	global tiltServoAngle
-	if servo == 'pan':
-		if angle == '+':
-			panServoAngle = panServoAngle + 10
-		else:
-			panServoAngle = panServoAngle - 10
-		servo_control.change_pan_angle(panServoAngle)
-	if servo == 'tilt':
-		if angle == '+':
-			tiltServoAngle = tiltServoAngle + 10
-		else:
-			tiltServoAngle = tiltServoAngle - 10
-		servo_control.change_tilt_angle(tiltServoAngle)
-
-	templateData = {
-      'panServoAngle'	: panServoAngle,
-      'tiltServoAngle'	: tiltServoAngle
-	}
+	"""Queue a pan/tilt move of 10 degrees and return right away.
+
+	Rapid clicks add up and are coalesced by the servo controller; JSON
+	requests (the dashboard buttons) get the new target angle.
+	"""
+	if servo not in ('pan', 'tilt') or angle not in ('+', '-'):
+		abort(404)
+	target = servo_controller.move_by(servo, SERVO_STEP_DEGREES if angle == '+' else -SERVO_STEP_DEGREES)
+
+	if request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json':
+		return jsonify({'servo': servo, 'angle': target})
+
+	templateData = get_servo_template_data()
 
 	return render_template('security.html', **templateData)
 
+@app.route("/servo_stats")
+def servo_stats():
+	"""Servo positions, targets & coalesced command counts."""
+	return jsonify(dict(servo_controller.get_stats(),
+		targets=servo_controller.get_targets(), positions=servo_controller.get_positions()))
+
+@app.route("/presets")
+def presets():
+	"""Saved presets in patrol order."""
+	return jsonify(presets=preset_store.get_presets())
+
+@app.route("/presets/<name>", methods=['GET', 'POST', 'DELETE'])
+def preset(name):
+	"""Move to a preset (GET, pauses patrol), save the current angles as one
+	(POST, optional ?dwell=secs) or delete it (DELETE).
+	"""
+	if request.method == 'POST':
+		targets = servo_controller.get_targets()
+		return jsonify(preset_store.save_preset(name, targets['pan'], targets['tilt'],
+			request.args.get('dwell', type=float)))
+	if request.method == 'DELETE':
+		if not preset_store.delete_preset(name):
+			abort(404)
+		return jsonify(deleted=name)
+
+	moved_to = patrol.goto_preset(name)
+	if moved_to is None:
+		abort(404)
+	return jsonify(moved_to)
+
+@app.route("/patrol/<action>", methods=['POST'])
+def patrol_action(action):
+	"""Pause (?secs=N, default an hour) or resume the patrol."""
+	if action == 'pause':
+		patrol.pause(request.args.get('secs', PATROL_PAUSE_SECS, type=float))
+	elif action == 'resume':
+		patrol.resume()
+	else:
+		abort(404)
+	return jsonify(patrol.get_stats())
+
+@app.route("/patrol_stats")
+def patrol_stats():
+	"""Patrol moves, pauses & current preset."""
+	return jsonify(patrol.get_stats())
+
 # *************************************************************************************************
 
 @app.route("/light")
 def light():
     # Intialize data for graph
-    data = {}
     activity = []
     current_status = []
     labels = []
     colors = []
 
-    conn = get_lp_db_connection()
-    rows = conn.execute('SELECT * FROM lightclapper').fetchall()
-    conn.close()
-
-    # Iterate to check for new locations
-    for row in rows:
-        location = row['location']
-        status = row['lightStatus']
-        if location not in data.keys():
-            # tuple: (sum of LED on, latest LED status)
-            data[location] = (0, status)
-        data[location] = (data[location][0] + status, status)
+    with get_lp_db_connection() as conn:
+        summary = get_light_summary(conn)
+        rows = get_rows_page(conn, 'lightclapper', LP_COLUMNS)
 
     # Iterate for colors and lists
     # Note: random colors for dynamic color assignment (scalability)
-    for location, v in data.items():
+    for row in summary:
         R = randint(0, 255)
         G = randint(0, 255)
         B = randint(0, 255)
         colors.append("rgb({r},{g},{b})".format(r=R,g=G,b=B))
 
-        sum_of_activity = v[0]
-        latest_status = v[1]
-
         # Hover color for ON (yellow) / OFF (grey)
-        if latest_status == ON_INT:
+        if row['latestStatus'] == ON_INT:
             current_status.append("rgb(255,255,0)")
         else:
             current_status.append("rgb(128,128,128)")
 
-        labels.append(location)
-        activity.append(sum_of_activity)
+        labels.append(row['location'])
+        activity.append(row['activity'])
 
     return render_template("light.html", title='LightClapper', rows=rows,
-        lightData=activity, colorData=colors, lightLabels=labels, status=current_status)
+        next_cursor=get_next_cursor(rows), lightData=activity, colorData=colors, lightLabels=labels, status=current_status)
+
+@app.route("/light/rows")
+def light_rows():
+    """JSON page of light records (lazily loaded by the analytics table)."""
+    return rows_page_response(get_lp_db_connection, 'lightclapper', LP_COLUMNS)
 
 # *************************************************************************************************
 
 @app.route("/temperature")
 def temperature():
-    data = {}
     labels = []
     current_status = []
     tempValues = []
     colors = []
 
-    conn = get_ts_db_connection()
-    rows = conn.execute('SELECT * FROM tempsensor').fetchall()
-    conn.close()
-
-    # Iterate to check for new locations
-    for row in rows:
-        location = row['location']
-        status = row['fanStatus']
-        temperature = round(row['tempVal'],2)
-        if location not in data.keys():
-            # tuple: (temperature, latest fan status)
-            data[location] = (0, status)
-        data[location] = (temperature, status)
+    with get_ts_db_connection() as conn:
+        summary = get_temperature_summary(conn)
+        rows = get_rows_page(conn, 'tempsensor', TS_COLUMNS)
 
     # Iterate for colors and lists
-    for k, v in data.items():
+    for row in summary:
         R = randint(0, 255)
         G = randint(0, 255)
         B = randint(0, 255)
         colors.append("rgb({r},{g},{b})".format(r=R,g=G,b=B))
 
-        labels.append(k)
-        tempValues.append(v[0])
-        latest_status = v[1]
+        labels.append(row['location'])
+        tempValues.append(round(row['tempVal'],2))
 
         # Hover color for ON (yellow) / OFF (grey)
-        if latest_status == ON_INT:
+        if row['fanStatus'] == ON_INT:
             current_status.append("rgb(255,255,0)")
         else:
             current_status.append("rgb(128,128,128)")
 
-    return render_template("temperature.html", title='TempSensor', rows=rows, 
-        tempValues=tempValues, colorData=colors, tempLabels=labels, status=current_status)
+    return render_template("temperature.html", title='TempSensor', rows=rows,
+        next_cursor=get_next_cursor(rows), tempValues=tempValues, colorData=colors,
+        tempLabels=labels, status=current_status)
+
+@app.route("/temperature/rows")
+def temperature_rows():
+    """JSON page of temperature records (lazily loaded by the analytics table)."""
+    return rows_page_response(get_ts_db_connection, 'tempsensor', TS_COLUMNS)
+
+# *************************************************************************************************
+
+@app.route("/db_stats")
+def db_stats():
+    """DB connection pool hit/miss stats."""
+    return jsonify(DB_POOL.get_stats())
 
 # *************************************************************************************************
 
@@ -5,12 +5,221 @@ Performs actions on camera module (actuator)
 """
 
 import logging
-from picamera import PiCamera
+import os
+import threading
+import time as timer
 from time import sleep
 from datetime import datetime
 import constants as c
 
+try:
+    from picamera import PiCamera
+except ImportError:
+    # Off-device only the fake camera is available
+    PiCamera = None
+
 CAMERA_RECORD_TIME_SECS = 10
+VIDEO_PATH = '/home/pi/Desktop/Security_Cam/{}_{}.h264'
+
+# Pre-motion recording: H.264 kept in a circular in-memory buffer (bounded in bytes to fit Pi RAM)
+PRE_MOTION_SECS = 0  # 0 to record only after motion
+CIRCULAR_BUFFER_BYTES = 32 * 1024 * 1024  # ~15s at the default bitrate
+
+# Camera backend: 'pi' (default) or 'fake' (no hardware, for tests & benchmarks)
+CAMERA_ENV = 'HOMEPIXEL_CAMERA'
+FAKE_BITRATE = 17000000  # picamera's default H.264 bitrate
+BITS_PER_BYTE = 8
+RECORD_SPLITTER_PORT = 1  # picamera's default port, used for video
+DETECT_SPLITTER_PORT = 2  # resized unencoded frames for motion detection
+shared_camera = None  # created by make_camera()
+
+class FakePiCamera:
+    """
+    Stand-in for the PiCamera methods Camera uses, recording synthetic data
+    Attributes
+    ----------
+    rotation : int
+        Rotation of the (fake) image
+    recording : bool
+        True while recording
+    __outputs : dict
+        Output, format & start time of current recordings, keyed by splitter port
+    Methods
+    -------
+    start_preview()
+        Starts (fake) preview
+    stop_preview()
+        Stops (fake) preview
+    start_recording(output, format=None, splitter_port=1, **options)
+        Starts recording to a file name or file-like object
+    wait_recording(timeout=0)
+        Waits while recording
+    stop_recording(splitter_port=1)
+        Writes FAKE_BITRATE worth of data for the time recorded
+    close()
+        Closes the camera
+    """
+    def __init__(self):
+        """
+        Initializes the FakePiCamera
+        """
+        self.rotation = 0
+        self.recording = False
+        self.__outputs = {}
+
+    def start_preview(self):
+        """
+        Starts (fake) preview
+        """
+        logging.debug('Fake camera preview started')
+
+    def stop_preview(self):
+        """
+        Stops (fake) preview
+        """
+        logging.debug('Fake camera preview stopped')
+
+    def start_recording(self, output, format=None, splitter_port=RECORD_SPLITTER_PORT, **options):
+        """
+        Starts recording
+        Parameters
+        ----------
+        output : str or file
+            File name or file-like object to record to
+        format : str
+            'yuv' records no frames, anything else synthetic H.264 data
+        splitter_port : int
+            Port recorded on
+        options : dict
+            Ignored (resize etc.)
+        """
+        self.__outputs[splitter_port] = (output, format, timer.time())
+        self.recording = True
+
+    def wait_recording(self, timeout=0):
+        """
+        Waits while recording
+        Parameters
+        ----------
+        timeout : float
+            Seconds to wait
+        """
+        sleep(timeout)
+
+    def stop_recording(self, splitter_port=RECORD_SPLITTER_PORT):
+        """
+        Stops recording, writing synthetic data for the time recorded
+        Parameters
+        ----------
+        splitter_port : int
+            Port recorded on
+        """
+        output, format, start = self.__outputs.pop(splitter_port)
+        self.recording = bool(self.__outputs)
+        if format == 'yuv':
+            return
+        size = int((timer.time() - start) * FAKE_BITRATE / BITS_PER_BYTE)
+        if isinstance(output, str):
+            with open(output, 'wb') as f:
+                f.write(bytes(size))
+        else:
+            output.write(bytes(size))
+
+    def close(self):
+        """
+        Closes the camera
+        """
+        self.recording = False
+
+class FakeCircularIO:
+    """
+    Stand-in for picamera.PiCameraCircularIO used with FakePiCamera
+    Attributes
+    ----------
+    size : int
+        Max bytes buffered
+    __start : float
+        Time buffering started
+    Methods
+    -------
+    write(data)
+        Ignores data written by FakePiCamera
+    copy_to(output, seconds)
+        Writes synthetic data for the last seconds buffered
+    """
+    def __init__(self, size):
+        """
+        Initializes the FakeCircularIO
+        Parameters
+        ----------
+        size : int
+            Max bytes buffered
+        """
+        self.size = size
+        self.__start = timer.time()
+
+    def write(self, data):
+        """
+        Ignores data written by FakePiCamera (copy_to generates it)
+        Parameters
+        ----------
+        data : bytes
+            Data recorded
+        """
+        return len(data)
+
+    def copy_to(self, output, seconds):
+        """
+        Writes synthetic data for the last seconds buffered
+        Parameters
+        ----------
+        output : str
+            File name to write to
+        seconds : float
+            Seconds of video to copy
+        """
+        buffered = timer.time() - self.__start
+        size = min(int(min(seconds, buffered) * FAKE_BITRATE / BITS_PER_BYTE), self.size)
+        with open(output, 'wb') as f:
+            f.write(bytes(size))
+
+def make_circular_stream(camera, size):
+    """
+    Creates a circular in-memory video buffer for the camera
+    Parameters
+    ----------
+    camera : PiCamera or FakePiCamera
+        The camera
+    size : int
+        Max bytes buffered
+    Returns
+    -------
+    PiCameraCircularIO or FakeCircularIO
+        The buffer
+    """
+    if isinstance(camera, FakePiCamera):
+        return FakeCircularIO(size)
+    from picamera import PiCameraCircularIO
+    return PiCameraCircularIO(camera, size=size)
+
+def make_camera():
+    """
+    Gets the camera selected by $HOMEPIXEL_CAMERA, created once and shared
+    (the camera module can only be opened once per process)
+    Returns
+    -------
+    PiCamera or FakePiCamera
+        The camera
+    """
+    global shared_camera
+    if shared_camera is None:
+        if os.environ.get(CAMERA_ENV, 'pi').startswith('fake'):
+            shared_camera = FakePiCamera()
+        elif PiCamera is None:
+            raise RuntimeError('picamera not installed, use {}=fake'.format(CAMERA_ENV))
+        else:
+            shared_camera = PiCamera()
+    return shared_camera
 
 class Camera:
     """
@@ -19,24 +228,63 @@ class Camera:
     ----------
     __camera : Camera
         The camera
+    __pre_motion_secs : float
+        Seconds before motion saved from the circular buffer, 0 if not buffering
+    __post_motion_secs : float
+        Seconds after motion recorded
+    __buffer_bytes : int
+        Max bytes in circular buffer
+    __stream : PiCameraCircularIO
+        Circular buffer recorded into continuously, None if not buffering
+    __pending : dict
+        Event set once each clip is saved, keyed by (date, time)
+    __timers : list
+        Timers saving clips once post-motion seconds are recorded
+    __detecting : bool
+        True while frames are sent to a motion detector
     Methods
     -------
     start_camera()
-        Starts preview of camera
+        Starts preview of camera (and recording into buffer)
+    start_motion_detection(output)
+        Sends small unencoded frames to a motion detector
     record_video(date, time)
         Records video
+    wait_for_video(date, time, timeout=None)
+        Waits until a video is saved to disk
     close_camera()
         Stops preview of camera
     """
-    def __init__(self, camera=PiCamera()):
+    def __init__(self, camera=None, pre_motion_secs=PRE_MOTION_SECS, post_motion_secs=CAMERA_RECORD_TIME_SECS,
+                 buffer_bytes=CIRCULAR_BUFFER_BYTES):
         """
         Initializes the Camera
         Parameters
         ----------
-        camera : PiCamera()
-            The picamera class
+        camera : PiCamera or FakePiCamera
+            The camera, make_camera() if None
+        pre_motion_secs : float
+            Seconds before motion to save, 0 to record only after motion
+        post_motion_secs : float
+            Seconds after motion to record
+        buffer_bytes : int
+            Max bytes in circular buffer (bounds RAM use, and so pre-motion seconds kept)
+        """
+        self.__camera = camera if camera is not None else make_camera()
+        self.__pre_motion_secs = pre_motion_secs
+        self.__post_motion_secs = post_motion_secs
+        self.__buffer_bytes = buffer_bytes
+        self.__stream = None
+        self.__pending = {}
+        self.__timers = []
+        self.__detecting = False
+
+    @property
+    def post_motion_secs(self):
+        """
+        Seconds recorded after motion, so the camera must stay still this long after record_video
         """
-        self.__camera = camera
+        return self.__post_motion_secs
 
     def start_camera(self):
         """
@@ -46,9 +294,33 @@ class Camera:
         self.__camera.start_preview() 
         self.__camera.rotation = 180
 
+        if self.__pre_motion_secs:
+            needed = (self.__pre_motion_secs + self.__post_motion_secs) * FAKE_BITRATE / BITS_PER_BYTE
+            if needed > self.__buffer_bytes:
+                logging.warning('Buffer of {} bytes may hold less than {}s of video'.format(
+                    self.__buffer_bytes, self.__pre_motion_secs + self.__post_motion_secs))
+            logging.info('Recording into circular buffer')
+            self.__stream = make_circular_stream(self.__camera, self.__buffer_bytes)
+            self.__camera.start_recording(self.__stream, format='h264')
+
+    def start_motion_detection(self, output):
+        """
+        Sends YUV frames resized to output.resolution to a motion detector, on a second
+        splitter port so recording continues alongside (call after start_camera)
+        Parameters
+        ----------
+        output : FrameMotionOutput
+            Output passing frames to the detector
+        """
+        self.__camera.start_recording(output, format='yuv', resize=output.resolution,
+                                      splitter_port=DETECT_SPLITTER_PORT)
+        self.__detecting = True
+
     def record_video(self, date, time):
         """
         Records a video for 10s
+        With a circular buffer, returns right away: the pre-motion seconds plus the
+        following post-motion seconds are saved in the background (see wait_for_video)
         Parameters
         ----------
         date : str
@@ -56,17 +328,74 @@ class Camera:
         time : str
             Time of motion detected
         """
-        logging.info('Start Recording')
-        self.__camera.start_recording('/home/pi/Desktop/Security_Cam/{}_{}.h264'.format(date, time))
-        sleep(CAMERA_RECORD_TIME_SECS)
-        self.__camera.stop_recording()
-        logging.info('Stop Recording')
+        path = VIDEO_PATH.format(date, time)
+        if self.__stream is None:
+            logging.info('Start Recording')
+            self.__camera.start_recording(path)
+            sleep(self.__post_motion_secs)
+            self.__camera.stop_recording()
+            logging.info('Stop Recording')
+            return
 
+        saved = threading.Event()
+        self.__pending[(date, time)] = saved
+        save = threading.Timer(self.__post_motion_secs, self.__save_clip, args=(path, saved))
+        save.daemon = True
+        save.start()
+        self.__timers = [t for t in self.__timers if t.is_alive()] + [save]
+
+    def wait_for_video(self, date, time, timeout=None):
+        """
+        Waits until a video is saved to disk (returns right away without a circular buffer)
+        Parameters
+        ----------
+        date : str
+            Date of motion detected
+        time : str
+            Time of motion detected
+        timeout : float
+            Max seconds to wait, None to wait until saved
+        Returns
+        -------
+        bool
+            True if saved
+        """
+        saved = self.__pending.pop((date, time), None)
+        return saved.wait(timeout) if saved else True
+
+    def __save_clip(self, path, saved):
+        """
+        Saves the last pre & post motion seconds from the circular buffer
+        Parameters
+        ----------
+        path : str
+            File name of video
+        saved : Event
+            Set once saved
+        """
+        try:
+            self.__stream.copy_to(path, seconds=self.__pre_motion_secs + self.__post_motion_secs)
+            logging.info('Saved {}'.format(path))
+        except BaseException as e:
+            logging.error('Could not save {}: {}'.format(path, e))
+        finally:
+            saved.set()
 
     def close_camera(self):
         """
         Stops preview of camera 
+        Saves clips still being recorded into the circular buffer first
         """
+        for save in self.__timers:
+            save.join()
+        self.__timers = []
+        if self.__stream is not None:
+            self.__camera.stop_recording()
+            self.__stream = None
+        if self.__detecting:
+            self.__camera.stop_recording(splitter_port=DETECT_SPLITTER_PORT)
+            self.__detecting = False
+
         logging.info('Close Camera Preview')
         self.__camera.stop_preview()  
 
@@ -46,6 +46,8 @@ GMAIL_PASSWORD = 'homepixel3010'
 # SecuritySystem DB constants
 SECURITY_SYSTEM_DB = 'securitysystem.db'
 SECURITY_SYSTEM_NAME = 'SecuritySystem'
+UPLOAD_QUEUE_DB = 'uploads.db'
+THINGSPEAK_OUTBOX_DB = 'thingspeak_outbox.db'
 
 # Logging Constants
 LOGGING_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
@@ -57,4 +59,5 @@ MOTION_DETECTED = True
 MOTION_NOT_DETECTED = False
 
 # Other constants
-GOOD_STATUS = 200
\ No newline at end of file
+GOOD_STATUS = 200
+QUEUED_STATUS = 202  # ThingSpeak bulk update accepted / reading buffered for a batch
\ No newline at end of file
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+"""
+Detects motion in camera frames by background subtraction on small grayscale
+frames, as an alternative (or addition) to the PIR sensor
+"""
+
+import logging
+import threading
+import time
+import numpy as np
+
+#Magic numbers (constants)
+DETECT_RESOLUTION = (128, 96)  # (width, height) frames are resized to by the camera
+EVERY_NTH_FRAME = 3  # bounds CPU: 10 frames/s processed at 30fps
+PIXEL_THRESHOLD = 25  # grey levels a pixel must differ from background to count as changed
+MIN_CHANGED_FRACTION = 0.01  # fraction of (unmasked) pixels changed for motion
+BACKGROUND_ALPHA = 0.05  # how fast the background adapts (lighting changes)
+QUIET_FRAMES = 5  # processed frames without change before motion ends
+YUV_WIDTH_ALIGN = 32  # picamera pads YUV rows & columns
+YUV_HEIGHT_ALIGN = 16
+
+def make_roi_mask(resolution, regions, exclude=False):
+    """
+    Makes a region of interest mask from rectangles
+    Parameters
+    ----------
+    resolution : tuple
+        (width, height) of frames
+    regions : list
+        (x, y, width, height) rectangles as fractions of the frame (0 to 1)
+    exclude : bool
+        True to ignore the rectangles (e.g. a tree or street) instead of watching only them
+    Returns
+    -------
+    mask : ndarray
+        Boolean (height, width) array, True where motion counts
+    """
+    width, height = resolution
+    mask = np.zeros((height, width), dtype=bool)
+    for x, y, w, h in regions:
+        mask[int(y * height):int(round((y + h) * height)), int(x * width):int(round((x + w) * width))] = True
+    return ~mask if exclude else mask
+
+class FrameMotionDetector:
+    """
+    Background subtraction motion detector with gpiozero MotionSensor style callbacks
+    (so it can stand in for, or be combined with, the PIR sensor)
+    Attributes
+    ----------
+    when_motion : function
+        Called when motion starts
+    when_no_motion : function
+        Called when motion ends
+    motion_detected : bool
+        True while motion is detected
+    __resolution : tuple
+        (width, height) of frames
+    __every_nth : int
+        Only every nth frame is processed
+    __threshold : int
+        Grey levels a pixel must differ by to count as changed
+    __min_changed : int
+        Changed (unmasked) pixels needed for motion
+    __alpha : float
+        Background learning rate
+    __quiet_frames : int
+        Processed frames without change before motion ends
+    __mask : ndarray
+        Region of interest, None for the whole frame
+    __background : ndarray
+        Running average of frames (float32), None until first frame
+    __diff : ndarray
+        Preallocated float32 buffer
+    __changed : ndarray
+        Preallocated bool buffer
+    __quiet : int
+        Processed frames since last change
+    __lock : Lock
+        Guards stats
+    __stats : dict
+        Frames seen & processed, frames with change, processing seconds
+    Methods
+    -------
+    process(frame)
+        Processes a grayscale frame (if it is an nth frame)
+    get_stats()
+        Gets frame counts & processing time
+    """
+    def __init__(self, resolution=DETECT_RESOLUTION, every_nth=EVERY_NTH_FRAME, threshold=PIXEL_THRESHOLD,
+                 min_changed_fraction=MIN_CHANGED_FRACTION, alpha=BACKGROUND_ALPHA, quiet_frames=QUIET_FRAMES, mask=None):
+        """
+        Initializes the FrameMotionDetector
+        Parameters
+        ----------
+        resolution : tuple
+            (width, height) of frames
+        every_nth : int
+            Only every nth frame is processed
+        threshold : int
+            Grey levels a pixel must differ from background by to count as changed
+        min_changed_fraction : float
+            Fraction of (unmasked) pixels changed for motion
+        alpha : float
+            Background learning rate (0 to 1)
+        quiet_frames : int
+            Processed frames without change before motion ends
+        mask : ndarray
+            Region of interest from make_roi_mask(), None for the whole frame
+        """
+        self.when_motion = None
+        self.when_no_motion = None
+        self.motion_detected = False
+        self.__resolution = resolution
+        self.__every_nth = max(1, every_nth)
+        self.__threshold = threshold
+        self.__alpha = alpha
+        self.__quiet_frames = quiet_frames
+        self.__mask = mask
+        pixels = mask.sum() if mask is not None else resolution[0] * resolution[1]
+        self.__min_changed = max(1, int(pixels * min_changed_fraction))
+        self.__background = None
+        self.__diff = np.empty((resolution[1], resolution[0]), dtype=np.float32)
+        self.__changed = np.empty((resolution[1], resolution[0]), dtype=bool)
+        self.__quiet = 0
+        self.__lock = threading.Lock()
+        self.__stats = {'frames': 0, 'processed': 0, 'changed': 0, 'process_secs': 0}
+
+    def process(self, frame):
+        """
+        Processes a grayscale frame if it is an nth frame, calling when_motion/when_no_motion on changes
+        Parameters
+        ----------
+        frame : ndarray
+            (height, width) uint8 frame
+        Returns
+        -------
+        bool
+            True while motion is detected
+        """
+        self.__stats['frames'] += 1
+        if (self.__stats['frames'] - 1) % self.__every_nth:
+            return self.motion_detected
+
+        start = time.process_time()
+        if self.__background is None:
+            self.__background = frame.astype(np.float32)
+            changed = 0
+        else:
+            np.subtract(frame, self.__background, out=self.__diff)
+            np.abs(self.__diff, out=self.__diff)
+            np.greater(self.__diff, self.__threshold, out=self.__changed)
+            if self.__mask is not None:
+                self.__changed &= self.__mask
+            changed = np.count_nonzero(self.__changed)
+            # background += alpha * (frame - background), reusing the buffer
+            np.subtract(frame, self.__background, out=self.__diff)
+            self.__diff *= self.__alpha
+            self.__background += self.__diff
+
+        with self.__lock:
+            self.__stats['processed'] += 1
+            self.__stats['process_secs'] += time.process_time() - start
+            if changed >= self.__min_changed:
+                self.__stats['changed'] += 1
+
+        if changed >= self.__min_changed:
+            self.__quiet = 0
+            if not self.motion_detected:
+                self.motion_detected = True
+                logging.debug('Frame motion started ({} pixels changed)'.format(changed))
+                if self.when_motion is not None:
+                    self.when_motion()
+        elif self.motion_detected:
+            self.__quiet += 1
+            if self.__quiet >= self.__quiet_frames:
+                self.motion_detected = False
+                logging.debug('Frame motion ended')
+                if self.when_no_motion is not None:
+                    self.when_no_motion()
+        return self.motion_detected
+
+    def get_stats(self):
+        """
+        Gets frame counts & processing time
+        Returns
+        -------
+        stats : dict
+            Frames seen & processed, frames with change, total & mean milliseconds processing
+        """
+        with self.__lock:
+            stats = dict(self.__stats)
+        stats['mean_process_ms'] = stats['process_secs'] * 1000 / stats['processed'] if stats['processed'] else 0
+        return stats
+
+class FrameMotionOutput:
+    """
+    picamera custom output for unencoded YUV frames (one frame per write),
+    passing the Y (luminance) plane to the detector as a grayscale frame
+    Attributes
+    ----------
+    resolution : tuple
+        (width, height) frames are resized to
+    __detector : FrameMotionDetector
+        The detector
+    __padded : tuple
+        (width, height) of Y plane including picamera's padding
+    Methods
+    -------
+    write(buf)
+        Processes a frame
+    flush()
+        Nothing buffered
+    """
+    def __init__(self, detector, resolution=DETECT_RESOLUTION):
+        """
+        Initializes the FrameMotionOutput
+        Parameters
+        ----------
+        detector : FrameMotionDetector
+            The detector
+        resolution : tuple
+            (width, height) frames are resized to, same as the detector's
+        """
+        self.resolution = resolution
+        self.__detector = detector
+        width, height = resolution
+        self.__padded = (-(-width // YUV_WIDTH_ALIGN) * YUV_WIDTH_ALIGN, -(-height // YUV_HEIGHT_ALIGN) * YUV_HEIGHT_ALIGN)
+
+    def write(self, buf):
+        """
+        Processes a YUV420 frame (no copy: the Y plane is viewed in place)
+        Parameters
+        ----------
+        buf : bytes
+            YUV420 frame
+        Returns
+        -------
+        int
+            Bytes written
+        """
+        width, height = self.resolution
+        padded_width, padded_height = self.__padded
+        y = np.frombuffer(buf, dtype=np.uint8, count=padded_width * padded_height)
+        self.__detector.process(y.reshape(padded_height, padded_width)[:height, :width])
+        return len(buf)
+
+    def flush(self):
+        """
+        Nothing buffered
+        """
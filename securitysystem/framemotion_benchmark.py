@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks FrameMotionDetector on synthetic YUV frames: a noisy static scene
+with a square moving across it for the middle third of the frames. Reports
+CPU per processed frame, CPU % at the camera frame rate, and how many moving
+& static frames were reported as motion (static frames include the quiet
+frames motion is held for after the square stops)
+"""
+
+import argparse
+import logging
+import time
+import numpy as np
+from framemotion import FrameMotionDetector, FrameMotionOutput, DETECT_RESOLUTION, EVERY_NTH_FRAME, YUV_WIDTH_ALIGN, YUV_HEIGHT_ALIGN
+import constants as c
+
+#Magic numbers (constants)
+DEFAULT_FPS = 30
+DEFAULT_FRAMES = 900
+DEFAULT_EVERY_NTH = [1, 2, 3, 5]
+NOISE_LEVELS = 6  # +/- grey levels of sensor noise
+SQUARE_FRACTION = 0.2  # side of moving square as fraction of frame height
+SQUARE_LEVEL = 200
+SEED = 3010
+
+def make_frames(resolution, count):
+    """
+    Makes synthetic YUV420 frames (padded like picamera's)
+    Parameters
+    ----------
+    resolution : tuple
+        (width, height) of frames
+    count : int
+        Number of frames
+    Returns
+    -------
+    frames : list
+        YUV420 frames (bytes)
+    moving : list
+        True for frames with the moving square
+    """
+    width, height = resolution
+    padded_width = -(-width // YUV_WIDTH_ALIGN) * YUV_WIDTH_ALIGN
+    padded_height = -(-height // YUV_HEIGHT_ALIGN) * YUV_HEIGHT_ALIGN
+    rng = np.random.default_rng(SEED)
+    scene = rng.integers(40, 160, (height, width)).astype(np.int16)
+    side = int(height * SQUARE_FRACTION)
+    chroma = bytes(padded_width * padded_height // 2)
+
+    frames = []
+    moving = []
+    for i in range(count):
+        frame = scene + rng.integers(-NOISE_LEVELS, NOISE_LEVELS + 1, (height, width))
+        in_motion = count // 3 <= i < 2 * count // 3
+        if in_motion:
+            x = (i - count // 3) * (width - side) // (count // 3)
+            y = (height - side) // 2
+            frame[y:y + side, x:x + side] = SQUARE_LEVEL
+        y_plane = np.zeros((padded_height, padded_width), dtype=np.uint8)
+        y_plane[:height, :width] = np.clip(frame, 0, 255)
+        frames.append(y_plane.tobytes() + chroma)
+        moving.append(in_motion)
+    return frames, moving
+
+def benchmark(frames, moving, resolution, every_nth, fps):
+    """
+    Runs the detector over frames
+    Parameters
+    ----------
+    frames : list
+        YUV420 frames
+    moving : list
+        True for frames with motion
+    resolution : tuple
+        (width, height) of frames
+    every_nth : int
+        Only every nth frame is processed
+    fps : int
+        Camera frame rate
+    Returns
+    -------
+    result : dict
+        every_nth, ms per processed frame, CPU %, fraction of moving/static frames reported as motion
+    """
+    detector = FrameMotionDetector(resolution=resolution, every_nth=every_nth)
+    output = FrameMotionOutput(detector, resolution=resolution)
+    detected = []
+    start = time.process_time()
+    for frame in frames:
+        output.write(frame)
+        detected.append(detector.motion_detected)
+    cpu = time.process_time() - start
+
+    stats = detector.get_stats()
+    moving_frames = sum(moving)
+    static_frames = len(moving) - moving_frames
+    return {'every_nth': every_nth,
+            'ms_per_frame': stats['mean_process_ms'],
+            'cpu_pct': cpu / (len(frames) / fps) * 100,
+            'detected_pct': sum(d for d, m in zip(detected, moving) if m) / moving_frames * 100,
+            'false_pct': sum(d for d, m in zip(detected, moving) if not m) / static_frames * 100}
+
+def parse_args():
+    """
+    Parses arguments of benchmark
+    Returns
+    -------
+    args : Namespace
+        Populated attributes based on args
+    """
+    parser = argparse.ArgumentParser(description='Benchmark frame differencing motion detection on synthetic frames')
+    parser.add_argument('-n', '--every-nth', type=int, nargs='+', default=DEFAULT_EVERY_NTH, help='Frame skips to run')
+    parser.add_argument('-r', '--resolution', type=int, nargs=2, default=DETECT_RESOLUTION, metavar=('<width>', '<height>'),
+                        help='Detection resolution')
+    parser.add_argument('-f', '--fps', type=int, default=DEFAULT_FPS, help='Camera frame rate')
+    parser.add_argument('--frames', type=int, default=DEFAULT_FRAMES, help='Frames per run')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    logging.basicConfig(format=c.LOGGING_FORMAT, level=c.LOGGING_TEST_LEVEL)
+    args = parse_args()
+    resolution = tuple(args.resolution)
+    frames, moving = make_frames(resolution, args.frames)
+
+    print('{}x{} frames at {}fps (default every nth: {})'.format(resolution[0], resolution[1], args.fps, EVERY_NTH_FRAME))
+    print('{:>9} {:>12} {:>7} {:>11} {:>9}'.format('every nth', 'ms/processed', 'cpu %', 'detected %', 'false %'))
+    for every_nth in args.every_nth:
+        result = benchmark(frames, moving, resolution, every_nth, args.fps)
+        print('{every_nth:>9} {ms_per_frame:>12.3f} {cpu_pct:>7.2f} {detected_pct:>11.1f} {false_pct:>9.1f}'.format(**result))
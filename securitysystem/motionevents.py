@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+
+"""
+Event-driven motion detection: sensor callbacks are debounced into motion
+events read from a queue, instead of polling the sensor, and sensors can be
+combined
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+#Magic numbers (constants)
+HOLD_OFF_SECS = 0.3  # motion must last this long to count
+COOLDOWN_SECS = 10  # ignore motion this long after an event (length of a recording)
+MERGE_SECS = 5  # motion this soon after the last motion of an event is part of it
+CLOSED = None  # queue sentinel ending iteration
+
+MotionEvent = namedtuple('MotionEvent', ['date', 'time', 'timestamp'])
+
+class MotionEventSource:
+    """
+    Turns when_motion/when_no_motion callbacks of a sensor into debounced motion
+    events: motion shorter than the hold-off is ignored, motion during the cooldown
+    after an event is dropped, and motion within the merge window of the last motion
+    of an event (with no gap longer than it) extends that event
+    Attributes
+    ----------
+    __sensor : MotionSensor
+        gpiozero sensor (or any object with when_motion/when_no_motion)
+    __hold_off_secs : float
+        Seconds motion must last to count
+    __cooldown_secs : float
+        Seconds motion is ignored after an event
+    __merge_secs : float
+        Max seconds between motion merged into one event
+    __events : Queue
+        Events not yet read
+    __lock : Lock
+        Guards state & stats
+    __timer : Timer
+        Pending hold-off check, None if none
+    __last_event : float
+        Time of last event, None if none
+    __last_motion : float
+        Time motion was last seen (counting into the last event), None if none
+    __in_event : bool
+        True if the motion last held counted into the last event (not dropped in the cooldown)
+    __closed : bool
+        True once closed
+    __stats : dict
+        Triggers, events, glitches (shorter than hold-off), merged & cooldown counts
+    Methods
+    -------
+    get(timeout=None)
+        Waits for the next event
+    close()
+        Detaches from the sensor (and the sensors a CombinedSensor combines) and ends iteration
+    get_stats()
+        Gets trigger & event counts
+    """
+    def __init__(self, sensor, hold_off_secs=HOLD_OFF_SECS, cooldown_secs=COOLDOWN_SECS, merge_secs=MERGE_SECS):
+        """
+        Initializes the MotionEventSource and attaches to the sensor's callbacks
+        Parameters
+        ----------
+        sensor : MotionSensor
+            gpiozero sensor (or any object with when_motion/when_no_motion)
+        hold_off_secs : float
+            Seconds motion must last to count
+        cooldown_secs : float
+            Seconds motion is ignored after an event
+        merge_secs : float
+            Max seconds between motion merged into one event
+        """
+        self.__sensor = sensor
+        self.__hold_off_secs = hold_off_secs
+        self.__cooldown_secs = cooldown_secs
+        self.__merge_secs = merge_secs
+        self.__events = queue.Queue()
+        self.__lock = threading.Lock()
+        self.__timer = None
+        self.__last_event = None
+        self.__last_motion = None
+        self.__in_event = False
+        self.__closed = False
+        self.__stats = {'triggers': 0, 'events': 0, 'glitches': 0, 'merged': 0, 'cooldown': 0}
+
+        sensor.when_motion = self.__motion
+        sensor.when_no_motion = self.__no_motion
+
+    def __iter__(self):
+        """
+        Iterates over events until closed
+        Yields
+        ------
+        event : MotionEvent
+            date, time & timestamp motion started
+        """
+        while True:
+            event = self.__events.get()
+            if event is CLOSED:
+                self.__events.put(CLOSED)  # for other readers
+                return
+            yield event
+
+    async def __aiter__(self):
+        """
+        Asynchronously iterates over events until closed (waiting in an executor thread)
+        Yields
+        ------
+        event : MotionEvent
+            date, time & timestamp motion started
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            event = await loop.run_in_executor(None, self.get)
+            if event is CLOSED:
+                return
+            yield event
+
+    def get(self, timeout=None):
+        """
+        Waits for the next event
+        Parameters
+        ----------
+        timeout : float
+            Max seconds to wait, None for no limit
+        Returns
+        -------
+        event : MotionEvent
+            date, time & timestamp motion started, None if closed or timed out
+        """
+        try:
+            event = self.__events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if event is CLOSED:
+            self.__events.put(CLOSED)
+        return event
+
+    def close(self):
+        """
+        Detaches from the sensor (and the sensors a CombinedSensor combines) and ends iteration
+        """
+        with self.__lock:
+            self.__closed = True
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+        self.__sensor.when_motion = None
+        self.__sensor.when_no_motion = None
+        if isinstance(self.__sensor, CombinedSensor):
+            self.__sensor.close()  # so the PIR & frame detector stop calling it
+        self.__events.put(CLOSED)
+
+    def get_stats(self):
+        """
+        Gets trigger & event counts
+        Returns
+        -------
+        stats : dict
+            Triggers, events, glitches (shorter than hold-off), merged & cooldown counts
+        """
+        with self.__lock:
+            return dict(self.__stats)
+
+    def __motion(self):
+        """
+        Sensor callback: motion started, counts once held for the hold-off
+        """
+        with self.__lock:
+            if self.__closed:
+                return
+            self.__stats['triggers'] += 1
+            if self.__hold_off_secs <= 0:
+                self.__held(time.time())
+                return
+            if self.__timer is None:
+                self.__timer = threading.Timer(self.__hold_off_secs, self.__hold_off_passed, args=(time.time(),))
+                self.__timer.daemon = True
+                self.__timer.start()
+
+    def __no_motion(self):
+        """
+        Sensor callback: motion stopped, a pending hold-off is a glitch
+        """
+        with self.__lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+                self.__stats['glitches'] += 1
+            elif self.__in_event:
+                self.__last_motion = time.time()  # merge window runs from the end of motion
+
+    def __hold_off_passed(self, started):
+        """
+        Timer callback: motion held for the hold-off
+        Parameters
+        ----------
+        started : float
+            Time motion started
+        """
+        with self.__lock:
+            if self.__timer is not threading.current_thread() or self.__closed:
+                return  # cancelled while waiting for the lock
+            self.__timer = None
+            self.__held(started)
+
+    def __held(self, started):
+        """
+        Motion counts: merges it into the last event, drops it in the cooldown
+        or queues a new event (called with lock held)
+        Parameters
+        ----------
+        started : float
+            Time motion started
+        """
+        if self.__last_motion is not None and started - self.__last_motion <= self.__merge_secs:
+            self.__last_motion = started
+            self.__in_event = True
+            self.__stats['merged'] += 1
+            return
+        if self.__last_event is not None and started - self.__last_event < self.__cooldown_secs:
+            self.__in_event = False  # its end must not extend the ended event
+            self.__stats['cooldown'] += 1
+            return
+
+        self.__last_event = self.__last_motion = started
+        self.__in_event = True
+        self.__stats['events'] += 1
+        now = datetime.fromtimestamp(started)
+        event = MotionEvent(now.strftime("%Y-%m-%d"), now.strftime("%H:%M:%S"), started)
+        logging.debug("Motion Detected at {}".format(event.time))
+        self.__events.put(event)
+
+class CombinedSensor:
+    """
+    Combines sensors with when_motion/when_no_motion callbacks (PIR, frame
+    differencing) into one: motion while any (or all) of them detect motion
+    Attributes
+    ----------
+    when_motion : function
+        Called when combined motion starts
+    when_no_motion : function
+        Called when combined motion ends
+    __sensors : list
+        The sensors
+    __require_all : bool
+        True if all sensors must detect motion (fewer false alarms), False for any
+    __active : set
+        Indices of sensors detecting motion
+    __lock : Lock
+        Guards active sensors
+    Methods
+    -------
+    close()
+        Detaches from the sensors
+    """
+    def __init__(self, sensors, require_all=False):
+        """
+        Initializes the CombinedSensor and attaches to the sensors' callbacks
+        Parameters
+        ----------
+        sensors : list
+            Sensors with when_motion/when_no_motion
+        require_all : bool
+            True if all sensors must detect motion, False for any
+        """
+        self.when_motion = None
+        self.when_no_motion = None
+        self.__sensors = sensors
+        self.__require_all = require_all
+        self.__active = set()
+        self.__lock = threading.Lock()
+        for i, sensor in enumerate(sensors):
+            sensor.when_motion = lambda i=i: self.__update(i, True)
+            sensor.when_no_motion = lambda i=i: self.__update(i, False)
+
+    def close(self):
+        """
+        Detaches from the sensors
+        """
+        for sensor in self.__sensors:
+            sensor.when_motion = None
+            sensor.when_no_motion = None
+
+    def __detected(self):
+        """
+        Gets whether the combined sensor detects motion (called with lock held)
+        Returns
+        -------
+        bool
+            True if any (or all) sensors detect motion
+        """
+        if self.__require_all:
+            return len(self.__active) == len(self.__sensors)
+        return bool(self.__active)
+
+    def __update(self, index, active):
+        """
+        Sensor callback: calls when_motion/when_no_motion if the combined state changes
+        Parameters
+        ----------
+        index : int
+            Index of sensor
+        active : bool
+            True if sensor detects motion
+        """
+        with self.__lock:
+            before = self.__detected()
+            if active:
+                self.__active.add(index)
+            else:
+                self.__active.discard(index)
+            after = self.__detected()
+        callback = self.when_motion if after and not before else self.when_no_motion if before and not after else None
+        if callback is not None:
+            callback()
@@ -6,13 +6,12 @@ Record motion detected by PIR motion sensor
 
 import logging
 from gpiozero import MotionSensor
-from time import sleep
 from datetime import datetime
+from motionevents import MotionEventSource, CombinedSensor, HOLD_OFF_SECS, COOLDOWN_SECS, MERGE_SECS
 import constants as c
 
 MOTION_INPUT = 23
-MOTION_POLL_TIME_SECS = 3.5
-POLLING = True
+MOTION_SOURCES = ('pir', 'camera', 'any', 'all')  # PIR only, frames only, either, both
 
 class MotionSensorClass:
     """
@@ -25,6 +24,8 @@ class MotionSensorClass:
     -------
     check_input()
         Checks if motion sensor detects input
+    events(hold_off_secs, cooldown_secs, merge_secs, frame_detector=None, source='pir')
+        Gets debounced motion events from sensor (and frame detector) callbacks
     close_sensor()
         Turns off output to sensor
     """
@@ -56,6 +57,37 @@ class MotionSensorClass:
         
         return c.MOTION_NOT_DETECTED, dateNow, timeNow
 
+    def events(self, hold_off_secs=HOLD_OFF_SECS, cooldown_secs=COOLDOWN_SECS, merge_secs=MERGE_SECS,
+               frame_detector=None, source='pir'):
+        """
+        Gets debounced motion events from sensor callbacks (no polling)
+        Parameters
+        ----------
+        hold_off_secs : float
+            Seconds motion must last to count
+        cooldown_secs : float
+            Seconds motion is ignored after an event
+        merge_secs : float
+            Max seconds between motion merged into one event
+        frame_detector : FrameMotionDetector
+            Camera frame motion detector, needed unless source is 'pir'
+        source : str
+            'pir', 'camera', 'any' (either detects motion) or 'all' (both detect motion)
+        Returns
+        -------
+        MotionEventSource
+            Iterable of MotionEvent (date, time, timestamp), close() to stop
+        """
+        if source not in MOTION_SOURCES:
+            raise ValueError('Unknown motion source: {}'.format(source))
+        if source == 'pir':
+            sensor = self.__mts
+        elif source == 'camera':
+            sensor = frame_detector
+        else:
+            sensor = CombinedSensor([self.__mts, frame_detector], require_all=source == 'all')
+        return MotionEventSource(sensor, hold_off_secs, cooldown_secs, merge_secs)
+
     def close_sensor(self):
         """
         Ignores output to sensor 
@@ -66,18 +98,20 @@ def motionsensor_test():
     """
     Creates a MotionSensorClass object for manual verification
     """
+    mts = MotionSensorClass()
+    events = None
     try:
-        mts = MotionSensorClass()
-        while POLLING:
-            result = mts.check_input()
-            if(result[0]):
-                # Sleep before checking for motion again
-                sleep(MOTION_POLL_TIME_SECS)
+        events = mts.events()
+        for event in events:
+            logging.info('Motion event at {} {}'.format(event.date, event.time))
     except KeyboardInterrupt:
         logging.info('Exiting')
     except BaseException as e:
         logging.error('An error or exception occurred: ' + str(e))
     finally:
+        if events is not None:
+            logging.info('Motion stats: {}'.format(events.get_stats()))
+            events.close()
         mts.close_sensor()
 
 if __name__ == '__main__':
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+
+"""
+Wraps a raw H.264 (Annex B) stream, as recorded by picamera, into an MP4 file
+in-process: NAL units are read in chunks and written straight into the mdat box,
+then the moov box indexing them is written at the end
+"""
+
+import logging
+import struct
+
+READ_BYTES = 1024 * 1024
+DEFAULT_FPS = 30  # picamera's default framerate
+TIMESCALE = 90000  # media timescale (ticks per second)
+MOVIE_TIMESCALE = 1000
+MAX_BOX_BYTES = 2 ** 32 - 1  # 32 bit box sizes & chunk offsets
+START_CODE = b'\x00\x00\x01'
+NAL_LENGTH_BYTES = 4
+
+# NAL unit types
+NAL_SLICE = 1
+NAL_IDR_SLICE = 5
+NAL_SEI = 6
+NAL_SPS = 7
+NAL_PPS = 8
+NAL_AUD = 9
+VCL_TYPES = range(NAL_SLICE, NAL_IDR_SLICE + 1)
+# Types starting a new access unit when they follow a VCL NAL unit (H.264 7.4.1.2.3)
+AU_START_TYPES = (NAL_SEI, NAL_SPS, NAL_PPS, NAL_AUD, 14, 15, 16, 17, 18)
+# Types kept in samples (parameter sets go in the avcC box instead)
+SAMPLE_TYPES = (NAL_SLICE, 2, 3, 4, NAL_IDR_SLICE, NAL_SEI)
+
+# Profiles whose SPS (and avcC) carry chroma format & bit depth
+HIGH_PROFILES = (100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135)
+AVCC_HIGH_PROFILES = (100, 110, 122, 144)
+IDENTITY_MATRIX = (0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+LANGUAGE_UND = 0x55C4
+
+class BitReader:
+    """
+    Reads bits & Exp-Golomb codes from an RBSP
+    Attributes
+    ----------
+    __data : bytes
+        RBSP (emulation prevention bytes removed)
+    __pos : int
+        Bit position
+    Methods
+    -------
+    read_bits(n)
+        Reads n bits as an unsigned int
+    read_ue()
+        Reads an unsigned Exp-Golomb code
+    read_se()
+        Reads a signed Exp-Golomb code
+    """
+    def __init__(self, data):
+        """
+        Initializes the BitReader
+        Parameters
+        ----------
+        data : bytes
+            RBSP to read
+        """
+        self.__data = data
+        self.__pos = 0
+
+    def read_bits(self, n):
+        """
+        Reads n bits as an unsigned int
+        Parameters
+        ----------
+        n : int
+            Number of bits
+        Returns
+        -------
+        value : int
+            The bits read
+        """
+        value = 0
+        for _ in range(n):
+            byte = self.__data[self.__pos // 8]
+            value = (value << 1) | ((byte >> (7 - self.__pos % 8)) & 1)
+            self.__pos += 1
+        return value
+
+    def read_ue(self):
+        """
+        Reads an unsigned Exp-Golomb code
+        Returns
+        -------
+        int
+            The value read
+        """
+        zeros = 0
+        while not self.read_bits(1):
+            zeros += 1
+        return (1 << zeros) - 1 + self.read_bits(zeros)
+
+    def read_se(self):
+        """
+        Reads a signed Exp-Golomb code
+        Returns
+        -------
+        int
+            The value read
+        """
+        code = self.read_ue()
+        return (code + 1) // 2 if code % 2 else -(code // 2)
+
+def parse_sps(sps):
+    """
+    Parses the fields of an SPS NAL unit needed to describe the video
+    Parameters
+    ----------
+    sps : bytes
+        SPS NAL unit (with its header byte)
+    Returns
+    -------
+    dict
+        profile, width, height, chroma_format_idc, bit_depth_luma, bit_depth_chroma
+    """
+    bits = BitReader(sps[1:].replace(b'\x00\x00\x03', b'\x00\x00'))
+    profile = bits.read_bits(8)
+    bits.read_bits(16)  # constraint flags & level
+    bits.read_ue()  # seq_parameter_set_id
+
+    chroma_format_idc = 1
+    separate_colour_plane = 0
+    bit_depth_luma = bit_depth_chroma = 8
+    if profile in HIGH_PROFILES:
+        chroma_format_idc = bits.read_ue()
+        if chroma_format_idc == 3:
+            separate_colour_plane = bits.read_bits(1)
+        bit_depth_luma = bits.read_ue() + 8
+        bit_depth_chroma = bits.read_ue() + 8
+        bits.read_bits(1)  # qpprime_y_zero_transform_bypass_flag
+        if bits.read_bits(1):  # seq_scaling_matrix_present_flag
+            for i in range(8 if chroma_format_idc != 3 else 12):
+                if bits.read_bits(1):
+                    _skip_scaling_list(bits, 16 if i < 6 else 64)
+
+    bits.read_ue()  # log2_max_frame_num_minus4
+    pic_order_cnt_type = bits.read_ue()
+    if pic_order_cnt_type == 0:
+        bits.read_ue()  # log2_max_pic_order_cnt_lsb_minus4
+    elif pic_order_cnt_type == 1:
+        bits.read_bits(1)  # delta_pic_order_always_zero_flag
+        bits.read_se()  # offset_for_non_ref_pic
+        bits.read_se()  # offset_for_top_to_bottom_field
+        for _ in range(bits.read_ue()):
+            bits.read_se()  # offset_for_ref_frame
+    bits.read_ue()  # max_num_ref_frames
+    bits.read_bits(1)  # gaps_in_frame_num_value_allowed_flag
+    width_mbs = bits.read_ue() + 1
+    height_map_units = bits.read_ue() + 1
+    frame_mbs_only = bits.read_bits(1)
+    if not frame_mbs_only:
+        bits.read_bits(1)  # mb_adaptive_frame_field_flag
+    bits.read_bits(1)  # direct_8x8_inference_flag
+
+    crop_left = crop_right = crop_top = crop_bottom = 0
+    if bits.read_bits(1):  # frame_cropping_flag
+        crop_left, crop_right, crop_top, crop_bottom = (bits.read_ue() for _ in range(4))
+
+    # Crop units depend on chroma subsampling (H.264 7.4.2.1.1)
+    chroma_array_type = 0 if separate_colour_plane else chroma_format_idc
+    sub_width = 2 if chroma_array_type in (1, 2) else 1
+    sub_height = 2 if chroma_array_type == 1 else 1
+    crop_unit_x = sub_width if chroma_array_type else 1
+    crop_unit_y = (2 - frame_mbs_only) * (sub_height if chroma_array_type else 1)
+
+    return {'profile': profile,
+            'width': width_mbs * 16 - crop_unit_x * (crop_left + crop_right),
+            'height': (2 - frame_mbs_only) * height_map_units * 16 - crop_unit_y * (crop_top + crop_bottom),
+            'chroma_format_idc': chroma_format_idc,
+            'bit_depth_luma': bit_depth_luma,
+            'bit_depth_chroma': bit_depth_chroma}
+
+def _skip_scaling_list(bits, size):
+    """
+    Skips a scaling list in an SPS
+    Parameters
+    ----------
+    bits : BitReader
+        Reader positioned at the scaling list
+    size : int
+        Number of coefficients
+    """
+    last_scale = next_scale = 8
+    for _ in range(size):
+        if next_scale:
+            next_scale = (last_scale + bits.read_se()) % 256
+        last_scale = next_scale or last_scale
+
+def iter_nal_units(stream):
+    """
+    Splits an Annex B byte stream into NAL units, reading it in chunks
+    Parameters
+    ----------
+    stream : file
+        Binary file-like object
+    Yields
+    ------
+    nal : bytes
+        NAL unit without start code
+    """
+    buffer = b''
+    while True:
+        chunk = stream.read(READ_BYTES)
+        buffer += chunk
+        pos = buffer.find(START_CODE)
+        if pos < 0:
+            if not chunk:
+                return
+            buffer = buffer[-(len(START_CODE) - 1):]  # may hold part of a start code
+            continue
+
+        while True:
+            next_pos = buffer.find(START_CODE, pos + len(START_CODE))
+            if next_pos < 0:
+                break
+            # zeros before a start code are a 4 byte start code or trailing_zero_8bits
+            nal = buffer[pos + len(START_CODE):next_pos].rstrip(b'\x00')
+            if nal:
+                yield nal
+            pos = next_pos
+        buffer = buffer[pos:]
+
+        if not chunk:
+            nal = buffer[len(START_CODE):].rstrip(b'\x00')
+            if nal:
+                yield nal
+            return
+
+def iter_access_units(nal_units):
+    """
+    Groups NAL units into access units (one per frame)
+    Parameters
+    ----------
+    nal_units : iterator
+        NAL units in decoding order
+    Yields
+    ------
+    access_unit : list
+        NAL units of one frame
+    """
+    access_unit = []
+    has_vcl = False
+    for nal in nal_units:
+        nal_type = nal[0] & 0x1F
+        is_vcl = nal_type in VCL_TYPES
+        # first_mb_in_slice == 0 (ue code '1') starts a new picture
+        first_slice = is_vcl and len(nal) > 1 and nal[1] & 0x80
+        if has_vcl and (nal_type in AU_START_TYPES or first_slice):
+            yield access_unit
+            access_unit = []
+            has_vcl = False
+        access_unit.append(nal)
+        has_vcl = has_vcl or is_vcl
+    if has_vcl:
+        yield access_unit
+
+def box(box_type, *payloads):
+    """
+    Builds an MP4 box
+    Parameters
+    ----------
+    box_type : bytes
+        Four character box type
+    payloads : bytes
+        Contents of box
+    Returns
+    -------
+    bytes
+        The box
+    """
+    payload = b''.join(payloads)
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+def full_box(box_type, version, flags, *payloads):
+    """
+    Builds an MP4 full box (with version & flags)
+    Parameters
+    ----------
+    box_type : bytes
+        Four character box type
+    version : int
+        Box version
+    flags : int
+        Box flags (24 bits)
+    payloads : bytes
+        Contents of box
+    Returns
+    -------
+    bytes
+        The box
+    """
+    return box(box_type, struct.pack('>I', (version << 24) | flags), *payloads)
+
+def mux_h264_to_mp4(h264_file, mp4_file, fps=DEFAULT_FPS):
+    """
+    Wraps a raw H.264 stream into an MP4 file
+    Parameters
+    ----------
+    h264_file : str
+        File name of raw H.264 (Annex B) stream
+    mp4_file : str
+        File name of MP4 file to write
+    fps : int
+        Frame rate of stream
+    Returns
+    -------
+    frames : int
+        Number of frames muxed
+    Raises
+    ------
+    ValueError
+        Stream has no SPS, PPS or frames, or is too large
+    """
+    sps = pps = None
+    sizes = []
+    keyframes = []
+
+    with open(h264_file, 'rb') as src, open(mp4_file, 'wb') as dst:
+        dst.write(box(b'ftyp', b'isom', struct.pack('>I', 512), b'isom', b'iso2', b'avc1', b'mp41'))
+        mdat_start = dst.tell()
+        dst.write(struct.pack('>I4s', 0, b'mdat'))  # size written once known
+
+        for access_unit in iter_access_units(iter_nal_units(src)):
+            size = 0
+            keyframe = False
+            for nal in access_unit:
+                nal_type = nal[0] & 0x1F
+                if nal_type == NAL_SPS and sps is None:
+                    sps = nal
+                elif nal_type == NAL_PPS and pps is None:
+                    pps = nal
+                if nal_type not in SAMPLE_TYPES:
+                    continue
+                keyframe = keyframe or nal_type == NAL_IDR_SLICE
+                dst.write(struct.pack('>I', len(nal)))
+                dst.write(nal)
+                size += NAL_LENGTH_BYTES + len(nal)
+            sizes.append(size)
+            if keyframe:
+                keyframes.append(len(sizes))
+
+        if sps is None or pps is None or not sizes:
+            raise ValueError('No SPS, PPS or frames in {}'.format(h264_file))
+        mdat_end = dst.tell()
+        if mdat_end > MAX_BOX_BYTES:
+            raise ValueError('{} too large for 32 bit MP4 offsets'.format(h264_file))
+        dst.seek(mdat_start)
+        dst.write(struct.pack('>I', mdat_end - mdat_start))
+        dst.seek(mdat_end)
+
+        dst.write(_moov(sps, pps, sizes, keyframes, mdat_start + 8, fps))
+
+    logging.debug('Muxed {} frames into {}'.format(len(sizes), mp4_file))
+    return len(sizes)
+
+def _moov(sps, pps, sizes, keyframes, chunk_offset, fps):
+    """
+    Builds the moov box indexing the samples (all in one chunk)
+    Parameters
+    ----------
+    sps : bytes
+        SPS NAL unit
+    pps : bytes
+        PPS NAL unit
+    sizes : list
+        Size of each sample
+    keyframes : list
+        1-based numbers of keyframe samples
+    chunk_offset : int
+        File offset of first sample
+    fps : int
+        Frame rate
+    Returns
+    -------
+    bytes
+        The moov box
+    """
+    info = parse_sps(sps)
+    width, height = info['width'], info['height']
+    sample_delta = TIMESCALE // fps
+    duration = sample_delta * len(sizes)
+    movie_duration = duration * MOVIE_TIMESCALE // TIMESCALE
+    matrix = struct.pack('>9I', *IDENTITY_MATRIX)
+
+    mvhd = full_box(b'mvhd', 0, 0,
+                    struct.pack('>IIII', 0, 0, MOVIE_TIMESCALE, movie_duration),
+                    struct.pack('>IH10x', 0x00010000, 0x0100), matrix,
+                    bytes(24), struct.pack('>I', 2))
+    tkhd = full_box(b'tkhd', 0, 3,
+                    struct.pack('>IIIII8xhhh2x', 0, 0, 1, 0, movie_duration, 0, 0, 0), matrix,
+                    struct.pack('>II', width << 16, height << 16))
+
+    avcc = struct.pack('>BBBBBB', 1, sps[1], sps[2], sps[3], 0xFC | (NAL_LENGTH_BYTES - 1), 0xE0 | 1)
+    avcc += struct.pack('>H', len(sps)) + sps + struct.pack('>BH', 1, len(pps)) + pps
+    if info['profile'] in AVCC_HIGH_PROFILES:
+        avcc += struct.pack('>BBBB', 0xFC | info['chroma_format_idc'], 0xF8 | (info['bit_depth_luma'] - 8),
+                            0xF8 | (info['bit_depth_chroma'] - 8), 0)
+    avc1 = box(b'avc1', bytes(6), struct.pack('>H', 1), bytes(16),
+               struct.pack('>HHIIIH', width, height, 0x00480000, 0x00480000, 0, 1),
+               bytes(32), struct.pack('>Hh', 0x0018, -1), box(b'avcC', avcc))
+
+    stbl = [full_box(b'stsd', 0, 0, struct.pack('>I', 1), avc1),
+            full_box(b'stts', 0, 0, struct.pack('>III', 1, len(sizes), sample_delta))]
+    if len(keyframes) < len(sizes):
+        stbl.append(full_box(b'stss', 0, 0, struct.pack('>I{}I'.format(len(keyframes)), len(keyframes), *keyframes)))
+    stbl += [full_box(b'stsc', 0, 0, struct.pack('>IIII', 1, 1, len(sizes), 1)),
+             full_box(b'stsz', 0, 0, struct.pack('>II{}I'.format(len(sizes)), 0, len(sizes), *sizes)),
+             full_box(b'stco', 0, 0, struct.pack('>II', 1, chunk_offset))]
+
+    minf = box(b'minf',
+               full_box(b'vmhd', 0, 1, bytes(8)),
+               box(b'dinf', full_box(b'dref', 0, 0, struct.pack('>I', 1), full_box(b'url ', 0, 1))),
+               box(b'stbl', *stbl))
+    mdia = box(b'mdia',
+               full_box(b'mdhd', 0, 0, struct.pack('>IIIIHH', 0, 0, TIMESCALE, duration, LANGUAGE_UND, 0)),
+               full_box(b'hdlr', 0, 0, struct.pack('>I4s12x', 0, b'vide'), b'VideoHandler\x00'),
+               minf)
+    return box(b'moov', mvhd, box(b'trak', tkhd, mdia))
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+
+"""
+Sends SMS & email alerts in the background, coalescing alerts within a
+window into one digest message and rate limiting each channel
+"""
+
+import logging
+import smtplib
+import threading
+import time
+import constants as c
+
+try:
+    import nexmo
+except ImportError:
+    # Only needed by SmsChannel
+    nexmo = None
+
+#Magic numbers (constants)
+DIGEST_WINDOW_SECS = 10
+MIN_INTERVAL_SECS = {'sms': 60, 'email': 30}
+SMS_STATUS_OK = '0'
+
+class SmsChannel:
+    """
+    Sends SMS with one reused Nexmo client
+    Attributes
+    ----------
+    __client : Client
+        Nexmo client, created on first send
+    Methods
+    -------
+    send(messages)
+        Sends messages as one SMS
+    close()
+        Nothing to close
+    """
+    def __init__(self, client=None):
+        """
+        Initializes the SmsChannel
+        Parameters
+        ----------
+        client : Client
+            Nexmo client, created on first send if None
+        """
+        self.__client = client
+
+    def send(self, messages):
+        """
+        Sends messages as one SMS
+        Parameters
+        ----------
+        messages : list
+            (subject, text) of each alert
+        """
+        if self.__client is None:
+            self.__client = nexmo.Client(key=c.SMS_API_KEY, secret=c.SMS_API_SECRET)
+
+        if len(messages) == 1:
+            text = messages[0][1]
+        else:
+            text = '{} alerts:\n{}'.format(len(messages), '\n'.join(text for _, text in messages))
+        responseData = self.__client.send_message({'from': c.FROM_NUMBER, 'to': c.TO_NUMBER, 'text': text})
+
+        if responseData["messages"][0]["status"] != SMS_STATUS_OK:
+            raise Exception("Message failed with error: {}".format(responseData['messages'][0]['error-text']))
+        logging.debug("Message sent successfully.")
+
+    def close(self):
+        """
+        Nothing to close (client is stateless HTTP)
+        """
+
+class EmailChannel:
+    """
+    Sends email over one persistent SMTP connection, reconnecting if it was dropped
+    Attributes
+    ----------
+    __connect : function
+        Returns a new SMTP connection
+    __session : SMTP
+        Open SMTP connection, None until first send
+    Methods
+    -------
+    send(messages)
+        Sends messages as one email
+    close()
+        Quits the SMTP connection
+    """
+    def __init__(self, connect=None):
+        """
+        Initializes the EmailChannel
+        Parameters
+        ----------
+        connect : function
+            Returns a new logged-in SMTP connection, Gmail if None
+        """
+        self.__connect = connect if connect is not None else connect_gmail
+        self.__session = None
+
+    def send(self, messages):
+        """
+        Sends messages as one email
+        Parameters
+        ----------
+        messages : list
+            (subject, text) of each alert
+        """
+        if len(messages) == 1:
+            subject, body = messages[0]
+        else:
+            subject = '{} Home Pixel alerts'.format(len(messages))
+            body = '<br>'.join('{}: {}'.format(alert_subject, text) for alert_subject, text in messages)
+
+        #Create Headers
+        headers = ["From: " + c.GMAIL_USERNAME,
+                   "Subject: " + subject,
+                   "To: " + c.GMAIL_USERNAME,
+                   "MIME-Version: 1.0",
+                   "Content-Type: text/html"]
+        email = "\r\n".join(headers) + "\r\n\r\n" + body
+
+        try:
+            self.__get_session().sendmail(c.GMAIL_USERNAME, c.GMAIL_USERNAME, email)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            logging.debug('SMTP connection dropped, reconnecting')
+            self.__session = None
+            self.__get_session().sendmail(c.GMAIL_USERNAME, c.GMAIL_USERNAME, email)
+        logging.debug("Email sent successfully!")
+
+    def close(self):
+        """
+        Quits the SMTP connection
+        """
+        if self.__session is not None:
+            try:
+                self.__session.quit()
+            except smtplib.SMTPException:
+                pass
+            self.__session = None
+
+    def __get_session(self):
+        """
+        Gets the open SMTP connection, connecting if needed
+        Returns
+        -------
+        SMTP
+            SMTP connection
+        """
+        if self.__session is None:
+            self.__session = self.__connect()
+        return self.__session
+
+def connect_gmail():
+    """
+    Connects & logs in to Gmail
+    Returns
+    -------
+    session : SMTP
+        SMTP connection
+    """
+    session = smtplib.SMTP(c.SMTP_SERVER, c.SMTP_PORT)
+    session.ehlo()
+    session.starttls()
+    session.ehlo()
+    session.login(c.GMAIL_USERNAME, c.GMAIL_PASSWORD)
+    return session
+
+class NotificationDispatcher:
+    """
+    Queues alerts per channel and sends them from a background thread, once the
+    digest window after the first queued alert has passed and the channel's
+    rate limit allows, merging all alerts queued by then into one message
+    Attributes
+    ----------
+    __channels : dict
+        Channels (with send(messages) & close()) keyed by name
+    __window_secs : float
+        Seconds alerts are collected before sending
+    __min_interval_secs : dict
+        Min seconds between messages, keyed by channel name
+    __pending : dict
+        Queued (subject, text) & time first queued, keyed by channel name
+    __last_sent : dict
+        Time of last message, keyed by channel name
+    __changed : Condition
+        Guards queues, notified when alerts are queued or on stop
+    __stopping : bool
+        True once stop() is called
+    __thread : Thread
+        Sending thread
+    __stats : dict
+        Alerts queued, messages sent/failed & alerts coalesced, keyed by channel name
+    Methods
+    -------
+    notify(channel, text, subject=None)
+        Queues an alert
+    start()
+        Starts the sending thread
+    stop()
+        Sends queued alerts and closes channels
+    get_stats()
+        Gets alert & message counts per channel
+    """
+    def __init__(self, channels, window_secs=DIGEST_WINDOW_SECS, min_interval_secs=MIN_INTERVAL_SECS):
+        """
+        Initializes the NotificationDispatcher
+        Parameters
+        ----------
+        channels : dict
+            Channels keyed by name
+        window_secs : float
+            Seconds alerts are collected before sending
+        min_interval_secs : dict
+            Min seconds between messages keyed by channel name (none if missing)
+        """
+        self.__channels = channels
+        self.__window_secs = window_secs
+        self.__min_interval_secs = min_interval_secs
+        self.__pending = {name: ([], None) for name in channels}
+        self.__last_sent = {name: None for name in channels}
+        self.__changed = threading.Condition()
+        self.__stopping = False
+        self.__thread = None
+        self.__stats = {name: {'queued': 0, 'sent': 0, 'failed': 0, 'coalesced': 0} for name in channels}
+
+    def notify(self, channel, text, subject=None):
+        """
+        Queues an alert
+        Parameters
+        ----------
+        channel : str
+            Channel name
+        text : str
+            Alert text
+        subject : str
+            Alert subject (email), text if None
+        """
+        with self.__changed:
+            messages, first_queued = self.__pending[channel]
+            messages.append((subject or text, text))
+            self.__pending[channel] = (messages, first_queued or time.monotonic())
+            self.__stats[channel]['queued'] += 1
+            self.__changed.notify_all()
+
+    def start(self):
+        """
+        Starts the sending thread
+        """
+        self.__stopping = False
+        self.__thread = threading.Thread(target=self.__work, name='notifier', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Sends queued alerts (without waiting for window or rate limit) and closes channels
+        """
+        with self.__changed:
+            self.__stopping = True
+            self.__changed.notify_all()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        for channel in self.__channels.values():
+            channel.close()
+
+    def get_stats(self):
+        """
+        Gets alert & message counts per channel
+        Returns
+        -------
+        stats : dict
+            Alerts queued, messages sent/failed & alerts coalesced, keyed by channel name
+        """
+        with self.__changed:
+            return {name: dict(stats) for name, stats in self.__stats.items()}
+
+    def __due(self, name, now):
+        """
+        Gets seconds until a channel's queued alerts may be sent
+        Parameters
+        ----------
+        name : str
+            Channel name
+        now : float
+            Current monotonic time
+        Returns
+        -------
+        float
+            Seconds to wait (<= 0 if due), None if nothing queued
+        """
+        messages, first_queued = self.__pending[name]
+        if not messages:
+            return None
+        due = first_queued + self.__window_secs
+        min_interval = self.__min_interval_secs.get(name)
+        if min_interval is not None and self.__last_sent[name] is not None:
+            due = max(due, self.__last_sent[name] + min_interval)
+        return due - now
+
+    def __work(self):
+        """
+        Sending thread: sends each channel's queued alerts when due, until stopped
+        """
+        while True:
+            with self.__changed:
+                now = time.monotonic()
+                waits = {name: self.__due(name, now) for name in self.__channels}
+                waits = {name: wait for name, wait in waits.items() if wait is not None}
+                stopping = self.__stopping
+                due = [name for name, wait in waits.items() if stopping or wait <= 0]
+                if not due:
+                    if stopping:
+                        return
+                    self.__changed.wait(min(waits.values()) if waits else None)
+                    continue
+                batches = {}
+                for name in due:
+                    batches[name] = self.__pending[name][0]
+                    self.__pending[name] = ([], None)
+                    self.__last_sent[name] = now
+
+            for name, messages in batches.items():
+                self.__send(name, messages)
+
+    def __send(self, name, messages):
+        """
+        Sends alerts as one message
+        Parameters
+        ----------
+        name : str
+            Channel name
+        messages : list
+            (subject, text) of each alert
+        """
+        try:
+            self.__channels[name].send(messages)
+            succeeded = True
+        except BaseException as e:
+            logging.error('Sending {} {} alerts failed: {}'.format(len(messages), name, e))
+            succeeded = False
+
+        with self.__changed:
+            self.__stats[name]['sent' if succeeded else 'failed'] += 1
+            self.__stats[name]['coalesced'] += len(messages) - 1
@@ -37,6 +37,10 @@ class PanTilt:
         Changes angle of pan servo according to user input
     change_tilt_angle(angleInDegrees)
         Changes angle of tilt servo according to user input
+    set_angle(axis, angleInDegrees)
+        Sets PWM of a servo for an angle without waiting
+    release(axis)
+        Turns off PWM pulses of a servo
     stop_servo()
         Stops PWM on both servos
     """
@@ -78,9 +82,9 @@ class PanTilt:
         angleInDegrees: int
             angle to turn to in degrees
         """
-        self.__panservo.ChangeDutyCycle(2+(angleInDegrees/18))
+        self.set_angle('pan', angleInDegrees)
         sleep(WAIT_TIME_SECS)
-        self.__panservo.ChangeDutyCycle(0)
+        self.release('pan')
         logging.info('Pan Angle Set')
 
     def change_tilt_angle(self, angleInDegrees):
@@ -91,11 +95,48 @@ class PanTilt:
         angleInDegrees: int
             angle to turn to in degrees
         """
-        self.__tiltservo.ChangeDutyCycle(2+(angleInDegrees/18))
+        self.set_angle('tilt', angleInDegrees)
         sleep(WAIT_TIME_SECS)
-        self.__tiltservo.ChangeDutyCycle(0)
+        self.release('tilt')
         logging.info('Tilt Angle Set')
 
+    def set_angle(self, axis, angleInDegrees):
+        """
+        Sets PWM of a servo for an angle without waiting for it to turn
+        (used by ServoController, which steps & releases the servos)
+        Parameters
+        ----------
+        axis : str
+            'pan' or 'tilt'
+        angleInDegrees: float
+            angle to turn to in degrees
+        """
+        self.__servo(axis).ChangeDutyCycle(2+(angleInDegrees/18))
+
+    def release(self, axis):
+        """
+        Turns off PWM pulses of a servo (holds position without jitter)
+        Parameters
+        ----------
+        axis : str
+            'pan' or 'tilt'
+        """
+        self.__servo(axis).ChangeDutyCycle(0)
+
+    def __servo(self, axis):
+        """
+        Gets the PWM of a servo
+        Parameters
+        ----------
+        axis : str
+            'pan' or 'tilt'
+        Returns
+        -------
+        GPIO.PWM
+            PWM of servo
+        """
+        return self.__panservo if axis == 'pan' else self.__tiltservo
+
     def close_servo(self): 
         """
         Stops PWM on both servos
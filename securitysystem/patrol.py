@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+
+"""
+Named pan/tilt presets persisted in SQLite, and a patrol scheduler that
+sweeps the camera through them on a timer, paused while motion is recorded
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+
+#Magic numbers (constants)
+PATROL_DB = 'patrol.db'  # shared by the dashboard & the SecuritySystem node (cwd securitysystem/)
+DWELL_SECS = 30  # seconds the camera stays at a preset without its own dwell
+MANUAL_HOLD_SECS = 60  # seconds patrol is paused after a manual move to a preset
+MIN_ANGLE = 0
+MAX_ANGLE = 180
+BUSY_TIMEOUT_SECS = 5
+RECORDING = 'recording'  # hold reasons
+MANUAL = 'manual'
+
+class PresetStore:
+    """
+    Presets & patrol holds in a SQLite DB, so the dashboard (which moves the
+    servos) and the SecuritySystem node (which records) share them
+    Attributes
+    ----------
+    __db_file : str
+        sqlite DB file
+    Methods
+    -------
+    save_preset(name, pan, tilt, dwell_secs=None)
+        Adds or updates a preset
+    delete_preset(name)
+        Deletes a preset
+    get_preset(name)
+        Gets a preset
+    get_presets()
+        Gets presets in patrol order
+    hold(reason, secs)
+        Pauses patrol for a while
+    release(reason)
+        Ends a hold early
+    get_hold_until()
+        Gets when patrol may resume
+    """
+    def __init__(self, db_file=PATROL_DB):
+        """
+        Initializes the PresetStore, creating tables if needed
+        Parameters
+        ----------
+        db_file : str
+            sqlite DB file
+        """
+        self.__db_file = db_file
+        with self.__connect() as conn:
+            conn.execute('PRAGMA journal_mode=wal')  # dashboard reads while the node writes holds
+            conn.execute('''CREATE TABLE IF NOT EXISTS presets
+                            (name TEXT PRIMARY KEY, pan REAL NOT NULL, tilt REAL NOT NULL,
+                             dwell_secs REAL, position INTEGER NOT NULL)''')
+            conn.execute('CREATE TABLE IF NOT EXISTS holds (reason TEXT PRIMARY KEY, until REAL NOT NULL)')
+
+    def save_preset(self, name, pan, tilt, dwell_secs=None):
+        """
+        Adds a preset at the end of the patrol, or updates it in place
+        Parameters
+        ----------
+        name : str
+            Name of preset
+        pan : float
+            Pan angle in degrees (clamped to 0-180)
+        tilt : float
+            Tilt angle in degrees (clamped to 0-180)
+        dwell_secs : float
+            Seconds patrol stays at the preset, None for the scheduler's default
+        Returns
+        -------
+        preset : dict
+            Saved preset
+        """
+        pan = max(MIN_ANGLE, min(MAX_ANGLE, pan))
+        tilt = max(MIN_ANGLE, min(MAX_ANGLE, tilt))
+        with self.__connect() as conn:
+            conn.execute('''INSERT INTO presets (name, pan, tilt, dwell_secs, position)
+                            VALUES (?, ?, ?, ?, (SELECT COALESCE(MAX(position), 0) + 1 FROM presets))
+                            ON CONFLICT (name) DO UPDATE
+                            SET pan = excluded.pan, tilt = excluded.tilt, dwell_secs = excluded.dwell_secs''',
+                         (name, pan, tilt, dwell_secs))
+        return {'name': name, 'pan': pan, 'tilt': tilt, 'dwell_secs': dwell_secs}
+
+    def delete_preset(self, name):
+        """
+        Deletes a preset
+        Parameters
+        ----------
+        name : str
+            Name of preset
+        Returns
+        -------
+        bool
+            True if the preset existed
+        """
+        with self.__connect() as conn:
+            return conn.execute('DELETE FROM presets WHERE name = ?', (name,)).rowcount > 0
+
+    def get_preset(self, name):
+        """
+        Gets a preset
+        Parameters
+        ----------
+        name : str
+            Name of preset
+        Returns
+        -------
+        preset : dict
+            name, pan, tilt & dwell_secs, None if no such preset
+        """
+        with self.__connect() as conn:
+            row = conn.execute('SELECT name, pan, tilt, dwell_secs FROM presets WHERE name = ?', (name,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def get_presets(self):
+        """
+        Gets presets in patrol order
+        Returns
+        -------
+        presets : list
+            name, pan, tilt & dwell_secs of each preset
+        """
+        with self.__connect() as conn:
+            rows = conn.execute('SELECT name, pan, tilt, dwell_secs FROM presets ORDER BY position').fetchall()
+        return [dict(row) for row in rows]
+
+    def hold(self, reason, secs):
+        """
+        Pauses patrol for secs from now (overlapping holds of a reason extend it)
+        Parameters
+        ----------
+        reason : str
+            Why patrol is held (RECORDING, MANUAL)
+        secs : float
+            Seconds to hold
+        """
+        with self.__connect() as conn:
+            conn.execute('''INSERT INTO holds (reason, until) VALUES (?, ?)
+                            ON CONFLICT (reason) DO UPDATE SET until = MAX(until, excluded.until)''',
+                         (reason, time.time() + secs))
+
+    def release(self, reason):
+        """
+        Ends a hold early
+        Parameters
+        ----------
+        reason : str
+            Why patrol was held
+        """
+        with self.__connect() as conn:
+            conn.execute('DELETE FROM holds WHERE reason = ?', (reason,))
+
+    def get_hold_until(self):
+        """
+        Gets when patrol may resume
+        Returns
+        -------
+        float
+            Epoch time the last hold ends, None if patrol is not held
+        """
+        with self.__connect() as conn:
+            return conn.execute('SELECT MAX(until) FROM holds WHERE until > ?', (time.time(),)).fetchone()[0]
+
+    @contextmanager
+    def __connect(self):
+        """
+        Opens a connection for one transaction (used from request & patrol threads)
+        Yields
+        ------
+        conn : Connection
+            sqlite connection, committed on success
+        """
+        with closing(sqlite3.connect(self.__db_file, timeout=BUSY_TIMEOUT_SECS)) as conn:
+            conn.row_factory = sqlite3.Row
+            with conn:
+                yield conn
+
+class PatrolScheduler:
+    """
+    Patrol thread moving the camera to each preset in turn. It sleeps until
+    the next move is due (reading the DB once per move), keeps to the schedule
+    without drift, and waits out holds set by recording or manual moves
+    Attributes
+    ----------
+    __controller : ServoController
+        Moves the servos (move_to returns right away)
+    __store : PresetStore
+        Presets & holds
+    __dwell_secs : float
+        Seconds at a preset without its own dwell
+    __manual_hold_secs : float
+        Seconds patrol is paused after goto_preset()
+    __wake : Event
+        Set to re-check holds & stopping before the next move is due
+    __lock : Lock
+        Guards stats & stopping
+    __stopping : bool
+        True once stop() is called
+    __thread : Thread
+        Patrol thread
+    __stats : dict
+        Moves, pauses & current preset
+    Methods
+    -------
+    start()
+        Starts the patrol thread
+    stop()
+        Stops the patrol thread
+    goto_preset(name)
+        Moves to a preset, pausing patrol
+    pause(secs, reason=MANUAL)
+        Pauses patrol
+    resume(reason=MANUAL)
+        Resumes patrol
+    get_stats()
+        Gets move & pause counts
+    """
+    def __init__(self, controller, store, dwell_secs=DWELL_SECS, manual_hold_secs=MANUAL_HOLD_SECS):
+        """
+        Initializes the PatrolScheduler
+        Parameters
+        ----------
+        controller : ServoController
+            Moves the servos
+        store : PresetStore
+            Presets & holds
+        dwell_secs : float
+            Seconds at a preset without its own dwell
+        manual_hold_secs : float
+            Seconds patrol is paused after goto_preset()
+        """
+        self.__controller = controller
+        self.__store = store
+        self.__dwell_secs = dwell_secs
+        self.__manual_hold_secs = manual_hold_secs
+        self.__wake = threading.Event()
+        self.__lock = threading.Lock()
+        self.__stopping = False
+        self.__thread = None
+        self.__stats = {'moves': 0, 'pauses': 0, 'preset': None, 'paused': False}
+
+    def start(self):
+        """
+        Starts the patrol thread (first move right away)
+        """
+        with self.__lock:
+            self.__stopping = False
+        self.__thread = threading.Thread(target=self.__run, name='patrol', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stops the patrol thread
+        """
+        with self.__lock:
+            self.__stopping = True
+        self.__wake.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def goto_preset(self, name):
+        """
+        Moves to a preset and pauses patrol, so the user can look around
+        Parameters
+        ----------
+        name : str
+            Name of preset
+        Returns
+        -------
+        preset : dict
+            Preset moved to, None if no such preset
+        """
+        preset = self.__store.get_preset(name)
+        if preset is None:
+            return None
+        self.pause(self.__manual_hold_secs)
+        self.__controller.move_to('pan', preset['pan'])
+        self.__controller.move_to('tilt', preset['tilt'])
+        return preset
+
+    def pause(self, secs, reason=MANUAL):
+        """
+        Pauses patrol for secs (a camera already moving finishes its move)
+        Parameters
+        ----------
+        secs : float
+            Seconds to pause
+        reason : str
+            Why patrol is paused
+        """
+        self.__store.hold(reason, secs)
+        self.__wake.set()
+
+    def resume(self, reason=MANUAL):
+        """
+        Resumes patrol paused for a reason (other holds still apply)
+        Parameters
+        ----------
+        reason : str
+            Why patrol was paused
+        """
+        self.__store.release(reason)
+        self.__wake.set()
+
+    def get_stats(self):
+        """
+        Gets move & pause counts
+        Returns
+        -------
+        stats : dict
+            Moves, pauses, current preset & whether patrol is paused
+        """
+        with self.__lock:
+            return dict(self.__stats)
+
+    def __run(self):
+        """
+        Patrol thread: moves to the next preset when due, unless held
+        """
+        index = 0
+        paused = False
+        deadline = time.monotonic()
+        while True:
+            with self.__lock:
+                if self.__stopping:
+                    break
+            timeout = deadline - time.monotonic()
+            if timeout > 0 and self.__wake.wait(timeout):
+                self.__wake.clear()
+                if not paused:
+                    continue  # check stopping, or a new hold, when the move is due
+
+            hold_until = self.__store.get_hold_until()
+            if hold_until is not None:
+                if not paused:
+                    logging.debug('Patrol paused')
+                    with self.__lock:
+                        self.__stats['pauses'] += 1
+                        self.__stats['paused'] = paused = True
+                deadline = time.monotonic() + hold_until - time.time()
+                continue
+            if paused:
+                logging.debug('Patrol resumed')
+                with self.__lock:
+                    self.__stats['paused'] = paused = False
+
+            now = time.monotonic()
+            presets = self.__store.get_presets()
+            if not presets:
+                deadline = now + self.__dwell_secs
+                continue
+            preset = presets[index % len(presets)]
+            index += 1
+            self.__controller.move_to('pan', preset['pan'])
+            self.__controller.move_to('tilt', preset['tilt'])
+            with self.__lock:
+                self.__stats['moves'] += 1
+                self.__stats['preset'] = preset['name']
+
+            # next move is timed from this one's due time, not from when it ran
+            dwell = preset['dwell_secs'] if preset['dwell_secs'] is not None else self.__dwell_secs
+            deadline += dwell
+            if deadline <= now:
+                deadline = now + dwell
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+"""
+Staged background pipeline for work done after motion is detected
+"""
+
+import logging
+import queue
+import threading
+import time
+
+STAGE_QUEUE_SIZE = 16
+STAGE_WORKERS = 1
+STOP = None  # queue sentinel telling a worker to exit
+
+class Stage:
+    """
+    One step of the pipeline: a bounded queue served by worker threads
+    Attributes
+    ----------
+    name : str
+        Name of stage
+    __func : function
+        Called with each event, events continue to next stages unless it raises
+    __workers : int
+        Number of worker threads
+    __queue : Queue
+        Bounded queue of (event, time queued)
+    __next_stages : list
+        Stages each processed event is passed on to
+    __threads : list
+        Worker threads
+    __lock : Lock
+        Guards metrics
+    __metrics : dict
+        Processed & failed counts, total/max seconds waiting & running
+    Methods
+    -------
+    then(stage)
+        Passes processed events on to stage
+    put(event)
+        Queues event, blocking while the queue is full
+    start()
+        Starts worker threads
+    stop()
+        Stops worker threads once queued events are processed
+    get_metrics()
+        Gets queue depth & latency metrics
+    """
+    def __init__(self, name, func, workers=STAGE_WORKERS, maxsize=STAGE_QUEUE_SIZE):
+        """
+        Initializes the Stage
+        Parameters
+        ----------
+        name : str
+            Name of stage
+        func : function
+            Called with each event
+        workers : int
+            Number of worker threads
+        maxsize : int
+            Max events queued
+        """
+        self.name = name
+        self.__func = func
+        self.__workers = workers
+        self.__queue = queue.Queue(maxsize)
+        self.__next_stages = []
+        self.__threads = []
+        self.__lock = threading.Lock()
+        self.__metrics = {'processed': 0, 'failed': 0,
+                          'wait_secs': 0, 'max_wait_secs': 0,
+                          'run_secs': 0, 'max_run_secs': 0}
+
+    def then(self, stage):
+        """
+        Passes processed events on to stage
+        Parameters
+        ----------
+        stage : Stage
+            Next stage
+        Returns
+        -------
+        stage : Stage
+            Next stage (for chaining)
+        """
+        self.__next_stages.append(stage)
+        return stage
+
+    def put(self, event):
+        """
+        Queues event, blocking while the queue is full (back-pressure)
+        Parameters
+        ----------
+        event : dict
+            Event to process
+        """
+        self.__queue.put((event, time.time()))
+
+    def start(self):
+        """
+        Starts worker threads
+        """
+        for i in range(self.__workers):
+            thread = threading.Thread(target=self.__work, name='{}-{}'.format(self.name, i), daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+
+    def stop(self):
+        """
+        Stops worker threads once queued events are processed
+        """
+        for thread in self.__threads:
+            self.__queue.put((STOP, None))
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+
+    def get_metrics(self):
+        """
+        Gets queue depth & latency metrics
+        Returns
+        -------
+        metrics : dict
+            Queue depth, processed & failed counts, mean/max seconds waiting in queue & running
+        """
+        with self.__lock:
+            metrics = dict(self.__metrics)
+        processed = metrics['processed'] + metrics['failed']
+        metrics['depth'] = self.__queue.qsize()
+        metrics['mean_wait_secs'] = metrics.pop('wait_secs') / processed if processed else 0
+        metrics['mean_run_secs'] = metrics.pop('run_secs') / processed if processed else 0
+        return metrics
+
+    def __work(self):
+        """
+        Worker thread: processes events until STOP
+        """
+        while True:
+            event, queued = self.__queue.get()
+            if event is STOP:
+                break
+
+            start = time.time()
+            try:
+                self.__func(event)
+                succeeded = True
+            except BaseException as e:
+                # stage methods call exit() on errors, which must not end the worker
+                logging.error('Stage {} failed: {}'.format(self.name, e))
+                succeeded = False
+            end = time.time()
+
+            with self.__lock:
+                self.__metrics['processed' if succeeded else 'failed'] += 1
+                self.__metrics['wait_secs'] += start - queued
+                self.__metrics['max_wait_secs'] = max(self.__metrics['max_wait_secs'], start - queued)
+                self.__metrics['run_secs'] += end - start
+                self.__metrics['max_run_secs'] = max(self.__metrics['max_run_secs'], end - start)
+
+            if succeeded:
+                for stage in self.__next_stages:
+                    stage.put(event)
+
+class Pipeline:
+    """
+    Stages of work run in the background, each with its own bounded queue
+    Attributes
+    ----------
+    __stages : list
+        All stages, in the order added
+    __first_stages : list
+        Stages events are submitted to
+    Methods
+    -------
+    add_stage(name, func, after=None, workers=1, maxsize=16)
+        Adds a stage
+    start()
+        Starts all stages
+    submit(event)
+        Submits event to first stages
+    stop()
+        Stops all stages once queued events are processed
+    get_metrics()
+        Gets metrics of every stage
+    """
+    def __init__(self):
+        """
+        Initializes the Pipeline
+        """
+        self.__stages = []
+        self.__first_stages = []
+
+    def add_stage(self, name, func, after=None, workers=STAGE_WORKERS, maxsize=STAGE_QUEUE_SIZE):
+        """
+        Adds a stage
+        Parameters
+        ----------
+        name : str
+            Name of stage
+        func : function
+            Called with each event
+        after : Stage
+            Stage whose processed events are passed on, None for a first stage
+        workers : int
+            Number of worker threads
+        maxsize : int
+            Max events queued
+        Returns
+        -------
+        stage : Stage
+            The stage
+        """
+        stage = Stage(name, func, workers, maxsize)
+        if after is None:
+            self.__first_stages.append(stage)
+        else:
+            after.then(stage)
+        self.__stages.append(stage)
+        return stage
+
+    def start(self):
+        """
+        Starts all stages
+        """
+        for stage in self.__stages:
+            stage.start()
+
+    def submit(self, event):
+        """
+        Submits event to first stages
+        Parameters
+        ----------
+        event : dict
+            Event to process
+        """
+        for stage in self.__first_stages:
+            stage.put(event)
+
+    def stop(self):
+        """
+        Stops all stages once queued events are processed (stages are stopped
+        in the order added, so later stages get everything earlier ones pass on)
+        """
+        for stage in self.__stages:
+            stage.stop()
+
+    def get_metrics(self):
+        """
+        Gets metrics of every stage
+        Returns
+        -------
+        metrics : dict
+            Metrics keyed by stage name
+        """
+        return {stage.name: stage.get_metrics() for stage in self.__stages}
@@ -6,23 +6,26 @@ to mp4 format, sends SMS notification to user, uploads to Dropbox
 and emails access link to gmail
 """
 
-import time
-from camera import Camera
-from motionsensorclass import MotionSensorClass
-from thingspeakwriter import ThingSpeakWriter
-import nexmo
-import smtplib
-from subprocess import call  
+from camera import Camera, PRE_MOTION_SECS
+from motionsensorclass import MotionSensorClass, MOTION_SOURCES
+from framemotion import FrameMotionDetector, FrameMotionOutput
+from thingspeakwriter import ThingSpeakWriter, BatchWriter
+from pipeline import Pipeline
+from mp4mux import mux_h264_to_mp4
+from uploadmanager import UploadManager, get_backend
+from notifier import NotificationDispatcher, SmsChannel, EmailChannel
+from patrol import PresetStore, RECORDING
 import subprocess
 import argparse
 import logging
+import os
+import tempfile
 import constants as c
 
 #Magic numbers (constants)
 DEFAULT_ID = 0
-POLL_TIME_SECS = 0.5 
-POLLING = True
 ID_INCREMENT = 1
+CONVERT_WORKERS = 2  # clips mux in-process to unique temp files
 
 class SecuritySystem:
     """
@@ -37,33 +40,58 @@ class SecuritySystem:
         The motion sensor
     __cam : Camera
         The camera
-    __writer : ThingSpeakWriter
-        Writer to write to ThingSpeak channel
-    __link : str
-        Dropbox access link of recorded video
+    __writer : BatchWriter
+        Writer batching writes to ThingSpeak channel
+    __pipeline : Pipeline
+        Background stages run for each motion event
+    __uploader : UploadManager
+        Persistent queue uploading videos in parallel
+    __notifier : NotificationDispatcher
+        Sends SMS & email alerts, coalesced into digests
+    __motion_source : str
+        'pir', 'camera' (frame differencing), 'any' or 'all'
+    __patrol : PresetStore
+        Patrol holds shared with the dashboard, so the camera stays put while recording
     Methods
     -------
     poll()
         Polls to get motion input
     update_status()
         Records a 10s video based on motion input 
+    get_pipeline_metrics()
+        Gets queue depth & latency of each pipeline stage
+    get_upload_stats()
+        Gets upload queue & transfer stats
     convert_to_mp4(date, time)   
         Converts video file format from h264 to mp4
     __write_status_to_channel(date, time)
         Writes information to ThingSpeak channel
     send_notification(date, time)
-        Send SMS notification to mobile phone based when motion detected
+        Queue SMS notification to mobile phone based when motion detected
     upload_video(date, time)
-        Uploads video to Dropbox
+        Queues video for upload to Dropbox
     email_link(date, time, link)
-        Email dropbox access link to gmail
+        Queue email of dropbox access link to gmail
+    get_notification_stats()
+        Gets alert & message counts per channel
     __delete_local_videos()
         Deletes all local recorded videos
+    __create_pipeline()
+        Creates the post-motion pipeline stages
+    __report_event(event)
+        Pipeline stage: ThingSpeak write & SMS notification
+    __convert_event(event)
+        Pipeline stage: waits for video to be saved, converts it to mp4
+    __upload_event(event)
+        Pipeline stage: queues video for upload to Dropbox
+    __video_uploaded(meta, link)
+        Emails Dropbox access link once a video is uploaded
     """
     security_system_id = DEFAULT_ID   # Class variable (static)
 
-    def __init__(self, location, mts=MotionSensorClass(), cam=Camera(), 
-                 writer=ThingSpeakWriter(c.L2_M_5A1_WRITE_KEY)):
+    def __init__(self, location, mts=MotionSensorClass(), cam=None, 
+                 writer=BatchWriter(ThingSpeakWriter(c.L2_M_5A1_WRITE_KEY, c.L2_M_5A1_FEED), merge=False), upload_backend=None,
+                 max_upload_bytes_per_sec=None, notifier=None, motion_source='pir', patrol=None):
         """
         Initializes the attributes
         Parameters
@@ -73,11 +101,20 @@ class SecuritySystem:
         mts : MotionSensorClass
             The motion sensor
         cam : Camera
-            The camera
-        writer : ThingSpeakWriter
-            ThingSpeak channel
-        link : str
-            Dropbox access link of recorded video
+            The camera, Camera() if None
+        writer : BatchWriter
+            ThingSpeak channel (a ThingSpeakWriter writes each event right away), not merging
+            readings so each motion event is its own entry
+        upload_backend : UploadBackend
+            Where videos are uploaded, get_backend() if None
+        max_upload_bytes_per_sec : float
+            Upload bandwidth limit, None for no limit
+        notifier : NotificationDispatcher
+            Sends alerts, SMS & Gmail channels with default digest window & rate limits if None
+        motion_source : str
+            'pir', 'camera' (frame differencing), 'any' (either) or 'all' (both)
+        patrol : PresetStore
+            Patrol holds shared with the dashboard, PresetStore() if None
         """
         SecuritySystem.security_system_id += ID_INCREMENT
 
@@ -87,9 +124,15 @@ class SecuritySystem:
 
         self.__location = location
         self.__mts = mts
-        self.__cam = cam
+        self.__cam = cam if cam is not None else Camera()
         self.__writer = writer
-        self.__link = ""
+        self.__pipeline = self.__create_pipeline()
+        self.__uploader = UploadManager(upload_backend if upload_backend is not None else get_backend(),
+                                        max_bytes_per_sec=max_upload_bytes_per_sec,
+                                        on_uploaded=self.__video_uploaded)
+        self.__notifier = notifier if notifier is not None else NotificationDispatcher({'sms': SmsChannel(), 'email': EmailChannel()})
+        self.__motion_source = motion_source
+        self.__patrol = patrol if patrol is not None else PresetStore()
         
     def poll(self):
         """
@@ -98,29 +141,51 @@ class SecuritySystem:
         Send SMS notification to mobile phone. 
         Uploads video to Dropbox.
         Email dropbox access link to gmail.
+        Motion arrives as debounced events from sensor callbacks, and all but
+        recording run in background pipeline stages, so the next event is
+        handled while earlier events are converted, uploaded & sent
         """
         
         logging.info('SecuritySystem program running')
+        events = None
         try:
             self.__cam.start_camera()
-            while POLLING:
-                motionDetected = self.update_status()
-
-                if motionDetected[0]:
-                    #Write to Thingspeak, send SMS notifcation, upload to Dropbox and email Dropbox access link
-                    self.__write_to_channel(motionDetected[1], motionDetected[2])
-                    self.send_notification(motionDetected[1], motionDetected[2])
-                    self.upload_video(motionDetected[1], motionDetected[2])
-                    self.email_link(motionDetected[1], motionDetected[2], self.__link)
-                    # Wait before polling again
-                    time.sleep(POLL_TIME_SECS)
+            self.__pipeline.start()
+            self.__uploader.start()
+            self.__notifier.start()
+            detector = None
+            if self.__motion_source != 'pir':
+                detector = FrameMotionDetector()
+                self.__cam.start_motion_detection(FrameMotionOutput(detector))
+            events = self.__mts.events(frame_detector=detector, source=self.__motion_source)
+            for event in events:
+                #Pause the pan/tilt patrol so the recording isn't panned away from the motion
+                #(record_video may return before the clip's post-motion seconds are recorded)
+                self.__patrol.hold(RECORDING, self.__cam.post_motion_secs)
+                self.__cam.record_video(event.date, event.time)
+
+                #Write to Thingspeak, send SMS notifcation, upload to Dropbox and email Dropbox access link
+                self.__pipeline.submit({'date': event.date, 'time': event.time})
+                logging.debug('Pipeline metrics: {}'.format(self.get_pipeline_metrics()))
                 
         except KeyboardInterrupt:
             print('Exiting')
         except BaseException as e:
             print('An error or exception occurred: ' + str(e))
         finally:
-            #Close camera preview, sensor input, delete local videos
+            #Finish queued events, close camera preview, sensor input, delete local videos
+            #(unfinished uploads stay queued & resume on next run)
+            logging.info('Finishing queued events')
+            if events is not None:
+                logging.info('Motion stats: {}'.format(events.get_stats()))
+                events.close()
+            self.__pipeline.stop()
+            self.__uploader.stop()
+            self.__notifier.stop()
+            self.__writer.close()
+            logging.info('Pipeline metrics: {}'.format(self.get_pipeline_metrics()))
+            logging.info('Upload stats: {}'.format(self.get_upload_stats()))
+            logging.info('Notification stats: {}'.format(self.get_notification_stats()))
             self.__cam.close_camera()
             self.__mts.close_sensor()
             self.__delete_local_videos()
@@ -137,9 +202,99 @@ class SecuritySystem:
         result = self.__mts.check_input()
         if(result[0]):
             self.__cam.record_video(result[1], result[2])
-            self.convert_to_mp4(result[1], result[2])
         return result[0], result[1], result[2]
 
+    def get_pipeline_metrics(self):
+        """
+        Gets queue depth & latency of each pipeline stage
+        Returns
+        -------
+        metrics : dict
+            Metrics keyed by stage name
+        """
+        return self.__pipeline.get_metrics()
+
+    def get_upload_stats(self):
+        """
+        Gets upload queue & transfer stats
+        Returns
+        -------
+        stats : dict
+            Uploads per status, bytes & chunks sent, retries
+        """
+        return self.__uploader.get_stats()
+
+    def get_notification_stats(self):
+        """
+        Gets alert & message counts per channel
+        Returns
+        -------
+        stats : dict
+            Alerts queued, messages sent/failed & alerts coalesced, keyed by channel name
+        """
+        return self.__notifier.get_stats()
+
+    def __create_pipeline(self):
+        """
+        Creates the post-motion pipeline: ThingSpeak & SMS report right away,
+        while video is converted, then queued for upload (its link is emailed
+        by __video_uploaded)
+        Returns
+        -------
+        pipeline : Pipeline
+            The pipeline (not started)
+        """
+        pipeline = Pipeline()
+        pipeline.add_stage('report', self.__report_event)
+        convert = pipeline.add_stage('convert', self.__convert_event, workers=CONVERT_WORKERS)
+        pipeline.add_stage('upload', self.__upload_event, after=convert)
+        return pipeline
+
+    def __report_event(self, event):
+        """
+        Pipeline stage: writes to ThingSpeak & sends SMS notification
+        Parameters
+        ----------
+        event : dict
+            date & time of motion
+        """
+        self.__write_to_channel(event['date'], event['time'])
+        self.send_notification(event['date'], event['time'])
+
+    def __convert_event(self, event):
+        """
+        Pipeline stage: waits for video to be saved, converts it to mp4
+        Parameters
+        ----------
+        event : dict
+            date & time of motion
+        """
+        self.__cam.wait_for_video(event['date'], event['time'])
+        self.convert_to_mp4(event['date'], event['time'])
+
+    def __upload_event(self, event):
+        """
+        Pipeline stage: queues video for upload to Dropbox
+        Parameters
+        ----------
+        event : dict
+            date & time of motion
+        """
+        self.upload_video(event['date'], event['time'])
+
+    def __video_uploaded(self, meta, link):
+        """
+        Emails Dropbox access link once a video is uploaded (called by upload workers,
+        also for uploads resumed after a restart)
+        Parameters
+        ----------
+        meta : dict
+            date & time of motion
+        link : str
+            Dropbox access link of video
+        """
+        self.email_link(meta['date'], meta['time'], link)
+
     def convert_to_mp4(self, date, time):
         """
         Convert video to mp4 file (compatability with Windows & Linux)
@@ -154,21 +309,20 @@ class SecuritySystem:
             path = "/home/pi/Desktop/Security_Cam/"
             file_h264 = "{}{}_{}.h264".format(path, date, time)
             file_mp4 = "{}{}_{}.mp4".format(path, date, time)
-            file_temp = "{}convert.h264".format(path)
-
-            #rename file_h264 to file_temp
-            command0 = "mv {} {}".format(file_h264, file_temp)
-            call([command0], shell=True)
-            
-            #convert file_temp to file_mp4
-            command1 = "MP4Box -add {} {}".format(file_temp, file_mp4)
-            call([command1], shell=True) 
 
-            #remove file_temp
-            command2 = "rm {}".format(file_temp)
-            call([command2], shell=True)
+            #mux into a unique temp file so clips can convert concurrently,
+            #then move it into place so a partial mp4 is never uploaded
+            fd, file_temp = tempfile.mkstemp(suffix='.mp4.tmp', prefix='{}_{}_'.format(date, time), dir=path)
+            os.close(fd)
+            try:
+                frames = mux_h264_to_mp4(file_h264, file_temp)
+                os.replace(file_temp, file_mp4)
+            finally:
+                if os.path.exists(file_temp):
+                    os.remove(file_temp)
+            os.remove(file_h264)
             
-            logging.debug("Video converted to MP4 successfully!")
+            logging.debug("Video converted to MP4 successfully! ({} frames)".format(frames))
         
         except BaseException as e:
             print('An error or exception occurred: ' + str(e))
@@ -190,36 +344,30 @@ class SecuritySystem:
                       c.DATE_TIME_FIELD: "{} {}".format(date, time)}
 
             status, reason = self.__writer.write(fields)
-            if status != c.GOOD_STATUS:
+            if status not in (c.GOOD_STATUS, c.QUEUED_STATUS):
                 raise Exception('Write was unsuccessful')
 
         except BaseException as e:
+            #Keep running: the BatchWriter's outbox retries queued writes, a lost write isn't worth the node
             print('An error or exception occurred: ' + str(e))
-            exit()
 
     def send_notification(self, date, time):
         """
-        Send notification via SMS to mobile phone
+        Queue notification via SMS to mobile phone (alerts close together are sent as one SMS)
         Parameters
         ----------
         date : str
             Date when motion detected
         time : str
             Time when motion detected
+        Returns
+        -------
+        bool
+            True if queued
         """
         try:
-            client = nexmo.Client(key=c.SMS_API_KEY, secret=c.SMS_API_SECRET)
-
-            responseData = client.send_message({
-                'from': c.FROM_NUMBER,
-                'to': c.TO_NUMBER,
-                'text': 'Motion Detected at {} {}\n'.format(date, time),
-            })
-
-            if responseData["messages"][0]["status"] == "0":
-                logging.debug("Message sent successfully.")
-            else:
-                logging.debug("Message failed with error: {}".format(responseData['messages'][0]['error-text']))
+            self.__notifier.notify('sms', 'Motion Detected at {} {}'.format(date, time))
+            return True
 
         except BaseException as e:
             print('An error or exception occurred: ' + str(e))
@@ -227,34 +375,32 @@ class SecuritySystem:
 
     def upload_video(self, date, time):
         """
-        Upload video to Google Drive
+        Queue video for upload to Dropbox, its access link is emailed once uploaded
         Parameters
         ----------
         date : str
             Date when motion detected
         time : str
             Time when motion detected
+        Returns
+        -------
+        upload_id : int
+            ID of queued upload
         """
         try: 
-            uploadPath = "/home/pi/Desktop/Home_Pixel/Dropbox-Uploader/dropbox_uploader.sh" 
             vidfile = "/home/pi/Desktop/Security_Cam/{}_{}.mp4".format(date, time)
-            upl = "{} upload {} /HOMEPIXEL".format(uploadPath, vidfile)   
-            call ([upl], shell=True)  
+            upload_id = self.__uploader.enqueue(vidfile, meta={'date': date, 'time': time})
 
-            #According to URL syntax ":" = %3A
-            h, m, s = time.split(":")
-            self.__link = "https://www.dropbox.com/home/HOMEPIXEL?preview={}_{}%3A{}%3A{}.mp4".format(date, h, m, s)
-            
-            logging.debug("Video uploaded successfully!")
+            logging.debug("Video queued for upload!")
+            return upload_id
         
         except BaseException as e:
             print('An error or exception occurred: ' + str(e))
             exit()
-        
 
     def email_link(self, date, time, link):
         """
-        Email link to gmail of Google Drive access link 
+        Queue email to gmail of Dropbox access link (links close together are sent as one email)
         Parameters
         ----------
         date : str
@@ -263,30 +409,15 @@ class SecuritySystem:
             Time when motion detected
         link : str
             Dropbox access link of video
+        Returns
+        -------
+        bool
+            True if queued
         """
         try:
-            #Create Headers
-            headers = ["From: " + c.GMAIL_USERNAME, 
-                    "Subject: Video for Motion Detected at {} {}".format(date, time), 
-                    "To: " + c.GMAIL_USERNAME,
-                    "MIME-Version: 1.0", 
-                    "Content-Type: text/html"]
-            headers = "\r\n".join(headers)
-    
-            #Connect to Gmail Server
-            session = smtplib.SMTP(c.SMTP_SERVER, c.SMTP_PORT)
-            session.ehlo()
-            session.starttls()
-            session.ehlo()
-    
-            #Login to Gmail
-            session.login(c.GMAIL_USERNAME, c.GMAIL_PASSWORD)
-    
-            #Send Email & Exit
-            session.sendmail(c.GMAIL_USERNAME, c.GMAIL_USERNAME, headers + "\r\n\r\n" + "The 10 second video when motion is detected is shown here: " + link)
-            session.quit
-
-            logging.debug("Email sent successfully!")
+            self.__notifier.notify('email', "The 10 second video when motion is detected is shown here: " + link,
+                                   subject="Video for Motion Detected at {} {}".format(date, time))
+            return True
         
         except BaseException as e:
             print('An error or exception occurred: ' + str(e))
@@ -294,13 +425,16 @@ class SecuritySystem:
 
     def __delete_local_videos(self):
         """
-        Deletes all videos stored locally.
+        Deletes all videos stored locally, except those still queued for upload.
         """
         try: 
-            removeLocal = "rm /home/pi/Desktop/Security_Cam/*"  
-            call ([removeLocal], shell=True)
+            path = "/home/pi/Desktop/Security_Cam/"
+            pending = self.__uploader.get_pending_files()
+            for name in os.listdir(path):
+                if os.path.join(path, name) not in pending:
+                    os.remove(os.path.join(path, name))
 
-            logging.debug("Removed all local video files!")
+            logging.debug("Removed local video files ({} kept for upload)!".format(len(pending)))
         
         except BaseException as e:
             print('An error or exception occurred: ' + str(e))
@@ -323,6 +457,26 @@ def parse_args():
                         action='store_true',
                         help='Print all debug logs')
     
+    parser.add_argument('-p',
+                        '--pre-motion',
+                        type=float,
+                        default=PRE_MOTION_SECS,
+                        metavar='<secs>',
+                        help='Also save the seconds before motion (kept in an in-memory buffer)')
+
+    parser.add_argument('-m',
+                        '--motion-source',
+                        choices=MOTION_SOURCES,
+                        default='pir',
+                        help='Detect motion with the PIR sensor, camera frames, either or both')
+
+    parser.add_argument('-u',
+                        '--upload-limit',
+                        type=float,
+                        default=None,
+                        metavar='<KiB/s>',
+                        help='Limit upload bandwidth')
+
     parser.add_argument('-l',
                         '--location',
                         type=str,
@@ -338,5 +492,7 @@ if __name__ == '__main__':
     args = parse_args()
     logging_level = logging.DEBUG if args.verbose else logging.INFO
     logging.basicConfig(format=c.LOGGING_FORMAT, level=logging_level)
-    security_system = SecuritySystem(args.location)
+    upload_limit = args.upload_limit * 1024 if args.upload_limit else None
+    security_system = SecuritySystem(args.location, cam=Camera(pre_motion_secs=args.pre_motion),
+                                     max_upload_bytes_per_sec=upload_limit, motion_source=args.motion_source)
     security_system.poll()
\ No newline at end of file
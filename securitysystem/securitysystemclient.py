@@ -53,8 +53,7 @@ class SecuritySystemClient:
         self.__latest_data = None
 
         with SecuritySystemDB(db_file=c.SECURITY_SYSTEM_DB, name=c.SECURITY_SYSTEM_NAME) as db_obj:
-            if not db_obj.table_exists():
-                db_obj.create_table()
+            db_obj.migrate()
 
     def poll_channel(self):
         """
@@ -149,17 +148,15 @@ class SecuritySystemClient:
 
     def __add_data_from_channel(self, channel_data):
         """
-        Compares existing DB table with data read from channel.
-        Add data if not in Table
+        Add data read from channel to DB table in one batch.
+        Data already in Table is skipped
         Parameters
         ----------
         channel_data : list
             data read from the channel
         """
         with SecuritySystemDB(db_file=c.SECURITY_SYSTEM_DB, name=c.SECURITY_SYSTEM_NAME) as db_obj:
-            for data in channel_data:
-                if not db_obj.record_exists(data):
-                    db_obj.add_record(data)
+            db_obj.add_records(channel_data)
 
 
 def security_system_client_test():
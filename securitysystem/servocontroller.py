@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+
+"""
+Steers the pan/tilt servos from a background thread, so callers (the web
+dashboard) return right away: queued moves are coalesced to the latest target
+and servos are stepped smoothly towards it
+"""
+
+import logging
+import queue
+import threading
+import time
+
+#Magic numbers (constants)
+MIN_ANGLE = 0
+MAX_ANGLE = 180
+STEP_DEGREES = 5  # degrees moved per step
+STEP_SECS = 0.02  # seconds between steps (250 degrees/s)
+SETTLE_SECS = 0.5  # seconds PWM is held after the last step, then released to stop jitter
+STOP = None  # queue sentinel telling the thread to exit
+
+def clamp_angle(angle):
+    """
+    Clamps an angle to the servo range
+    Parameters
+    ----------
+    angle : float
+        Angle in degrees
+    Returns
+    -------
+    float
+        Angle between MIN_ANGLE & MAX_ANGLE
+    """
+    return max(MIN_ANGLE, min(MAX_ANGLE, angle))
+
+class ServoController:
+    """
+    Servo controller thread with a command queue
+    Attributes
+    ----------
+    __servo : PanTilt
+        Servos, with set_angle(axis, angle) (no waiting) & release(axis)
+    __step_degrees : float
+        Degrees moved per step
+    __step_secs : float
+        Seconds between steps
+    __settle_secs : float
+        Seconds PWM is held after the last step
+    __commands : Queue
+        (axis, target angle) commands not yet read by the thread
+    __lock : Lock
+        Guards targets, positions & stats
+    __targets : dict
+        Latest target angle keyed by axis
+    __positions : dict
+        Angle servo was last set to keyed by axis, None if unknown
+    __last_step : dict
+        Time of last step keyed by axis, None once released
+    __thread : Thread
+        Controller thread
+    __stats : dict
+        Commands, coalesced commands & steps
+    Methods
+    -------
+    start()
+        Starts the controller thread
+    stop()
+        Finishes moves in progress and stops the thread
+    move_to(axis, angle)
+        Queues a move to an angle
+    move_by(axis, degrees)
+        Queues a move relative to the latest target
+    get_targets()
+        Gets target angles
+    get_positions()
+        Gets angles servos are currently set to
+    get_stats()
+        Gets command & step counts
+    """
+    def __init__(self, servo, axes=('pan', 'tilt'), initial_angle=90, step_degrees=STEP_DEGREES,
+                 step_secs=STEP_SECS, settle_secs=SETTLE_SECS):
+        """
+        Initializes the ServoController
+        Parameters
+        ----------
+        servo : PanTilt
+            Servos, with set_angle(axis, angle) (no waiting) & release(axis)
+        axes : tuple
+            Names of axes
+        initial_angle : float
+            Target angle before any move (servos are set to it on start)
+        step_degrees : float
+            Degrees moved per step
+        step_secs : float
+            Seconds between steps
+        settle_secs : float
+            Seconds PWM is held after the last step
+        """
+        self.__servo = servo
+        self.__step_degrees = step_degrees
+        self.__step_secs = step_secs
+        self.__settle_secs = settle_secs
+        self.__commands = queue.Queue()
+        self.__lock = threading.Lock()
+        self.__targets = {axis: clamp_angle(initial_angle) for axis in axes}
+        self.__positions = {axis: None for axis in axes}
+        self.__last_step = {axis: None for axis in axes}
+        self.__thread = None
+        self.__stats = {'commands': 0, 'coalesced': 0, 'steps': 0}
+
+    def start(self):
+        """
+        Starts the controller thread, moving servos to their targets
+        """
+        for axis, angle in self.get_targets().items():
+            self.__commands.put((axis, angle))
+        self.__thread = threading.Thread(target=self.__run, name='servo-controller', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Finishes moves in progress and stops the thread
+        """
+        if self.__thread is not None:
+            self.__commands.put((STOP, None))
+            self.__thread.join()
+            self.__thread = None
+
+    def move_to(self, axis, angle):
+        """
+        Queues a move to an angle (returns right away)
+        Parameters
+        ----------
+        axis : str
+            Axis to move
+        angle : float
+            Target angle in degrees (clamped to 0-180)
+        Returns
+        -------
+        target : float
+            Clamped target angle
+        """
+        return self.__set_target(axis, angle)
+
+    def move_by(self, axis, degrees):
+        """
+        Queues a move relative to the latest target (so rapid clicks add up)
+        Parameters
+        ----------
+        axis : str
+            Axis to move
+        degrees : float
+            Degrees to move by
+        Returns
+        -------
+        target : float
+            Clamped target angle
+        """
+        return self.__set_target(axis, degrees, relative=True)
+
+    def get_targets(self):
+        """
+        Gets target angles
+        Returns
+        -------
+        dict
+            Target angle keyed by axis
+        """
+        with self.__lock:
+            return dict(self.__targets)
+
+    def get_positions(self):
+        """
+        Gets angles servos are currently set to
+        Returns
+        -------
+        dict
+            Angle keyed by axis, None if not yet set
+        """
+        with self.__lock:
+            return dict(self.__positions)
+
+    def get_stats(self):
+        """
+        Gets command & step counts
+        Returns
+        -------
+        stats : dict
+            Commands, commands coalesced (superseded before the thread read them) & steps
+        """
+        with self.__lock:
+            return dict(self.__stats)
+
+    def __set_target(self, axis, angle, relative=False):
+        """
+        Sets & queues a target in one locked step, so concurrent requests
+        (Flask threads) neither lose relative moves nor queue them out of order
+        Parameters
+        ----------
+        axis : str
+            Axis to move
+        angle : float
+            Target angle, or degrees to move by if relative
+        relative : bool
+            True to move relative to the latest target
+        Returns
+        -------
+        target : float
+            Clamped target angle
+        """
+        with self.__lock:
+            if axis not in self.__targets:
+                raise ValueError('Unknown axis: {}'.format(axis))
+            if relative:
+                angle += self.__targets[axis]
+            target = self.__targets[axis] = clamp_angle(angle)
+            self.__stats['commands'] += 1
+            self.__commands.put((axis, target))
+        return target
+
+    def __read_commands(self, timeout):
+        """
+        Reads queued commands, keeping the latest target per axis
+        Parameters
+        ----------
+        timeout : float
+            Seconds to wait for a first command, None to wait until one is queued
+        Returns
+        -------
+        targets : dict
+            Latest commanded target keyed by axis
+        stopping : bool
+            True if told to stop
+        """
+        targets = {}
+        stopping = False
+        read = 0
+        try:
+            command = self.__commands.get(timeout=timeout)
+            while True:
+                axis, angle = command
+                if axis is STOP:
+                    stopping = True
+                else:
+                    targets[axis] = angle
+                    read += 1
+                command = self.__commands.get_nowait()
+        except queue.Empty:
+            pass
+        if read > len(targets):
+            with self.__lock:
+                self.__stats['coalesced'] += read - len(targets)
+        return targets, stopping
+
+    def __run(self):
+        """
+        Controller thread: steps each servo towards its target, releasing it once settled
+        """
+        targets = {}
+        stopping = False
+        while True:
+            moving = any(self.__positions[axis] != angle for axis, angle in targets.items())
+            holding = any(step is not None for step in self.__last_step.values())
+            if stopping and not moving:
+                break
+            timeout = self.__step_secs if moving else self.__settle_secs if holding else None
+            new_targets, stop = self.__read_commands(0 if stopping else timeout)
+            targets.update(new_targets)
+            stopping = stopping or stop
+
+            now = time.monotonic()
+            for axis, target in targets.items():
+                position = self.__positions[axis]
+                if position == target:
+                    if self.__last_step[axis] is not None and now - self.__last_step[axis] >= self.__settle_secs:
+                        self.__servo.release(axis)
+                        self.__last_step[axis] = None
+                    continue
+                if position is None:
+                    position = target  # position unknown: go straight there
+                elif position < target:
+                    position = min(target, position + self.__step_degrees)
+                else:
+                    position = max(target, position - self.__step_degrees)
+                self.__servo.set_angle(axis, position)
+                self.__last_step[axis] = now
+                with self.__lock:
+                    self.__positions[axis] = position
+                    self.__stats['steps'] += 1
+
+        for axis, step in self.__last_step.items():
+            if step is not None:
+                self.__servo.release(axis)
+                self.__last_step[axis] = None
+        logging.debug('Servo controller stopped: {}'.format(self.get_stats()))
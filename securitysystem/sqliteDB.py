@@ -2,15 +2,30 @@
 Methods to create/insert into databases 
 """
 import abc
-import sqlite3
 import logging
 import argparse
 import os
+import calendar
 import constants as c
+from sqlitepool import DB_POOL, enable_wal
 from datetime import datetime, time
 
 FIRST_ROW = 0
 SINGLE_RECORD = 1
+NO_RECORDS = 0
+UNIQUE_COLUMNS = 'date, time, location, nodeID'
+DATE_COLUMN = 0
+TIME_COLUMN = 1
+
+# Record timestamp (seconds since epoch of the record's date & time)
+TIMESTAMP_COLUMN = 'timestamp'
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+TIMESTAMP_SQL = "cast(strftime('%s', date || ' ' || time) as integer)"
+
+# Schema version of each table (one per migration step), stored per table
+# in SCHEMA_VERSION_TABLE since several tables can share a DB file
+SCHEMA_VERSION = 3
+SCHEMA_VERSION_TABLE = 'SchemaVersion'
 
 class SqliteDB(metaclass=abc.ABCMeta):
     """"
@@ -33,10 +48,26 @@ class SqliteDB(metaclass=abc.ABCMeta):
         manually perform context manager exit
     table_exists()
         Check if table exists
+    get_schema_version()
+        Get the schema version of the table
+    migrate()
+        Create table or upgrade it to the latest schema
+    create_unique_index()
+        Create unique index on columns identifying a record
+    add_records(records)
+        Add a batch of records, skipping existing records
+    _create_indexes()
+        Create all indexes of the latest schema
+    _insert_statement(ignore)
+        Get SQL statement to insert a record
+    _row(record)
+        Get row values of a record including its timestamp
     create_table()
         Abstract method to create table
     add_record(record)
         Abstract method to add record
+    _record_values(record)
+        Abstract method to get row values of a record
     record_exists(record)
         Abstract method to check if record exists
     get_records()
@@ -86,10 +117,8 @@ class SqliteDB(metaclass=abc.ABCMeta):
         Performs steps in entry
         Available for manual use as per Facade pattern
         """
-        self._dbconnect = sqlite3.connect(self._db_file)
-
-        # Set row_factory to access columns by name
-        self._dbconnect.row_factory = sqlite3.Row
+        # Reuse a pooled connection (row_factory set to sqlite3.Row)
+        self._dbconnect = DB_POOL.acquire(self._db_file)
 
         # Create a cursor to work with the db
         self._cursor = self._dbconnect.cursor()
@@ -100,7 +129,8 @@ class SqliteDB(metaclass=abc.ABCMeta):
         Available for manual use as per Facade pattern
         """
         self._dbconnect.commit()
-        self._dbconnect.close()
+        self._cursor.close()
+        DB_POOL.release(self._dbconnect)
         self._dbconnect = None
         self._cursor = None
 
@@ -124,6 +154,220 @@ class SqliteDB(metaclass=abc.ABCMeta):
         logging.debug('Table exists? : {}'.format(table_exists))
         return table_exists
 
+    def get_schema_version(self):
+        """
+        Get the schema version of the table
+        Returns
+        -------
+        version : int
+            Schema version, 0 if table never migrated
+        """
+        self.__create_schema_version_table()
+        self._cursor.execute("SELECT version FROM {} WHERE tableName = ?".format(SCHEMA_VERSION_TABLE), (self._name,))
+
+        row = self._cursor.fetchone()
+        version = row[FIRST_ROW] if row else 0
+
+        logging.debug('Schema version: {}'.format(version))
+        return version
+
+    def migrate(self):
+        """
+        Create the table, or upgrade an existing table in place to the
+        latest schema. Each migration step is applied in its own
+        transaction together with the table's new schema version. Tables migrated before versions
+        were kept per table start again from the first step, as every step can be rerun.
+        Also switches the DB file to WAL mode
+        Raises
+        ------
+        Exception
+            Invalid use of SqliteDB context manager
+        """
+        if not self._dbconnect or not self._cursor:
+            raise Exception('Invalid call to Context Manager method!')
+
+        # Journal mode can't change inside a transaction
+        self._dbconnect.commit()
+        if not enable_wal(self._dbconnect):
+            logging.warning('WAL mode not available for {}'.format(self._db_file))
+
+        if not self.table_exists():
+            self.create_table()
+            return
+
+        migrations = [self.create_unique_index,
+                      self.__create_location_index,
+                      self.__add_timestamp_column]
+        version = self.get_schema_version()
+        self._dbconnect.commit()
+
+        for new_version, migration in enumerate(migrations, start=1):
+            if new_version <= version:
+                continue
+
+            logging.info('Migrating table {} to schema version {}'.format(self._name, new_version))
+            self._cursor.execute('BEGIN')
+            try:
+                migration()
+                self.__set_schema_version(new_version)
+            except BaseException:
+                self._dbconnect.rollback()
+                raise
+            self._dbconnect.commit()
+
+    def __set_schema_version(self, version):
+        """
+        Set the schema version of the table
+        Parameters
+        ----------
+        version : int
+            Schema version
+        """
+        self.__create_schema_version_table()
+        self._cursor.execute("insert or replace into {} values(?, ?)".format(SCHEMA_VERSION_TABLE), (self._name, version))
+
+    def __create_schema_version_table(self):
+        """
+        Create table holding the schema version of each table
+        """
+        self._cursor.execute("create table if not exists {} (tableName text primary key, version integer)".format(
+            SCHEMA_VERSION_TABLE))
+
+    def __create_location_index(self):
+        """
+        Create index on location used by the dashboard queries
+        """
+        self._cursor.execute("create index if not exists {name}_location on {name} (location)".format(name=self._name))
+
+    def __create_timestamp_index(self):
+        """
+        Create index on record timestamp
+        """
+        self._cursor.execute("create index if not exists {name}_timestamp on {name} ({col})".format(
+            name=self._name, col=TIMESTAMP_COLUMN))
+
+    def __add_timestamp_column(self):
+        """
+        Add the timestamp column to a table created without it
+        and fill it in from the date & time of existing records
+        """
+        self._cursor.execute('PRAGMA table_info({})'.format(self._name))
+        columns = [r['name'] for r in self._cursor.fetchall()]
+
+        if TIMESTAMP_COLUMN not in columns:
+            self._cursor.execute("alter table {} add column {} integer".format(self._name, TIMESTAMP_COLUMN))
+
+        self._cursor.execute("update {} set {} = {}".format(self._name, TIMESTAMP_COLUMN, TIMESTAMP_SQL))
+        self.__create_timestamp_index()
+
+    def _create_indexes(self):
+        """
+        Create all indexes of the latest schema on a new table
+        and mark the table as being at the latest schema version
+        """
+        self.create_unique_index()
+        self.__create_location_index()
+        self.__create_timestamp_index()
+        self.__set_schema_version(SCHEMA_VERSION)
+
+    def _insert_statement(self, ignore=False):
+        """
+        Get the SQL statement to insert a record & its timestamp
+        Parameters
+        ----------
+        ignore : bool
+            True to skip records already in the table
+        Returns
+        -------
+        str
+            SQL insert statement
+        """
+        columns = self._columns + (TIMESTAMP_COLUMN,)
+        return "insert {ignore}into {name} ({cols}) values({values})".format(
+            ignore='or ignore ' if ignore else '',
+            name=self._name,
+            cols=', '.join(columns),
+            values=', '.join('?' * len(columns)))
+
+    def _row(self, record):
+        """
+        Get the row values of a record followed by its timestamp
+        Parameters
+        ----------
+        record : dict
+            Entry to add to DB
+        Returns
+        -------
+        tuple
+            row values to insert
+        """
+        values = self._record_values(record)
+        timestamp = record_timestamp(values[DATE_COLUMN], values[TIME_COLUMN])
+        return values + (timestamp,)
+
+    def create_unique_index(self):
+        """
+        Create unique index on (date, time, location, nodeID) so
+        add_records can skip existing records without a lookup.
+        Deletes duplicate records already in the table first, keeping
+        the first row of each, and logs the number deleted
+        Raises
+        ------
+        Exception
+            Invalid use of SqliteDB context manager
+        """
+        if not self._dbconnect or not self._cursor:
+            raise Exception('Invalid call to Context Manager method!')
+
+        index_name = '{}_unique'.format(self._name)
+        self._cursor.execute("SELECT count(name) FROM sqlite_master WHERE \
+                       type='index' AND name=?", (index_name,))
+
+        if self._cursor.fetchone()[FIRST_ROW] == SINGLE_RECORD:
+            return
+
+        logging.debug('Creating unique index on table')
+        self._cursor.execute("delete from {name} where rowid not in \
+            (select min(rowid) from {name} group by {cols})".format(name=self._name, cols=UNIQUE_COLUMNS))
+        if self._cursor.rowcount > 0:
+            logging.warning('Deleted {} duplicate records from table {}'.format(self._cursor.rowcount, self._name))
+        self._cursor.execute("create unique index {index} on {name} ({cols})".format(
+            index=index_name, name=self._name, cols=UNIQUE_COLUMNS))
+
+    def add_records(self, records):
+        """
+        Add a batch of entries in a single statement & transaction.
+        Entries already in the table are skipped by the unique index
+        Parameters
+        ----------
+        records : list
+            Entries to add to DB
+        Returns
+        -------
+        added : int
+            Number of new entries added
+        Raises
+        ------
+        Exception
+            Invalid use of SqliteDB context manager
+        Exception
+            Invalid record
+        """
+        logging.debug('Adding {} entries to table'.format(len(records)))
+        if not self._dbconnect or not self._cursor:
+            raise Exception('Invalid call to Context Manager method!')
+
+        rows = [self._row(r) for r in records]
+        if not rows:
+            return NO_RECORDS
+
+        changes = self._dbconnect.total_changes
+        self._cursor.executemany(self._insert_statement(ignore=True), rows)
+
+        added = self._dbconnect.total_changes - changes
+        logging.debug('New entries added: {}'.format(added))
+        return added
+
     @abc.abstractmethod
     def create_table(self):
         pass
@@ -132,6 +376,10 @@ class SqliteDB(metaclass=abc.ABCMeta):
     def add_record(self, record):
         pass
 
+    @abc.abstractmethod
+    def _record_values(self, record):
+        pass
+
     @abc.abstractmethod
     def record_exists(self, record):
         pass
@@ -144,17 +392,24 @@ class SqliteDB(metaclass=abc.ABCMeta):
 class SecuritySystemDB(SqliteDB):
     """
     DB for Security System node
+    Attributes
+    ----------
+    _columns : tuple
+        names of the record columns
     Methods
     -------
     create_table()
         Creates a SecuritySystemDB table
     add_record()
         Adds entry to SecuritySystemDB table
+    _record_values()
+        Get row values of a SecuritySystemDB entry
     record_exists()
         Check if entry already exists in SecuritySystemDB
     get_records()
         Get all records from Table
     """
+    _columns = ('date', 'time', 'location', 'nodeID')
 
     def __init__(self, db_file=c.SECURITY_SYSTEM_DB, name=c.SECURITY_SYSTEM_NAME):
         """
@@ -181,7 +436,8 @@ class SecuritySystemDB(SqliteDB):
         if not self._dbconnect or not self._cursor:
             raise Exception('Invalid call to Context Manager method!')
 
-        self._cursor.execute("create table {} (date text, time text, location text, nodeID text)".format(self._name))
+        self._cursor.execute("create table {} (date text, time text, location text, nodeID text, timestamp integer)".format(self._name))
+        self._create_indexes()
 
     def add_record(self, record):
         """
@@ -202,6 +458,24 @@ class SecuritySystemDB(SqliteDB):
         if not self._dbconnect or not self._cursor:
             raise Exception('Invalid call to Context Manager method!')
 
+        self._cursor.execute(self._insert_statement(), self._row(record))
+
+    def _record_values(self, record):
+        """
+        Get the row values of a SecuritySystemDB entry
+        Parameters
+        ----------
+        record : dict
+            Entry to add to DB
+        Returns
+        -------
+        tuple
+            date, time, location & nodeID of entry
+        Raises
+        ------
+        Exception
+            Invalid SecuritySystemDB record
+        """
         date = record.get('date', '')
         time = record.get('time', '')
         location = record.get('location', '')
@@ -210,8 +484,7 @@ class SecuritySystemDB(SqliteDB):
         if '' in (date, time, node_id, location):
             raise Exception('Invalid SecuritySystemDB record!')
 
-        self._cursor.execute("insert into {} values(?, ?, ?, ?)".format(self._name),
-            (date, time, location, node_id))
+        return date, time, location, node_id
 
     def record_exists(self, record):
         """
@@ -275,6 +548,27 @@ class SecuritySystemDB(SqliteDB):
 
         return records
 
+def record_timestamp(date, time):
+    """
+    Get the timestamp stored with a record, matching TIMESTAMP_SQL
+    Parameters
+    ----------
+    date : str
+        Date of record (YYYY-MM-DD)
+    time : str
+        Time of record (HH:MM:SS)
+    Returns
+    -------
+    int
+        Seconds since epoch of date & time, None if unparseable
+    """
+    try:
+        date_time = datetime.strptime('{} {}'.format(date, time), TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+    return calendar.timegm(date_time.timetuple())
+
 def security_system_db_test(file_name, table_name, location, node_id):
     """
     Creates a SecuritySystemDB object for manual db verification
@@ -310,14 +604,11 @@ def security_system_db_test(file_name, table_name, location, node_id):
 
     with SecuritySystemDB(db_file=file_name, name=table_name) as db_obj:
 
-        logging.info('Checking & creating table if needed')
-        if not db_obj.table_exists():
-            db_obj.create_table()
+        logging.info('Creating or upgrading table if needed')
+        db_obj.migrate()
 
         logging.info('Adding only the new records to table')
-        for r in records:
-            if not db_obj.record_exists(r):
-                db_obj.add_record(r)
+        db_obj.add_records(records)
 
         logging.info('Retrieving all records')
         db_obj.get_records()
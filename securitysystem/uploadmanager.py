@@ -0,0 +1,695 @@
+#!/usr/bin/env python3
+
+"""
+Uploads videos in the background: a persistent queue drained by parallel
+workers, sending each file in resumable chunks to a pluggable backend
+"""
+
+import abc
+import json
+import logging
+import os
+import pathlib
+import random
+import threading
+import time
+import uuid
+from urllib.parse import quote
+import requests
+from sqlitepool import DB_POOL, enable_wal
+import constants as c
+
+#Magic numbers (constants)
+CHUNK_BYTES = 4 * 1024 * 1024
+UPLOAD_WORKERS = 2
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_SECS = 2
+BACKOFF_MAX_SECS = 300
+IDLE_WAIT_SECS = 5
+PENDING = 'pending'
+UPLOADING = 'uploading'
+DONE = 'done'
+FAILED = 'failed'
+
+# Dropbox upload session API (used by dropbox_uploader.sh too)
+DROPBOX_CONTENT_URL = 'https://content.dropboxapi.com/2/files/upload_session/{}'
+DROPBOX_CONFIG = '~/.dropbox_uploader'
+DROPBOX_TOKEN_KEY = 'OAUTH_ACCESS_TOKEN'
+DROPBOX_FOLDER = '/HOMEPIXEL'
+DROPBOX_LINK = 'https://www.dropbox.com/home{}?preview={}'
+HTTP_TIMEOUT_SECS = 60
+UPLOAD_ENV = 'HOMEPIXEL_UPLOAD'
+
+class SessionLostError(Exception):
+    """
+    Raised by a backend when an upload session can't be resumed, so the upload restarts
+    """
+
+class UploadBackend(metaclass=abc.ABCMeta):
+    """
+    Where videos are uploaded to, in chunks appended to an upload session
+    Methods
+    -------
+    start(name)
+        Starts an upload session, returns its ID
+    append(session, offset, data)
+        Appends data at offset, returns offset of next chunk
+    finish(session, name, size)
+        Commits the upload, returns access link
+    """
+    @abc.abstractmethod
+    def start(self, name):
+        pass
+
+    @abc.abstractmethod
+    def append(self, session, offset, data):
+        pass
+
+    @abc.abstractmethod
+    def finish(self, session, name, size):
+        pass
+
+class LocalDirectoryBackend(UploadBackend):
+    """
+    Uploads into a local directory (for testing, or a mounted share)
+    Attributes
+    ----------
+    __directory : str
+        Directory files are uploaded to
+    """
+    def __init__(self, directory):
+        """
+        Initializes the LocalDirectoryBackend
+        Parameters
+        ----------
+        directory : str
+            Directory files are uploaded to
+        """
+        self.__directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self, name):
+        """
+        Starts an upload session: an empty partial file
+        Parameters
+        ----------
+        name : str
+            Name of uploaded file
+        Returns
+        -------
+        session : str
+            Partial file name
+        """
+        session = '.{}.{}.part'.format(name, uuid.uuid4().hex)
+        open(os.path.join(self.__directory, session), 'wb').close()
+        return session
+
+    def append(self, session, offset, data):
+        """
+        Writes data at offset of partial file, replacing anything after it
+        Parameters
+        ----------
+        session : str
+            Partial file name
+        offset : int
+            Offset of data in file
+        data : bytes
+            Chunk of file
+        Returns
+        -------
+        int
+            Offset of next chunk
+        """
+        part = os.path.join(self.__directory, session)
+        try:
+            with open(part, 'r+b') as f:
+                if f.seek(0, os.SEEK_END) < offset:
+                    raise SessionLostError('{} is missing data before offset {}'.format(part, offset))
+                f.seek(offset)
+                f.truncate()
+                f.write(data)
+        except FileNotFoundError:
+            raise SessionLostError('{} no longer exists'.format(part))
+        return offset + len(data)
+
+    def finish(self, session, name, size):
+        """
+        Moves the partial file into place
+        Parameters
+        ----------
+        session : str
+            Partial file name
+        name : str
+            Name of uploaded file
+        size : int
+            Size of file
+        Returns
+        -------
+        str
+            file:// link of uploaded file
+        """
+        part = os.path.join(self.__directory, session)
+        path = os.path.join(self.__directory, name)
+        try:
+            os.replace(part, path)
+        except FileNotFoundError:
+            raise SessionLostError('{} no longer exists'.format(part))
+        return pathlib.Path(path).resolve().as_uri()
+
+class DropboxBackend(UploadBackend):
+    """
+    Uploads to Dropbox with its upload session API
+    Attributes
+    ----------
+    __folder : str
+        Dropbox folder files are uploaded to
+    __session : Session
+        HTTP session (kept alive between chunks)
+    """
+    def __init__(self, access_token=None, folder=DROPBOX_FOLDER):
+        """
+        Initializes the DropboxBackend
+        Parameters
+        ----------
+        access_token : str
+            Dropbox access token, read from the dropbox_uploader.sh config if None
+        folder : str
+            Dropbox folder files are uploaded to
+        """
+        if access_token is None:
+            access_token = read_dropbox_token()
+        self.__folder = folder
+        self.__session = requests.Session()
+        self.__session.headers.update({'Authorization': 'Bearer {}'.format(access_token),
+                                       'Content-Type': 'application/octet-stream'})
+
+    def start(self, name):
+        """
+        Starts a Dropbox upload session
+        Parameters
+        ----------
+        name : str
+            Name of uploaded file
+        Returns
+        -------
+        str
+            Upload session ID
+        """
+        return self.__call('start', {'close': False}).json()['session_id']
+
+    def append(self, session, offset, data):
+        """
+        Appends data to a Dropbox upload session, resyncing if Dropbox has a different offset
+        Parameters
+        ----------
+        session : str
+            Upload session ID
+        offset : int
+            Offset of data in file
+        data : bytes
+            Chunk of file
+        Returns
+        -------
+        int
+            Offset of next chunk
+        """
+        response = self.__call('append_v2', {'cursor': {'session_id': session, 'offset': offset}, 'close': False}, data, check=False)
+        if response.status_code == 409:
+            error = response.json().get('error', {})
+            if error.get('.tag') == 'incorrect_offset':
+                logging.warning('Dropbox has offset {} not {}'.format(error['correct_offset'], offset))
+                return error['correct_offset']
+            raise SessionLostError('Dropbox upload session failed: {}'.format(error.get('.tag')))
+        response.raise_for_status()
+        return offset + len(data)
+
+    def finish(self, session, name, size):
+        """
+        Commits a Dropbox upload session
+        Parameters
+        ----------
+        session : str
+            Upload session ID
+        name : str
+            Name of uploaded file
+        size : int
+            Size of file
+        Returns
+        -------
+        str
+            Dropbox access link
+        """
+        path = '{}/{}'.format(self.__folder, name)
+        self.__call('finish', {'cursor': {'session_id': session, 'offset': size},
+                               'commit': {'path': path, 'mode': 'overwrite'}})
+        return DROPBOX_LINK.format(self.__folder, quote(name))
+
+    def __call(self, endpoint, arg, data=b'', check=True):
+        """
+        Calls an upload session endpoint
+        Parameters
+        ----------
+        endpoint : str
+            Endpoint name
+        arg : dict
+            Dropbox-API-Arg
+        data : bytes
+            Request body
+        check : bool
+            Raise on error status
+        Returns
+        -------
+        response : Response
+            HTTP response
+        """
+        response = self.__session.post(DROPBOX_CONTENT_URL.format(endpoint), data=data, timeout=HTTP_TIMEOUT_SECS,
+                                       headers={'Dropbox-API-Arg': json.dumps(arg)})
+        if check:
+            response.raise_for_status()
+        return response
+
+def read_dropbox_token(config=DROPBOX_CONFIG):
+    """
+    Reads the access token saved by dropbox_uploader.sh
+    Parameters
+    ----------
+    config : str
+        dropbox_uploader.sh config file
+    Returns
+    -------
+    str
+        Dropbox access token
+    """
+    with open(os.path.expanduser(config)) as f:
+        for line in f:
+            key, _, value = line.strip().partition('=')
+            if key == DROPBOX_TOKEN_KEY:
+                return value.strip('"\'')
+    raise Exception('No {} in {}'.format(DROPBOX_TOKEN_KEY, config))
+
+def get_backend(name=None):
+    """
+    Gets the backend named by name or $HOMEPIXEL_UPLOAD: 'dropbox' (default) or 'dir:<directory>'
+    Parameters
+    ----------
+    name : str
+        Backend name
+    Returns
+    -------
+    UploadBackend
+        The backend
+    """
+    name = name or os.environ.get(UPLOAD_ENV, 'dropbox')
+    if name == 'dropbox':
+        return DropboxBackend()
+    if name.startswith('dir:'):
+        return LocalDirectoryBackend(name[len('dir:'):])
+    raise ValueError('Unknown upload backend: {}'.format(name))
+
+class Throttle:
+    """
+    Token bucket limiting bytes per second shared by all upload workers
+    Attributes
+    ----------
+    __rate : float
+        Max bytes per second, None for no limit
+    __allowance : float
+        Bytes that can be sent now (negative when in debt)
+    __last : float
+        Time allowance was last updated
+    __lock : Lock
+        Guards allowance
+    Methods
+    -------
+    consume(n)
+        Waits until n bytes may be sent
+    """
+    def __init__(self, rate):
+        """
+        Initializes the Throttle
+        Parameters
+        ----------
+        rate : float
+            Max bytes per second, None or 0 for no limit
+        """
+        self.__rate = rate or None
+        self.__allowance = rate or 0
+        self.__last = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def consume(self, n):
+        """
+        Waits until n bytes may be sent (chunks larger than one second's
+        worth go into debt paid off by the next caller)
+        Parameters
+        ----------
+        n : int
+            Bytes to send
+        """
+        if self.__rate is None:
+            return
+        with self.__lock:
+            now = time.monotonic()
+            self.__allowance = min(self.__rate, self.__allowance + (now - self.__last) * self.__rate)
+            self.__last = now
+            wait = max(0, -self.__allowance) / self.__rate
+            self.__allowance -= n
+        if wait:
+            time.sleep(wait)
+
+class UploadManager:
+    """
+    Persistent upload queue drained by parallel workers, resuming
+    interrupted uploads (also across restarts) and retrying with backoff
+    Attributes
+    ----------
+    __backend : UploadBackend
+        Where files are uploaded to
+    __db_file : str
+        sqlite DB file of the queue
+    __workers : int
+        Number of worker threads
+    __chunk_bytes : int
+        Bytes sent per chunk
+    __max_attempts : int
+        Attempts before an upload is marked failed
+    __backoff_secs : float
+        Delay before first retry, doubling each attempt
+    __on_uploaded : function
+        Called with (meta, link) after each upload
+    __throttle : Throttle
+        Bandwidth limit shared by workers
+    __lock : Lock
+        Guards claiming queued uploads
+    __changed : Condition
+        Notified when uploads are queued, finished or on stop
+    __stopping : Event
+        Set to stop workers
+    __threads : list
+        Worker threads
+    __stats : dict
+        Bytes sent, chunks sent & retry counts
+    Methods
+    -------
+    enqueue(file, name=None, meta=None)
+        Queues a file for upload
+    start()
+        Starts worker threads
+    stop()
+        Stops workers, keeping unfinished uploads queued
+    wait(upload_id, timeout=None)
+        Waits for an upload to finish
+    get_pending_files()
+        Gets files queued or being uploaded
+    get_stats()
+        Gets queue & transfer stats
+    """
+    def __init__(self, backend, db_file=c.UPLOAD_QUEUE_DB, workers=UPLOAD_WORKERS, chunk_bytes=CHUNK_BYTES,
+                 max_bytes_per_sec=None, max_attempts=MAX_ATTEMPTS, backoff_secs=BACKOFF_BASE_SECS, on_uploaded=None):
+        """
+        Initializes the UploadManager, requeuing uploads interrupted by a restart
+        Parameters
+        ----------
+        backend : UploadBackend
+            Where files are uploaded to
+        db_file : str
+            sqlite DB file of the queue
+        workers : int
+            Number of worker threads (uploads in parallel)
+        chunk_bytes : int
+            Bytes sent per chunk
+        max_bytes_per_sec : float
+            Bandwidth limit shared by workers, None for no limit
+        max_attempts : int
+            Attempts before an upload is marked failed
+        backoff_secs : float
+            Delay before first retry, doubling each attempt (up to BACKOFF_MAX_SECS)
+        on_uploaded : function
+            Called with (meta, link) after each upload
+        """
+        self.__backend = backend
+        self.__db_file = db_file
+        self.__workers = workers
+        self.__chunk_bytes = chunk_bytes
+        self.__max_attempts = max_attempts
+        self.__backoff_secs = backoff_secs
+        self.__on_uploaded = on_uploaded
+        self.__throttle = Throttle(max_bytes_per_sec)
+        self.__lock = threading.Lock()
+        self.__changed = threading.Condition()
+        self.__stopping = threading.Event()
+        self.__threads = []
+        self.__stats = {'bytes_sent': 0, 'chunks_sent': 0, 'retries': 0}
+
+        with DB_POOL.connection(self.__db_file) as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS uploads
+                            (id INTEGER PRIMARY KEY, file TEXT NOT NULL, name TEXT NOT NULL, meta TEXT,
+                             status TEXT NOT NULL, session TEXT, uploaded_bytes INTEGER NOT NULL DEFAULT 0,
+                             attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL DEFAULT 0,
+                             link TEXT, error TEXT)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS uploads_status ON uploads (status, next_attempt)')
+            conn.execute('UPDATE uploads SET status = ? WHERE status = ?', (PENDING, UPLOADING))
+            conn.commit()
+            enable_wal(conn)
+
+    def enqueue(self, file, name=None, meta=None):
+        """
+        Queues a file for upload
+        Parameters
+        ----------
+        file : str
+            Local file
+        name : str
+            Name of uploaded file, base name of file if None
+        meta : dict
+            JSON data passed to on_uploaded
+        Returns
+        -------
+        upload_id : int
+            ID of queued upload
+        """
+        with DB_POOL.connection(self.__db_file) as conn:
+            cursor = conn.execute('INSERT INTO uploads (file, name, meta, status) VALUES (?, ?, ?, ?)',
+                                  (file, name or os.path.basename(file), json.dumps(meta), PENDING))
+            conn.commit()
+        logging.debug('Queued {} for upload'.format(file))
+        with self.__changed:
+            self.__changed.notify_all()
+        return cursor.lastrowid
+
+    def start(self):
+        """
+        Starts worker threads
+        """
+        self.__stopping.clear()
+        for i in range(self.__workers):
+            thread = threading.Thread(target=self.__work, name='upload-{}'.format(i), daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+
+    def stop(self):
+        """
+        Stops workers after their current chunk, keeping unfinished uploads queued to resume on next start
+        """
+        self.__stopping.set()
+        with self.__changed:
+            self.__changed.notify_all()
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+
+    def wait(self, upload_id, timeout=None):
+        """
+        Waits for an upload to finish
+        Parameters
+        ----------
+        upload_id : int
+            ID from enqueue()
+        timeout : float
+            Max seconds to wait, None for no limit
+        Returns
+        -------
+        link : str
+            Access link, None if upload failed or timed out
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.__changed:
+            while True:
+                row = self.__get(upload_id)
+                if row['status'] in (DONE, FAILED):
+                    return row['link']
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.__changed.wait(remaining if remaining is not None else IDLE_WAIT_SECS)
+
+    def get_pending_files(self):
+        """
+        Gets files queued or being uploaded
+        Returns
+        -------
+        files : set
+            Local files
+        """
+        with DB_POOL.connection(self.__db_file) as conn:
+            rows = conn.execute('SELECT file FROM uploads WHERE status IN (?, ?)', (PENDING, UPLOADING))
+            return {row['file'] for row in rows}
+
+    def get_stats(self):
+        """
+        Gets queue & transfer stats
+        Returns
+        -------
+        stats : dict
+            Uploads per status, bytes & chunks sent, retries
+        """
+        with DB_POOL.connection(self.__db_file) as conn:
+            rows = conn.execute('SELECT status, COUNT(*) AS count FROM uploads GROUP BY status').fetchall()
+        with self.__lock:
+            stats = dict(self.__stats)
+        for status in (PENDING, UPLOADING, DONE, FAILED):
+            stats[status] = 0
+        stats.update({row['status']: row['count'] for row in rows})
+        return stats
+
+    def __get(self, upload_id):
+        """
+        Gets a queued upload
+        Parameters
+        ----------
+        upload_id : int
+            ID of upload
+        Returns
+        -------
+        row : Row
+            The upload
+        """
+        with DB_POOL.connection(self.__db_file) as conn:
+            return conn.execute('SELECT * FROM uploads WHERE id = ?', (upload_id,)).fetchone()
+
+    def __update(self, upload_id, **columns):
+        """
+        Updates columns of a queued upload
+        Parameters
+        ----------
+        upload_id : int
+            ID of upload
+        columns : dict
+            New values keyed by column
+        """
+        assignments = ', '.join('{} = ?'.format(column) for column in columns)
+        with DB_POOL.connection(self.__db_file) as conn:
+            conn.execute('UPDATE uploads SET {} WHERE id = ?'.format(assignments), (*columns.values(), upload_id))
+            conn.commit()
+
+    def __claim(self):
+        """
+        Claims the oldest upload due
+        Returns
+        -------
+        row : Row
+            The upload, None if none are due
+        wait : float
+            Seconds until next retry is due (IDLE_WAIT_SECS if none)
+        """
+        now = time.time()
+        with self.__lock, DB_POOL.connection(self.__db_file) as conn:
+            row = conn.execute('SELECT * FROM uploads WHERE status = ? ORDER BY next_attempt > ?, next_attempt, id LIMIT 1',
+                               (PENDING, now)).fetchone()
+            if row is None:
+                return None, IDLE_WAIT_SECS
+            if row['next_attempt'] > now:
+                return None, min(row['next_attempt'] - now, IDLE_WAIT_SECS)
+            conn.execute('UPDATE uploads SET status = ? WHERE id = ?', (UPLOADING, row['id']))
+            conn.commit()
+            return row, 0
+
+    def __work(self):
+        """
+        Worker thread: uploads queued files until stopped
+        """
+        while not self.__stopping.is_set():
+            row, wait = self.__claim()
+            if row is None:
+                with self.__changed:
+                    if not self.__stopping.is_set():
+                        self.__changed.wait(wait)
+                continue
+            self.__upload(row)
+            with self.__changed:
+                self.__changed.notify_all()
+
+    def __upload(self, row):
+        """
+        Uploads a claimed file from where it left off, scheduling a retry on failure
+        Parameters
+        ----------
+        row : Row
+            The upload
+        """
+        upload_id, session, offset = row['id'], row['session'], row['uploaded_bytes']
+        try:
+            size = os.path.getsize(row['file'])
+            if session is None:
+                session, offset = self.__backend.start(row['name']), 0
+                self.__update(upload_id, session=session, uploaded_bytes=offset)
+
+            with open(row['file'], 'rb') as f:
+                while offset < size:
+                    if self.__stopping.is_set():
+                        self.__update(upload_id, status=PENDING)
+                        return
+                    f.seek(offset)
+                    data = f.read(self.__chunk_bytes)
+                    self.__throttle.consume(len(data))
+                    offset = self.__backend.append(session, offset, data)
+                    self.__update(upload_id, uploaded_bytes=offset)
+                    with self.__lock:
+                        self.__stats['bytes_sent'] += len(data)
+                        self.__stats['chunks_sent'] += 1
+
+            link = self.__backend.finish(session, row['name'], size)
+        except FileNotFoundError as e:
+            logging.error('Upload {} failed: {}'.format(upload_id, e))
+            self.__update(upload_id, status=FAILED, error=str(e))
+            return
+        except BaseException as e:
+            lost = isinstance(e, SessionLostError)
+            self.__retry(row, e, session=None if lost else session, offset=0 if lost else offset)
+            return
+
+        self.__update(upload_id, status=DONE, uploaded_bytes=size, link=link, error=None)
+        logging.debug('Uploaded {} to {}'.format(row['file'], link))
+        if self.__on_uploaded is not None:
+            try:
+                self.__on_uploaded(json.loads(row['meta']), link)
+            except BaseException as e:
+                logging.error('Upload callback failed: {}'.format(e))
+
+    def __retry(self, row, error, session, offset):
+        """
+        Schedules a retry with exponential backoff & jitter, or marks the upload failed after max attempts
+        Parameters
+        ----------
+        row : Row
+            The upload
+        error : BaseException
+            Why upload failed
+        session : str
+            Upload session to resume, None to restart
+        offset : int
+            Offset to resume from
+        """
+        attempts = row['attempts'] + 1
+        if attempts >= self.__max_attempts:
+            logging.error('Upload {} failed after {} attempts: {}'.format(row['id'], attempts, error))
+            self.__update(row['id'], status=FAILED, attempts=attempts, error=str(error))
+            return
+
+        delay = min(self.__backoff_secs * 2 ** (attempts - 1), BACKOFF_MAX_SECS)
+        delay += random.uniform(0, delay / 2)
+        logging.warning('Upload {} failed ({}), retrying in {:.1f}s'.format(row['id'], error, delay))
+        self.__update(row['id'], status=PENDING, attempts=attempts, next_attempt=time.time() + delay,
+                      session=session, uploaded_bytes=offset, error=str(error))
+        with self.__lock:
+            self.__stats['retries'] += 1
@@ -4,4 +4,13 @@ echo "Running SecuritySystem node unittests..."
 python3 tests/test_securitysystem.py -v
 python3 tests/test_securitysystemclient.py -v
 python3 tests/test_securitysystemdb.py -v
-python3 tests/test_securitysystemthingspeak.py -v
\ No newline at end of file
+python3 tests/test_securitysystemframemotion.py -v
+python3 tests/test_securitysystemmotionevents.py -v
+python3 tests/test_securitysystemmp4mux.py -v
+python3 tests/test_securitysystemnotifier.py -v
+python3 tests/test_securitysystempatrol.py -v
+python3 tests/test_securitysystempipeline.py -v
+python3 tests/test_securitysystemservocontroller.py -v
+python3 tests/test_securitysystemthingspeak.py -v
+python3 tests/test_securitysystemthingspeakbatch.py -v
+python3 tests/test_securitysystemuploadmanager.py -v
\ No newline at end of file
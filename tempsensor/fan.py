@@ -8,21 +8,29 @@ from time import sleep
 
 FAN_PIN = 23 #FAN pin on RPi
 FAN_TEST_TIME = 5
+FAN_PWM_FREQ = 25 #Hz of PWM when the fan speed is controlled
+FULL_DUTY = 100
 
 class Fan:
 	"""
 	Class to represent Fan Actuator
 	"""
 
-	def __init__(self, pin=FAN_PIN):
+	def __init__(self, pin=FAN_PIN, pwm_freq=None):
 		"""
-		Initialize Fan
+		Initialize Fan (speed controlled by PWM if given a frequency, otherwise ON/OFF)
 		"""
 
 		self.__pin = pin
+		self.__fan_on = 0
+		self.__duty = 0
 		GPIO.setmode(GPIO.BCM)
 		GPIO.setwarnings(False)
 		GPIO.setup(self.__pin, GPIO.OUT)
+		self.__pwm = None
+		if pwm_freq is not None:
+			self.__pwm = GPIO.PWM(self.__pin, pwm_freq)
+			self.__pwm.start(0)
 
 	def get_status(self):
 		"""
@@ -30,21 +38,37 @@ class Fan:
 		"""
 		return self.__fan_on
 
+	def get_duty(self):
+		"""
+		Returns duty (0-100 %) of Fan
+		"""
+		return self.__duty
+
+	def set_duty(self, duty):
+		"""
+		Method will run the Fan at a duty (0-100 %), fully ON for any duty without PWM
+		"""
+
+		if duty == self.__duty:
+			return
+		self.__output(duty)
+
+		logging.debug("FAN: duty {}%".format(duty))
+		self.__fan_on = 1 if duty > 0 else 0
+
 	def hot_status(self, status):
 		"""
 		Method will turn the Fan ON when called
 		"""
 
-		output_gpio = GPIO.HIGH
-		GPIO.output(self.__pin, output_gpio)
+		self.__output(FULL_DUTY)
 
 		output_string = "ROOM TOO HOT - ON"
 		logging.debug("FAN: {}".format(output_string))
 		self.__fan_on = status
 
 	def room_status(self, status):
-		output_gpio = GPIO.LOW
-		GPIO.output(self.__pin, output_gpio)
+		self.__output(0)
 
 		output_string = "ROOM @ GOOD TEMP - OFF"
 		logging.debug("FAN: {}".format(output_string))
@@ -54,14 +78,24 @@ class Fan:
 		"""
 		Method will turn the Fan OFF when called
 		"""
-		output_gpio = GPIO.LOW
-		GPIO.output(self.__pin, output_gpio)
+		self.__output(0)
 
 		output_string = "ROOM TOO COLD - OFF"
 		logging.debug("FAN: {}".format(output_string))
 		status = 0
 		self.__fan_on = status
 
+	def __output(self, duty):
+		"""
+		Drives the Fan pin at a duty, by PWM or ON/OFF
+		"""
+
+		if self.__pwm is not None:
+			self.__pwm.ChangeDutyCycle(duty)
+		else:
+			GPIO.output(self.__pin, GPIO.HIGH if duty > 0 else GPIO.LOW)
+		self.__duty = duty
+
 def fan_test():
 	fanTest = Fan()
 	fanTest.hot_status(True)
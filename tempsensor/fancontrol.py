@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Purpose - Decides how hard the fan runs for a temperature reading
+"""
+import abc
+import logging
+import time
+
+SETPOINT = 25 #Degrees C the room is kept at
+HYSTERESIS_BAND = 1.0 #Fan turns ON above SETPOINT + band/2 and OFF below SETPOINT - band/2
+MIN_ON_SEC = 60 #Fan stays ON at least this long once turned on
+MIN_OFF_SEC = 60 #Fan stays OFF at least this long once turned off
+KP = 20.0 #PID gains, duty (%) per degree C above SETPOINT
+KI = 0.1
+KD = 0.0
+MIN_DUTY = 30 #Duty (%) below which the fan stalls, so it is turned OFF instead
+MAX_DUTY = 100
+HYSTERESIS = 'hysteresis'
+PID = 'pid'
+
+DEFAULT_CONTROL = {'mode': HYSTERESIS, 'setpoint': SETPOINT}
+
+#Control settings per location (owner_room), overriding DEFAULT_CONTROL
+LOCATION_CONTROLS = {}
+
+class FanControl(abc.ABC):
+	"""
+	Base of fan control engines, keeping the fan ON or OFF for a minimum dwell time between flips
+	"""
+
+	def __init__(self, setpoint=SETPOINT, min_on_sec=MIN_ON_SEC, min_off_sec=MIN_OFF_SEC):
+		"""
+		Initializes the attributes
+		"""
+
+		self.setpoint = setpoint
+		self.__min_on_sec = min_on_sec
+		self.__min_off_sec = min_off_sec
+		self.__duty = 0
+		self.__changed = None
+		self.__stats = {'updates': 0, 'flips': 0, 'held': 0}
+
+	def update(self, temp, now=None):
+		"""
+		Returns fan duty (0-100 %) for a reading, flipping ON/OFF only once the dwell time has passed
+		"""
+
+		now = time.monotonic() if now is None else now
+		self.__stats['updates'] += 1
+		duty = self._compute(temp, now)
+
+		if (duty > 0) != (self.__duty > 0):
+			dwell = self.__min_on_sec if self.__duty > 0 else self.__min_off_sec
+			if self.__changed is not None and now - self.__changed < dwell:
+				self.__stats['held'] += 1
+				logging.debug('Fan held {} for dwell time'.format('ON' if self.__duty > 0 else 'OFF'))
+				return self.__duty
+			self.__changed = now
+			self.__stats['flips'] += 1
+
+		self.__duty = duty
+		return duty
+
+	def get_duty(self):
+		"""
+		Returns the last fan duty (0-100 %)
+		"""
+		return self.__duty
+
+	def get_stats(self):
+		"""
+		Returns counts of updates, fan flips and flips held back by the dwell time
+		"""
+		return dict(self.__stats)
+
+	@abc.abstractmethod
+	def _compute(self, temp, now):
+		"""
+		Returns the duty wanted for a reading, before the dwell time is applied
+		"""
+		pass
+
+class HysteresisControl(FanControl):
+	"""
+	ON/OFF control with a band around the setpoint, so the fan does not chatter near it
+	"""
+
+	def __init__(self, setpoint=SETPOINT, band=HYSTERESIS_BAND, **kwargs):
+		"""
+		Initializes the attributes
+		"""
+
+		super().__init__(setpoint, **kwargs)
+		self.__band = band
+
+	def _compute(self, temp, now):
+		"""
+		Returns full duty above the band, 0 below it, and the last duty inside it
+		"""
+		if temp >= self.setpoint + self.__band / 2:
+			return MAX_DUTY
+		if temp <= self.setpoint - self.__band / 2:
+			return 0
+		return self.get_duty()
+
+class PIDControl(FanControl):
+	"""
+	PID control of the fan duty (PWM), cooling towards the setpoint
+	"""
+
+	def __init__(self, setpoint=SETPOINT, kp=KP, ki=KI, kd=KD, min_duty=MIN_DUTY, **kwargs):
+		"""
+		Initializes the attributes
+		"""
+
+		super().__init__(setpoint, **kwargs)
+		self.__kp = kp
+		self.__ki = ki
+		self.__kd = kd
+		self.__min_duty = min_duty
+		self.__integral = 0
+		self.__last_temp = None
+		self.__last_time = None
+
+	def _compute(self, temp, now):
+		"""
+		Returns the PID duty, 0 below the duty the fan stalls at
+		"""
+
+		error = temp - self.setpoint #Positive when too hot
+		dt = 0 if self.__last_time is None else now - self.__last_time
+		derivative = (temp - self.__last_temp) / dt if dt > 0 else 0 #On the reading, so setpoint changes do not kick
+		self.__last_temp = temp
+		self.__last_time = now
+
+		self.__integral += error * dt
+		if self.__ki:
+			#Anti-windup: the integral alone never asks for more than full duty, or less than none
+			self.__integral = max(0, min(MAX_DUTY / self.__ki, self.__integral))
+
+		duty = self.__kp * error + self.__ki * self.__integral + self.__kd * derivative
+		duty = max(0, min(MAX_DUTY, duty))
+		return duty if duty >= self.__min_duty else 0
+
+def make_control(location, **overrides):
+	"""
+	Returns the fan control engine configured for a location
+	"""
+
+	settings = dict(DEFAULT_CONTROL)
+	settings.update(LOCATION_CONTROLS.get(location, {}))
+	settings.update({name: value for name, value in overrides.items() if value is not None})
+
+	mode = settings.pop('mode')
+	if mode == HYSTERESIS:
+		return HysteresisControl(**settings)
+	if mode == PID:
+		return PIDControl(**settings)
+	raise ValueError('Unknown fan control mode: {}'.format(mode))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Purpose - Decides which TempSensor readings are worth writing to the channel
+"""
+import logging
+import time
+
+ABS_DEADBAND = 0.5 #Degrees C a reading must move from the last one reported
+REL_DEADBAND = 0.0 #Fraction of the last reported value, used when wider than ABS_DEADBAND
+MAX_SILENCE_SEC = 300 #Reporting at least this often, so a quiet channel still shows the node is alive
+
+#Reasons for a report
+FIRST = 'first'
+FAN_CHANGED = 'fan'
+TEMP_CHANGED = 'temp'
+HEARTBEAT = 'heartbeat'
+
+class ReportPolicy:
+	"""
+	Change-only reporting: deadband on temperature, immediate send on fan change, heartbeat when silent
+	"""
+
+	def __init__(self, abs_deadband=ABS_DEADBAND, rel_deadband=REL_DEADBAND, max_silence=MAX_SILENCE_SEC):
+		"""
+		Initializes the attributes
+		"""
+
+		self.__abs_deadband = abs_deadband
+		self.__rel_deadband = rel_deadband
+		self.__max_silence = max_silence
+		self.__last_temp = None
+		self.__last_fan = None
+		self.__last_time = None
+		self.__stats = {'readings': 0, 'reports': 0, 'suppressed': 0}
+
+	def check(self, temp, fan_status, now=None):
+		"""
+		Returns why a reading should be reported (remembering it as the last report), None to skip it
+		"""
+
+		now = time.monotonic() if now is None else now
+		self.__stats['readings'] += 1
+
+		if self.__last_time is None:
+			reason = FIRST
+		elif fan_status != self.__last_fan:
+			reason = FAN_CHANGED
+		elif abs(temp - self.__last_temp) >= self.deadband():
+			reason = TEMP_CHANGED
+		elif now - self.__last_time >= self.__max_silence:
+			reason = HEARTBEAT
+		else:
+			self.__stats['suppressed'] += 1
+			return None
+
+		logging.debug('Reporting reading ({}): {} fan {}'.format(reason, temp, fan_status))
+		self.__last_temp = temp
+		self.__last_fan = fan_status
+		self.__last_time = now
+		self.__stats['reports'] += 1
+		return reason
+
+	def deadband(self):
+		"""
+		Returns how far a reading must move from the last one reported
+		"""
+		if self.__last_temp is None:
+			return self.__abs_deadband
+		return max(self.__abs_deadband, self.__rel_deadband * abs(self.__last_temp))
+
+	def get_stats(self):
+		"""
+		Returns counts of readings checked, reported and suppressed
+		"""
+		return dict(self.__stats)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Purpose - Samples a sensor at a fixed rate in the background and keeps filtered readings in memory
+"""
+import logging
+import statistics
+import threading
+import time
+from array import array
+
+SAMPLE_PERIOD_SEC = 0.5 #Seconds between sensor samples
+SAMPLE_WINDOW = 9 #Samples the median is taken over (odd, so it is a real sample)
+EMA_ALPHA = 0.3 #Weight of the newest median in the moving average, 1 for no smoothing
+STALE_PERIODS = 5 #Filtered values are stale once the last good sample is this many periods old
+
+class RingBuffer:
+	"""
+	Fixed-size buffer of floats backed by an array, overwriting the oldest value when full
+	"""
+
+	def __init__(self, size):
+		"""
+		Initializes the attributes
+		"""
+
+		self.__values = array('d', [0.0] * size)
+		self.__next = 0
+		self.__count = 0
+
+	def __len__(self):
+		"""
+		Returns number of values held
+		"""
+		return self.__count
+
+	def append(self, value):
+		"""
+		Adds a value, overwriting the oldest when full
+		"""
+
+		self.__values[self.__next] = value
+		self.__next = (self.__next + 1) % len(self.__values)
+		self.__count = min(self.__count + 1, len(self.__values))
+
+	def values(self):
+		"""
+		Returns values held, oldest first
+		"""
+
+		if self.__count < len(self.__values):
+			return self.__values[:self.__count].tolist()
+		return (self.__values[self.__next:] + self.__values[:self.__next]).tolist()
+
+	def median(self):
+		"""
+		Returns median of values held
+		"""
+		return statistics.median(self.values())
+
+class Sampler:
+	"""
+	Background thread reading a sensor every period, filtering each field by a median over a window then an EMA
+	"""
+
+	def __init__(self, read, fields, period=SAMPLE_PERIOD_SEC, window=SAMPLE_WINDOW, alpha=EMA_ALPHA):
+		"""
+		Initializes the attributes
+		"""
+
+		self.__read = read #Returns one value per field
+		self.__fields = fields
+		self.__period = period
+		self.__alpha = alpha
+		self.__buffers = {field: RingBuffer(window) for field in fields}
+		self.__filtered = None
+		self.__sampled = None #Time of the last good sample
+		self.__lock = threading.Lock()
+		self.__stop = threading.Event()
+		self.__thread = None
+		self.__stats = {'samples': 0, 'errors': 0}
+
+	def start(self):
+		"""
+		Takes a first sample and starts the sampling thread, if not already running
+		"""
+
+		with self.__lock:
+			if self.__thread is not None:
+				return
+			self.__stop.clear()
+			self.__thread = threading.Thread(target=self.__run, name='sampler', daemon=True)
+		self.__sample() #So readers have a value as soon as start returns
+		self.__thread.start()
+
+	def stop(self):
+		"""
+		Stops the sampling thread
+		"""
+
+		with self.__lock:
+			thread = self.__thread
+			self.__thread = None
+		if thread is not None:
+			self.__stop.set()
+			thread.join()
+
+	def get_latest(self):
+		"""
+		Returns latest filtered value of each field, None before the first sample
+		"""
+
+		with self.__lock:
+			return dict(self.__filtered) if self.__filtered is not None else None
+
+	@property
+	def stale_secs(self):
+		"""
+		Returns age (seconds) of the last good sample past which filtered values are stale
+		"""
+		return self.__period * STALE_PERIODS
+
+	def get_age(self):
+		"""
+		Returns seconds since the last good sample, None before the first one
+		"""
+
+		with self.__lock:
+			return time.monotonic() - self.__sampled if self.__sampled is not None else None
+
+	def get_stats(self):
+		"""
+		Returns counts of samples taken and failed
+		"""
+
+		with self.__lock:
+			return dict(self.__stats)
+
+	def __run(self):
+		"""
+		Sampling thread: samples every period without drifting, until stopped
+		"""
+
+		deadline = time.monotonic() + self.__period
+		while not self.__stop.wait(max(0, deadline - time.monotonic())):
+			self.__sample()
+			deadline += self.__period
+			if deadline <= time.monotonic():
+				deadline = time.monotonic() + self.__period #Fell behind (slow bus): skip missed samples
+
+	def __sample(self):
+		"""
+		Reads the sensor and updates the filtered values
+		"""
+
+		try:
+			values = self.__read()
+		except Exception as e:
+			logging.error('Sensor read failed: {}'.format(e))
+			with self.__lock:
+				self.__stats['errors'] += 1
+			return
+
+		with self.__lock:
+			filtered = {}
+			for field, value in zip(self.__fields, values):
+				buffer = self.__buffers[field]
+				buffer.append(value)
+				median = buffer.median()
+				last = self.__filtered[field] if self.__filtered is not None else median
+				filtered[field] = self.__alpha * median + (1 - self.__alpha) * last
+			self.__filtered = filtered
+			self.__sampled = time.monotonic()
+			self.__stats['samples'] += 1
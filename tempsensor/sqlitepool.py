@@ -0,0 +1,142 @@
+import sqlite3
+import threading
+import logging
+import os
+from contextlib import contextmanager
+
+#Per-connection tuning (WAL itself is persistent, see enable_wal())
+SYNCHRONOUS = 'NORMAL'
+CACHE_SIZE_KIB = 8000
+MMAP_SIZE_BYTES = 64 * 1024 * 1024
+BUSY_TIMEOUT_SECS = 5
+MAX_IDLE_PER_DB = 4
+WAL_MODE = 'wal'
+
+class ConnectionPool:
+	"""
+	Pool of long-lived sqlite connections, each used by one thread at a time
+	"""
+
+	def __init__(self, max_idle = MAX_IDLE_PER_DB):
+		"""
+		Initializes ConnectionPool
+		"""
+		self.__max_idle = max_idle
+		self.__idle = {} #idle (connection, file ID) keyed by DB file path
+		self.__open = {} #(DB file path, file ID) of connections in use keyed by id()
+		self.__lock = threading.Lock()
+		self.__stats = {'hits': 0, 'misses': 0, 'stale': 0, 'discarded': 0}
+
+	def acquire(self, db_file):
+		"""
+		Returning an idle connection to the DB file or a new one
+		Idle connections to a file since deleted or replaced are closed
+		"""
+		path = os.path.abspath(db_file)
+		file_id = _file_id(path)
+
+		with self.__lock:
+			idle = self.__idle.get(path, [])
+			while idle:
+				conn, conn_file_id = idle.pop()
+				if conn_file_id == file_id:
+					self.__stats['hits'] += 1
+					self.__open[id(conn)] = (path, conn_file_id)
+					return conn
+
+				self.__stats['stale'] += 1
+				conn.close()
+
+			self.__stats['misses'] += 1
+
+		conn = self.__connect(path)
+		with self.__lock:
+			self.__open[id(conn)] = (path, _file_id(path))
+		return conn
+
+	def release(self, conn):
+		"""
+		Returning connection to the pool, closed if enough are already idle
+		"""
+		if conn.in_transaction:
+			conn.rollback()
+
+		with self.__lock:
+			path, file_id = self.__open.pop(id(conn), (None, None))
+			if path is not None:
+				idle = self.__idle.setdefault(path, [])
+				if len(idle) < self.__max_idle:
+					idle.append((conn, file_id))
+					return
+
+			self.__stats['discarded'] += 1
+		conn.close()
+
+	@contextmanager
+	def connection(self, db_file):
+		"""
+		Context manager to acquire & release a connection
+		"""
+		conn = self.acquire(db_file)
+		try:
+			yield conn
+		finally:
+			self.release(conn)
+
+	def get_stats(self):
+		"""
+		Returning pool hit/miss stats
+		"""
+		with self.__lock:
+			stats = dict(self.__stats)
+			stats['in_use'] = len(self.__open)
+			stats['idle'] = sum(len(i) for i in self.__idle.values())
+
+		logging.debug('Connection pool stats: {}'.format(stats))
+		return stats
+
+	def close_all(self):
+		"""
+		Closing all idle connections
+		"""
+		with self.__lock:
+			idle, self.__idle = self.__idle, {}
+
+		for connections in idle.values():
+			for conn, _ in connections:
+				conn.close()
+
+	def __connect(self, path):
+		"""
+		Opening new tuned connection
+		"""
+		logging.debug('Opening new connection to {}'.format(path))
+		conn = sqlite3.connect(path, timeout = BUSY_TIMEOUT_SECS, check_same_thread = False)
+		conn.row_factory = sqlite3.Row #Set row_factory to access columns by name
+
+		conn.execute('PRAGMA synchronous = {}'.format(SYNCHRONOUS))
+		conn.execute('PRAGMA cache_size = -{:d}'.format(CACHE_SIZE_KIB))
+		conn.execute('PRAGMA mmap_size = {:d}'.format(MMAP_SIZE_BYTES))
+		return conn
+
+def enable_wal(conn):
+	"""
+	Switching DB file to write-ahead logging (persistent, once per file)
+	Returning True if DB file is in WAL mode
+	"""
+	mode = conn.execute('PRAGMA journal_mode = {}'.format(WAL_MODE))
+	return mode.fetchone()[0] == WAL_MODE
+
+def _file_id(path):
+	"""
+	Returning device & inode of DB file, None if it does not exist
+	"""
+	try:
+		stat = os.stat(path)
+	except FileNotFoundError:
+		return None
+
+	return stat.st_dev, stat.st_ino
+
+#Pool shared by every SqliteDB in this process
+DB_POOL = ConnectionPool()
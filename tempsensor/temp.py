@@ -5,24 +5,52 @@ import smbus2
 import bme280
 from time import sleep
 from datetime import datetime
+from sampler import Sampler, SAMPLE_PERIOD_SEC, SAMPLE_WINDOW, EMA_ALPHA
+
+FIELDS = ('temperature', 'humidity', 'pressure')
 
 class Temperature:
-	def __init__(self, poll_time = 1):
+	def __init__(self, poll_time = 1, sample_period = SAMPLE_PERIOD_SEC, window = SAMPLE_WINDOW, alpha = EMA_ALPHA):
 		self._bus = smbus2.SMBus(1)
 		self._address = 0x77 #Checking to see if the temperature sensor is properly communicating with the RPi
 		self._calibration_params = bme280.load_calibration_params(self._bus,self._address) #Calibrating the bme280 temperature sensor
 		self._temp_poll_time = poll_time #Polling for the given time
 		self._data = dict()
+		self._sampler = Sampler(self._sample, FIELDS, sample_period, window, alpha) #Oversampling in the background, started on first read
+
+	def _sample(self):
+		self._data = bme280.sample(self._bus, self._address, self._calibration_params) #Taking in a single reading (sampler thread only)
+		return self._data.temperature, self._data.humidity, self._data.pressure
+
+	def read_all(self):
+		self._sampler.start() #No-op once running
+		age = self._sampler.get_age()
+		if age is None:
+			raise OSError('No reading from temperature sensor')
+		if age > self._sampler.stale_secs: #Sensor stopped answering, the last reading is not live anymore
+			raise OSError('Temperature sensor reading is stale ({:.1f}s old)'.format(age))
+		return self._sampler.get_latest() #Filtered readings from memory, no I2C
 
 	def read_data(self):
-		self._data = bme280.sample(self._bus, self._address, self._calibration_params) #Taking in a single temperature reading
-		return self._data.temperature #Returning the reading
+		return self.read_all()['temperature'] #Returning the filtered temperature
+
+	def read_humidity(self):
+		return self.read_all()['humidity']
+
+	def read_pressure(self):
+		return self.read_all()['pressure']
+
+	def stop(self):
+		self._sampler.stop()
 
 def temperature_test():
 	sensor = Temperature()
 	while True:
 		logging.info("Reading Sensor")
-		logging.info("Temperature Read: " + str(sensor.read_data()))
+		readings = sensor.read_all()
+		logging.info("Temperature Read: " + str(readings['temperature']))
+		logging.info("Humidity Read: " + str(readings['humidity']))
+		logging.info("Pressure Read: " + str(readings['pressure']))
 		sleep(sensor._temp_poll_time)
 
 if __name__ == "__main__":
@@ -1,13 +1,28 @@
 import abc
-import sqlite3
 import logging
 import argparse
 import os
+import calendar
 import thingspeakinfo as c
+from sqlitepool import DB_POOL, enable_wal
 from datetime import datetime
 
 FIRST_ROW = 0
 SINGLE_RECORD = 1
+NO_RECORDS = 0
+UNIQUE_COLUMNS = 'date, time, location, nodeID'
+DATE_COLUMN = 0
+TIME_COLUMN = 1
+
+#Record timestamp (seconds since epoch of the record's date & time)
+TIMESTAMP_COLUMN = 'timestamp'
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+TIMESTAMP_SQL = "cast(strftime('%s', date || ' ' || time) as integer)"
+
+#Schema version of each table (one per migration step), stored per table
+#in SCHEMA_VERSION_TABLE since several tables can share a DB file
+SCHEMA_VERSION = 3
+SCHEMA_VERSION_TABLE = 'SchemaVersion'
 
 class SqliteDB(metaclass=abc.ABCMeta):
 	"""
@@ -38,13 +53,13 @@ class SqliteDB(metaclass=abc.ABCMeta):
 		self.manual_exit()
 
 	def manual_enter(self):
-		self._dbconnect = sqlite3.connect(self._db_file)
-		self._dbconnect.row_factory = sqlite3.Row #Set row_factory to access columns by name
+		self._dbconnect = DB_POOL.acquire(self._db_file) #Pooled connection, row_factory set to sqlite3.Row
 		self._cursor = self._dbconnect.cursor() #Create a cursor to work with the db
 
 	def manual_exit(self):
 		self._dbconnect.commit()
-		self._dbconnect.close()
+		self._cursor.close()
+		DB_POOL.release(self._dbconnect)
 		self._dbconnect = None
 		self._cursor = None
 
@@ -65,6 +80,175 @@ class SqliteDB(metaclass=abc.ABCMeta):
 		logging.debug('Table exists? : {}'.format(table_exists))
 		return table_exists
 
+	def get_schema_version(self):
+		"""
+		Returning the schema version of the table, 0 if never migrated
+		"""
+
+		self.__create_schema_version_table()
+		self._cursor.execute("SELECT version FROM {} WHERE tableName = ?".format(SCHEMA_VERSION_TABLE), (self._name,))
+		row = self._cursor.fetchone()
+		version = row[FIRST_ROW] if row else 0
+
+		logging.debug('Schema version: {}'.format(version))
+		return version
+
+	def migrate(self):
+		"""
+		Creating the table, or upgrading an existing table in place to
+		the latest schema. Each migration step is applied in its own
+		transaction together with the table's new schema version.
+		Tables migrated before versions were kept per table start
+		again from the first step, as every step can be rerun.
+		Also switching the DB file to WAL mode
+		"""
+
+		if not self._dbconnect or not self._cursor:
+			raise Exception('Invalid call to Context Manager method!')
+
+		self._dbconnect.commit() #Journal mode can't change inside a transaction
+		if not enable_wal(self._dbconnect):
+			logging.warning('WAL mode not available for {}'.format(self._db_file))
+
+		if not self.table_exists():
+			self.create_table()
+			return
+
+		migrations = [self.create_unique_index,
+			      self.__create_location_index,
+			      self.__add_timestamp_column]
+		version = self.get_schema_version()
+		self._dbconnect.commit()
+
+		for new_version, migration in enumerate(migrations, start = 1):
+			if new_version <= version:
+				continue
+
+			logging.info('Migrating table {} to schema version {}'.format(self._name, new_version))
+			self._cursor.execute('BEGIN')
+			try:
+				migration()
+				self.__set_schema_version(new_version)
+			except BaseException:
+				self._dbconnect.rollback()
+				raise
+			self._dbconnect.commit()
+
+	def __set_schema_version(self, version):
+		self.__create_schema_version_table()
+		self._cursor.execute("insert or replace into {} values(?, ?)".format(SCHEMA_VERSION_TABLE),
+			(self._name, version))
+
+	def __create_schema_version_table(self):
+		self._cursor.execute("create table if not exists {} (tableName text primary key, version integer)".format(
+			SCHEMA_VERSION_TABLE))
+
+	def __create_location_index(self):
+		self._cursor.execute("create index if not exists {name}_location on {name} (location)".format(
+			name = self._name))
+
+	def __create_timestamp_index(self):
+		self._cursor.execute("create index if not exists {name}_timestamp on {name} ({col})".format(
+			name = self._name, col = TIMESTAMP_COLUMN))
+
+	def __add_timestamp_column(self):
+		"""
+		Adding the timestamp column to a table created without it
+		and filling it in from the date & time of existing records
+		"""
+
+		self._cursor.execute('PRAGMA table_info({})'.format(self._name))
+		columns = [r['name'] for r in self._cursor.fetchall()]
+
+		if TIMESTAMP_COLUMN not in columns:
+			self._cursor.execute("alter table {} add column {} integer".format(
+				self._name, TIMESTAMP_COLUMN))
+
+		self._cursor.execute("update {} set {} = {}".format(
+			self._name, TIMESTAMP_COLUMN, TIMESTAMP_SQL))
+		self.__create_timestamp_index()
+
+	def _create_indexes(self):
+		"""
+		Creating all indexes of the latest schema on a new table
+		and marking the table as being at the latest schema version
+		"""
+
+		self.create_unique_index()
+		self.__create_location_index()
+		self.__create_timestamp_index()
+		self.__set_schema_version(SCHEMA_VERSION)
+
+	def _insert_statement(self, ignore=False):
+		"""
+		Returning the SQL statement to insert a record & its timestamp
+		"""
+
+		columns = self._columns + (TIMESTAMP_COLUMN,)
+		return "insert {ignore}into {name} ({cols}) values({values})".format(
+			ignore = 'or ignore ' if ignore else '',
+			name = self._name,
+			cols = ', '.join(columns),
+			values = ', '.join('?' * len(columns)))
+
+	def _row(self, record):
+		"""
+		Returning the row values of a record followed by its timestamp
+		"""
+
+		values = self._record_values(record)
+		timestamp = record_timestamp(values[DATE_COLUMN], values[TIME_COLUMN])
+		return values + (timestamp,)
+
+	def create_unique_index(self):
+		"""
+		Creating a unique index on (date, time, location, nodeID)
+		so add_records can skip existing records without a lookup.
+		Duplicate records already in the table are deleted first,
+		keeping the first row of each, and the number deleted is logged
+		"""
+
+		if not self._dbconnect or not self._cursor:
+			raise Exception('Invalid call to Context Manager method!')
+
+		index_name = '{}_unique'.format(self._name)
+		self._cursor.execute("SELECT count(name) FROM sqlite_master WHERE \
+			       type = 'index' AND name = ?", (index_name,))
+
+		if self._cursor.fetchone()[FIRST_ROW] == SINGLE_RECORD:
+			return
+
+		logging.debug('Creating unique index on table')
+		self._cursor.execute("delete from {name} where rowid not in \
+			(select min(rowid) from {name} group by {cols})".format(
+			name = self._name, cols = UNIQUE_COLUMNS))
+		if self._cursor.rowcount > 0:
+			logging.warning('Deleted {} duplicate records from table {}'.format(self._cursor.rowcount, self._name))
+		self._cursor.execute("create unique index {index} on {name} ({cols})".format(
+			index = index_name, name = self._name, cols = UNIQUE_COLUMNS))
+
+	def add_records(self, records):
+		"""
+		Adding a batch of data to the table in one statement & transaction.
+		Data already in the table is skipped by the unique index.
+		Returns the number of new records added
+		"""
+
+		logging.debug('Adding {} entries to table'.format(len(records)))
+		if not self._dbconnect or not self._cursor:
+			raise Exception('Invalid call to Context Manager method!')
+
+		rows = [self._row(r) for r in records]
+		if not rows:
+			return NO_RECORDS
+
+		changes = self._dbconnect.total_changes
+		self._cursor.executemany(self._insert_statement(ignore = True), rows)
+
+		added = self._dbconnect.total_changes - changes
+		logging.debug('New entries added: {}'.format(added))
+		return added
+
 	@abc.abstractmethod
 	def create_table(self):
 		pass
@@ -73,6 +257,10 @@ class SqliteDB(metaclass=abc.ABCMeta):
 	def add_record(self, record):
 		pass
 
+	@abc.abstractmethod
+	def _record_values(self, record):
+		pass
+
 	@abc.abstractmethod
 	def record_exists(self, record):
 		pass
@@ -86,6 +274,7 @@ class TempDB(SqliteDB):
 	"""
 	Database for TempDB node
 	"""
+	_columns = ('date', 'time', 'location', 'nodeID', 'fanStatus', 'tempVal')
 
 	def __init__(self, db_file=c.TEMP_SENSOR_DB_FILE, name=c.TEMP_SENSOR_TABLE):
         	super().__init__(db_file, name)
@@ -103,7 +292,8 @@ class TempDB(SqliteDB):
 		self._cursor.execute(
 			"create table {} (date text, \
 			 time text, location text, nodeID text, \
-			 fanStatus integer, tempVal float)".format(self._name))
+			 fanStatus integer, tempVal float, timestamp integer)".format(self._name))
+		self._create_indexes()
 
 	def add_record(self, record):
 		"""
@@ -114,6 +304,13 @@ class TempDB(SqliteDB):
 		if not self._dbconnect or not self._cursor:
 			raise Exception('Invalid call to context Manager method!')
 
+		self._cursor.execute(self._insert_statement(), self._row(record))
+
+	def _record_values(self, record):
+		"""
+		Returning the row values of a TempSensorDB record
+		"""
+
 		#Fields being stored
 		date = record.get('date', '')
 		time = record.get('time', '')
@@ -125,9 +322,7 @@ class TempDB(SqliteDB):
 		if '' in (date, time, node_id, location, fan_status, temp_val):
 			raise Exception('Invalid TempSensorDB record!')
 
-		self._cursor.execute(
-			"insert into {} values(?, ?, ?, ?, ?, ?)".format(self._name),
-			(date, time, location, node_id, fan_status, temp_val))
+		return date, time, location, node_id, fan_status, temp_val
 
 	def record_exists(self, record):
 		"""
@@ -179,6 +374,19 @@ class TempDB(SqliteDB):
 
 		return records
 
+def record_timestamp(date, time):
+	"""
+	Returning the timestamp stored with a record, matching TIMESTAMP_SQL
+	(None if the date & time cannot be parsed)
+	"""
+
+	try:
+		date_time = datetime.strptime('{} {}'.format(date, time), TIMESTAMP_FORMAT)
+	except ValueError:
+		return None
+
+	return calendar.timegm(date_time.timetuple())
+
 def records_to_string(records):
 	records_str = '    date|time|location|nodeID|fanStatus|tempVal'
 	for r in records:
@@ -218,14 +426,11 @@ def temp_sensor_db_test(file_name, table_name, location, node_id):
 	logging.info(info_str)
 
 	with TempDB(db_file=file_name, name=table_name) as db_obj:
-		logging.info('Checking & Creating table if needed')
-		if not db_obj.table_exists():
-			db_obj.create_table()
+		logging.info('Creating or upgrading table if needed')
+		db_obj.migrate()
 
 		logging.info('Adding only the new records to table')
-		for r in records:
-			if not db_obj.record_exists(r):
-				db_obj.add_record(r)
+		db_obj.add_records(records)
 
 		logging.info('Retrieving all records')
 		record = db_obj.get_records()
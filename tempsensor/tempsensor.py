@@ -2,22 +2,23 @@
 
 import RPi.GPIO as GPIO
 import time
-from fan import Fan
+from fan import Fan, FAN_PWM_FREQ
+from fancontrol import make_control, PIDControl, HYSTERESIS, PID
 from temp import Temperature
-from thingspeakwriter import ThingSpeakWriter
+from thingspeakwriter import ThingSpeakWriter, BatchWriter
+from reportpolicy import ReportPolicy
 import thingspeakinfo as c
 import argparse
 import logging
 
 POLL_TIME_SEC = 5
-THRESHOLD = 25
 DEFAULT_ID = 0
 ID_INCREMENT = 1
 
 class TempSensor:
 	temp_sensor_id = DEFAULT_ID
 
-	def __init__(self, location, temp=Temperature(), fan=Fan(), write=True, write_key=c.WRITE_KEY_D1):
+	def __init__(self, location, temp=Temperature(), fan=Fan(), write=True, write_key=c.WRITE_KEY_D1, channel=c.FEED_D1, policy=None, control=None):
 		"""
 		Initializes the attributes
 		"""
@@ -31,13 +32,15 @@ class TempSensor:
 		self.__temp = temp
 		self.__fan = fan
 		self.__write_mode = write
-		self.__writer = ThingSpeakWriter(write_key)
+		self.__writer = BatchWriter(ThingSpeakWriter(write_key, channel)) #Readings sent in bulk updates
+		self.__policy = policy if policy is not None else ReportPolicy() #Only changed readings are written
+		self.__control = control if control is not None else make_control(location) #Fan control for the location
 
 	def poll(self):
 		"""
 		Poll for temperature readings.
 		Update Fan based on temp input.
-		Write update to ThingSpeak channel.
+		Write update to ThingSpeak channel when the reading or fan changed.
 		"""
 
 		logging.info('TempSensor Program running')
@@ -45,19 +48,22 @@ class TempSensor:
 
 		try:
 			while True:
-				tempDetected = self.update_status()
-				self.__write_status_to_channel() #Always writing to channel when temperature is detected
+				tval = self.update_status()
+				self.report_status(tval) #Reusing the reading, not sampling the sensor again
 
-				sleep_time = POLL_TIME_SEC if tempDetected else 0
-				time.sleep(sleep_time)
+				time.sleep(POLL_TIME_SEC) #A reading of 0.0 is still a reading
 
 		except KeyboardInterrupt:
 			logging.info ("Exiting")
 		except BaseException as e:
-			logging.error (e.message)
+			logging.error (str(e))
 			logging.error ("An error or exception occured!")
 		finally:
+			logging.info('Readings reported: {}'.format(self.__policy.get_stats()))
+			logging.info('Fan control: {}'.format(self.__control.get_stats()))
 			self.__fan.cold_status(True) #Set the Fan to OFF when program ends 
+			self.__writer.close() #Send buffered readings
+			self.__temp.stop() #Stop sampling the sensor
 			GPIO.cleanup() #Cleanup GPIO
 
 	def update_status(self):
@@ -68,13 +74,14 @@ class TempSensor:
 		checkingtemp = self.__temp.read_data() #Reading data from temperature sensor
 		logging.info ("Temperature Value: " + str(checkingtemp))
 
-		#Checking to see if the temperature value is greater or less than the set Threshold value
-		if checkingtemp > THRESHOLD:
+		#Asking the control engine how hard the fan should run (hysteresis & dwell time stop it chattering)
+		was_on = self.__fan.get_duty() > 0
+		duty = self.__control.update(checkingtemp)
+		if duty > 0 and not was_on:
 			logging.info ("ROOM TOO HOT - TURNING ON")
-			self.__fan.hot_status(True) #If greater, then fan turns ON
-		if checkingtemp <= THRESHOLD:
+		if duty == 0 and was_on:
 			logging.info ("ROOM TOO COLD - TURNING OFF")
-			self.__fan.cold_status(True) #If less, then fan turns OFF
+		self.__fan.set_duty(duty)
 		return checkingtemp
 
 	def checking_status(self):
@@ -84,23 +91,32 @@ class TempSensor:
 		checkingtemp = self.__temp.read_data()
 		return checkingtemp
 
-	def __write_status_to_channel(self):
+	def report_status(self, tval):
 		"""
-		Write status of TempSensor to channel
+		Write a reading to channel if the report policy says it is worth sending, returns True if written
 		"""
 
-		tval = self.__temp.read_data()
 		fan_status = 0
 		if self.__fan.get_status() == 1:
 			fan_status = 1
 
+		if self.__policy.check(tval, fan_status) is None:
+			return False
+		self.__write_status_to_channel(tval, fan_status)
+		return True
+
+	def __write_status_to_channel(self, tval, fan_status):
+		"""
+		Write status of TempSensor to channel
+		"""
+
 		fields = {c.LOCATION_FIELD: self.__location,
 			  c.NODE_ID_FIELD: self.__node_id,
 			  c.FAN_STATUS_FIELD: fan_status,
 			  c.TEMP_VAL_FIELD: tval}
 
 		status, reason = self.__writer.write_to_channel(fields)
-		if status != c.GOOD_STATUS:
+		if status not in (c.GOOD_STATUS, c.QUEUED_STATUS):
 			logging.error('Write to Thingspeak Channel was unsuccessful')
 
 def parse_args():
@@ -121,6 +137,16 @@ def parse_args():
 			    action = "store_true",
 			    help = "Print all debug logs")
 
+	parser.add_argument("-c",
+			    "--control",
+			    choices = [HYSTERESIS, PID],
+			    help = "fan control mode (default set per location)")
+
+	parser.add_argument("-s",
+			    "--setpoint",
+			    type = float,
+			    help = "temperature to keep the room at (default set per location)")
+
 	parser.add_argument('-l',
 			    '--location',
 			    type=str,
@@ -136,5 +162,7 @@ if __name__ == "__main__":
 	logging_level = logging.DEBUG if args.verbose else logging.INFO
 	logging.basicConfig(format=c.LOGGING_FORMAT, level = logging_level)
 
-	temp_sensor = TempSensor(args.location, write=args.write)
+	control = make_control(args.location, mode=args.control, setpoint=args.setpoint)
+	fan = Fan(pwm_freq=FAN_PWM_FREQ) if isinstance(control, PIDControl) else Fan() #PID runs the fan by PWM
+	temp_sensor = TempSensor(args.location, fan=fan, write=args.write, control=control)
 	temp_sensor.poll()
@@ -28,8 +28,7 @@ class TempSensorClient:
 		self.__latest_data = None
 
 		with TempDB(db_file = c.TEMP_SENSOR_DB_FILE, name = c.TEMP_SENSOR_TABLE) as db_obj:
-			if not db_obj.table_exists():
-				db_obj.create_table()
+			db_obj.migrate()
 
 	def poll_channel(self):
 		"""
@@ -121,14 +120,12 @@ class TempSensorClient:
 
 	def __add_data_from_channel(self, channel_data):
 		"""
-		Compares existing DB table with data read from channel.
-		Add data if not in Table
+		Add data read from channel to DB table in one batch.
+		Data already in Table is skipped
 		"""
 
-		with TempDB(db_file = 'tempsensor.db', name = 'TempSensor') as db_obj:
-			for data in channel_data:
-				if not db_obj.record_exists(data):
-					db_obj.add_record(data)
+		with TempDB(db_file = c.TEMP_SENSOR_DB_FILE, name = c.TEMP_SENSOR_TABLE) as db_obj:
+			db_obj.add_records(channel_data)
 
 def temp_sensor_client_test():
 	url = c.READ_URL.format(
@@ -41,6 +41,7 @@ TEMP_SENSOR_NAME = 'tempsensor'
 #TempSensor DB constants
 TEMP_SENSOR_DB_FILE = 'tempsensor.db'
 TEMP_SENSOR_TABLE = 'TempSensor'
+THINGSPEAK_OUTBOX_DB = 'thingspeak_outbox.db'
 
 #Logging Constants
 LOGGING_FORMAT  = '%(asctime)s - %(levelname)s - %(message)s'
@@ -49,3 +50,4 @@ LOGGING_TEST_LEVEL = INFO
 
 #Other Constants
 GOOD_STATUS = 200
+QUEUED_STATUS = 202  # ThingSpeak bulk update accepted / reading buffered for a batch
@@ -5,3 +5,7 @@ python3 tests/test_tempsensor.py -v
 python3 tests/test_tempsensorclient.py -v
 python3 tests/test_tempsensordb.py -v
 python3 tests/test_tempthingspeak.py -v
+python3 tests/test_tempthingspeakbatch.py -v
+python3 tests/test_tempreportpolicy.py -v
+python3 tests/test_tempfancontrol.py -v
+python3 tests/test_tempsampler.py -v
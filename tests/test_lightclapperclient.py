@@ -10,11 +10,15 @@ Notes
   https://www.python.org/dev/peps/pep-0008/
 """
 import logging
+import os
 from unittest import TestCase, main
 from unittest.mock import patch
 from lightclapperclient import LightClapperClient
+from sqlitepool import DB_POOL
 import constants as c
 
+TEMP_DB = 'temp_lightclapperclient.db'
+
 
 @patch('thingspeakreader.ThingSpeakReader.read_from_channel')
 class TestLightClapperClient(TestCase):
@@ -91,6 +95,106 @@ class TestLightClapperClient(TestCase):
         self.assertEqual(actual, expected, err_msg)
 
 
+@patch('thingspeakreader.ThingSpeakReader.read_new_entries')
+class TestLightClapperClientIncremental(TestCase):
+    """
+    Test incremental sync in LightClapperClient
+
+    Attributes
+    ----------
+    __client : LightClapperClient
+
+    Methods
+    -------
+    setUp()
+    tearDown()
+    test_sync_new_entries(mock_read)
+    test_cursor_survives_restart(mock_read)
+    """
+
+    def setUp(self):
+        """
+        Setup TestLightClapperClientIncremental
+        """
+        self.__client = LightClapperClient(
+            key=c.L2_M_5C2_READ_KEY,
+            feed=c.L2_M_5C2_FEED,
+            incremental=True,
+            db_file=TEMP_DB)
+
+    def tearDown(self):
+        """
+        Teardown TestLightClapperClientIncremental
+        """
+        DB_POOL.close_all()
+        if os.path.exists(TEMP_DB):
+            os.remove(TEMP_DB)
+
+    def __make_feeds(self, entry_ids):
+        """
+        Make channel feeds with the given entry IDs
+
+        Parameters
+        ----------
+        entry_ids : list
+            entry_id of each feed
+
+        Returns
+        -------
+        feeds : list
+            feeds as read from channel
+        """
+        return [{'entry_id': i,
+                 'created_at': '2020-11-21T21:44:{:02d}Z'.format(i),
+                 c.LOCATION_FIELD: 'my_room',
+                 c.NODE_ID_FIELD: 'lightclapper_123',
+                 c.LIGHT_STATUS_FIELD: i % 2} for i in entry_ids]
+
+    def test_sync_new_entries(self, mock_read):
+        """
+        Test that each sync only asks for entries after the last one
+
+        Parameters
+        ----------
+        mock_read : unittest.mock.Mock
+            Mock patched thingspeakreader.ThingSpeakReader.read_new_entries
+        """
+        mock_read.return_value = self.__make_feeds([1, 2])
+        actual = self.__client.sync_channel()
+        mock_read.assert_called_with(c.NO_ENTRY_ID)
+        err_msg = 'Expected data not successfully parsed'
+        self.assertEqual(len(actual), 2, err_msg)
+
+        mock_read.return_value = self.__make_feeds([3])
+        actual = self.__client.sync_channel()
+        mock_read.assert_called_with(2)
+        self.assertEqual(len(actual), 1, err_msg)
+
+    def test_cursor_survives_restart(self, mock_read):
+        """
+        Test that a new client resumes from the stored entry_id
+
+        Parameters
+        ----------
+        mock_read : unittest.mock.Mock
+            Mock patched thingspeakreader.ThingSpeakReader.read_new_entries
+        """
+        mock_read.return_value = self.__make_feeds([4, 5, 6])
+        self.__client.sync_channel()
+
+        restarted_client = LightClapperClient(
+            key=c.L2_M_5C2_READ_KEY,
+            feed=c.L2_M_5C2_FEED,
+            incremental=True,
+            db_file=TEMP_DB)
+        mock_read.return_value = []
+        actual = restarted_client.sync_channel()
+
+        mock_read.assert_called_with(6)
+        err_msg = 'Data parsed unexpectedly'
+        self.assertEqual(actual, [], err_msg)
+
+
 if __name__ == '__main__':
     logging.basicConfig(format=c.LOGGING_FORMAT, level=c.LOGGING_TEST_LEVEL)
     main()
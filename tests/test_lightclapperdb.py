@@ -11,8 +11,10 @@ Notes
 """
 import logging
 import os
+import sqlite3
 from unittest import TestCase, main, skipIf
-from sqliteDB import LightClapperDB
+from sqliteDB import LightClapperDB, SCHEMA_VERSION
+from sqlitepool import DB_POOL
 import constants as c
 
 TEMP_DB = 'temp_lightclapper.db'
@@ -37,6 +39,12 @@ class TestLightClapperDB(TestCase):
     test_create_table()
     test_add_good_record()
     test_add_bad_record()
+    test_add_records()
+    test_migrate_legacy_table()
+    test_migrate_tables_in_one_file()
+    test_migrate_enables_wal()
+    test_pooled_connection_reused()
+    test_stale_connection_dropped()
     test_get_records()
     """
 
@@ -53,6 +61,7 @@ class TestLightClapperDB(TestCase):
         Teardown TestLightClapperDB
         """
         self.__db.manual_exit()
+        DB_POOL.close_all()
         if os.path.exists(TEMP_DB):
             os.remove(TEMP_DB)
 
@@ -99,6 +108,140 @@ class TestLightClapperDB(TestCase):
 
         self.assertRaises(Exception, self.__db.add_record, record)
 
+    def test_add_records(self):
+        """
+        Test adding a batch of records, skipping duplicate records
+        """
+        record_1 = {'date': '2020-11-22',
+                    'time': '14:03:17',
+                    'location': 'test_room',
+                    'nodeID': 'lightclapper_456',
+                    'lightStatus': c.ON_INT}
+        record_2 = {'date': '2020-11-22',
+                    'time': '14:03:35',
+                    'location': 'test_room',
+                    'nodeID': 'lightclapper_456',
+                    'lightStatus': c.OFF_INT}
+
+        self.__db.create_table()
+        self.__db.create_unique_index()
+        self.__db.add_record(record_1)
+
+        added = self.__db.add_records([record_1, record_2, record_2])
+        err_msg = 'Only the new record should be added'
+        self.assertEqual(added, 1, err_msg)
+        err_msg = 'Records in DB table do not match'
+        self.assertEqual(self.__db.get_records(), [record_1, record_2],
+                         err_msg)
+
+    def test_migrate_legacy_table(self):
+        """
+        Test upgrading a table created without indexes or timestamps
+        """
+        record = {'date': '2020-11-22',
+                  'time': '14:03:17',
+                  'location': 'test_room',
+                  'nodeID': 'lightclapper_456',
+                  'lightStatus': c.ON_INT}
+        row = tuple(record.values())
+
+        legacy_db = sqlite3.connect(TEMP_DB)
+        legacy_db.execute(
+            "create table {} (date text, time text, location text, \
+             nodeID text, lightStatus integer)".format(TEMP_TABLE))
+        legacy_db.executemany(
+            "insert into {} values(?, ?, ?, ?, ?)".format(TEMP_TABLE),
+            [row, row])
+        legacy_db.commit()
+        legacy_db.close()
+
+        with self.assertLogs(level='WARNING') as logs:
+            self.__db.migrate()
+        err_msg = 'Deleted duplicate records not logged'
+        self.assertIn('Deleted 1 duplicate records', ' '.join(logs.output), err_msg)
+        err_msg = 'Table not upgraded to latest schema'
+        self.assertEqual(self.__db.get_schema_version(), SCHEMA_VERSION,
+                         err_msg)
+        err_msg = 'Duplicate records not removed'
+        self.assertEqual(self.__db.get_records(), [record], err_msg)
+        err_msg = 'Existing record added again'
+        self.assertEqual(self.__db.add_records([record]), 0, err_msg)
+
+    def test_migrate_tables_in_one_file(self):
+        """
+        Test upgrading a legacy table in a DB file already holding a migrated table
+        """
+        record = {'date': '2020-11-22',
+                  'time': '14:03:17',
+                  'location': 'test_room',
+                  'nodeID': 'lightclapper_456',
+                  'lightStatus': c.ON_INT}
+        legacy_table = TEMP_TABLE + '_legacy'
+
+        self.__db.migrate()
+        self.__db.manual_exit()
+        legacy_db = sqlite3.connect(TEMP_DB)
+        legacy_db.execute(
+            "create table {} (date text, time text, location text, \
+             nodeID text, lightStatus integer)".format(legacy_table))
+        legacy_db.commit()
+        legacy_db.close()
+        self.__db.manual_enter()
+
+        other_db = LightClapperDB(db_file=TEMP_DB, name=legacy_table)
+        other_db.manual_enter()
+        other_db.migrate()
+        version = other_db.get_schema_version()
+        added = [other_db.add_records([record]) for _ in range(2)]
+        other_db.manual_exit()
+
+        err_msg = 'Table not upgraded to latest schema'
+        self.assertEqual(version, SCHEMA_VERSION, err_msg)
+        err_msg = 'Table not given its unique index'
+        self.assertEqual(added, [1, 0], err_msg)
+
+    def test_migrate_enables_wal(self):
+        """
+        Test that migrating switches the DB file to WAL mode
+        """
+        self.__db.migrate()
+        self.__db.manual_exit()
+
+        with sqlite3.connect(TEMP_DB) as db:
+            journal_mode = db.execute('PRAGMA journal_mode').fetchone()[0]
+        err_msg = 'DB file not in WAL mode'
+        self.assertEqual(journal_mode, 'wal', err_msg)
+        self.__db.manual_enter()
+
+    def test_pooled_connection_reused(self):
+        """
+        Test that re-entering the DB reuses the pooled connection
+        """
+        self.__db.create_table()
+        self.__db.manual_exit()
+        hits = DB_POOL.get_stats()['hits']
+
+        self.__db.manual_enter()
+        err_msg = 'Pooled connection not reused'
+        self.assertEqual(DB_POOL.get_stats()['hits'], hits + 1, err_msg)
+        err_msg = 'Table does not exist'
+        self.assertTrue(self.__db.table_exists(), err_msg)
+
+    def test_stale_connection_dropped(self):
+        """
+        Test that a pooled connection to a deleted DB file is not reused
+        """
+        self.__db.create_table()
+        self.__db.manual_exit()
+        os.remove(TEMP_DB)
+        stale = DB_POOL.get_stats()['stale']
+
+        self.__db.manual_enter()
+        err_msg = 'Stale pooled connection reused'
+        self.assertEqual(DB_POOL.get_stats()['stale'], stale + 1, err_msg)
+        err_msg = 'Table exists unexpectedly'
+        self.assertFalse(self.__db.table_exists(), err_msg)
+
     @skipIf(not os.path.exists(PREMADE_DB), 'Run test in top level directory')
     def test_get_records(self):
         """
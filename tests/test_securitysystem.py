@@ -104,6 +104,52 @@ class TestCamera(TestCase):
         err_msg = 'Video not recorded or stored'
         self.assertTrue(file.exists(), err_msg)
 
+class TestCameraPreMotion(TestCase):
+    """
+    Test methods in Camera recording into a circular buffer
+    Attributes
+    ----------
+    __cam : Camera
+    Methods
+    -------
+    setUp()
+    tearDown()
+    test8_record_video_pre_motion()
+    """
+
+    def setUp(self):
+        """
+        Setup TestCameraPreMotion
+        """
+        self.__cam = Camera(pre_motion_secs=2, post_motion_secs=2)
+        self.__cam.start_camera()
+
+    def tearDown(self):
+        """
+        Teardown TestCameraPreMotion
+        """
+        self.__cam.close_camera()
+
+    def test8_record_video_pre_motion(self):
+        """
+        Test that record_video returns right away & the video, including
+        the seconds before motion, is saved in the background
+        """
+        test_date = "2020-11-23"
+        test_time = "00:00:01"
+        time.sleep(2)
+
+        start = time.time()
+        self.__cam.record_video(test_date, test_time)
+        err_msg = 'Recording blocked the caller'
+        self.assertLess(time.time() - start, 1, err_msg)
+
+        err_msg = 'Video not saved'
+        self.assertTrue(self.__cam.wait_for_video(test_date, test_time, timeout=10), err_msg)
+        file = pathlib.Path("/home/pi/Desktop/Security_Cam/{}_{}.h264".format(test_date, test_time))
+        err_msg = 'Video not recorded or stored'
+        self.assertTrue(file.exists(), err_msg)
+
 class TestSecuritySystem(TestCase):
     """
     Test methods of SecuritySystem
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+"""
+FrameMotion.py tests
+"""
+
+import logging
+from types import SimpleNamespace
+from unittest import TestCase, main
+import numpy as np
+from framemotion import FrameMotionDetector, FrameMotionOutput, make_roi_mask
+from framemotion_benchmark import make_frames
+from motionevents import CombinedSensor
+import constants as c
+
+TEST_RESOLUTION = (100, 50)  # padded to 128x64 by picamera
+
+
+class TestFrameMotionDetector(TestCase):
+    """
+    Test methods of FrameMotionDetector & FrameMotionOutput
+    Attributes
+    ----------
+    __calls : list
+        'motion' & 'no_motion' callbacks, in order
+    Methods
+    -------
+    setUp()
+    test_moving_square_detected()
+    test_masked_region_ignored()
+    test_only_nth_frames_processed()
+    test_padded_yuv_frames()
+    """
+
+    def setUp(self):
+        """
+        Setup TestFrameMotionDetector
+        """
+        self.__calls = []
+
+    def __detector(self, **kwargs):
+        """
+        Make a detector recording its callbacks
+        """
+        detector = FrameMotionDetector(resolution=TEST_RESOLUTION, **kwargs)
+        detector.when_motion = lambda: self.__calls.append('motion')
+        detector.when_no_motion = lambda: self.__calls.append('no_motion')
+        return detector
+
+    def __frame(self, square_x=None):
+        """
+        Make a flat grey frame, with a white square (top half) at square_x
+        """
+        frame = np.full((TEST_RESOLUTION[1], TEST_RESOLUTION[0]), 80, dtype=np.uint8)
+        if square_x is not None:
+            frame[5:20, square_x:square_x + 20] = 255
+        return frame
+
+    def test_moving_square_detected(self):
+        """
+        Test that motion starts with a moving square and ends once the scene is still
+        """
+        detector = self.__detector(every_nth=1, quiet_frames=3)
+        for _ in range(5):
+            detector.process(self.__frame())
+        err_msg = 'Still scene reported as motion'
+        self.assertEqual(self.__calls, [], err_msg)
+
+        for x in range(0, 60, 10):
+            detector.process(self.__frame(x))
+        err_msg = 'Moving square not detected'
+        self.assertEqual(self.__calls, ['motion'], err_msg)
+
+        for _ in range(20):
+            detector.process(self.__frame())
+        err_msg = 'Motion did not end'
+        self.assertEqual(self.__calls, ['motion', 'no_motion'], err_msg)
+
+    def test_masked_region_ignored(self):
+        """
+        Test that motion outside the region of interest is ignored
+        """
+        mask = make_roi_mask(TEST_RESOLUTION, [(0, 0.5, 1, 0.5)])  # bottom half only
+        detector = self.__detector(every_nth=1, mask=mask)
+        detector.process(self.__frame())
+        for x in range(0, 60, 10):
+            detector.process(self.__frame(x))
+        err_msg = 'Motion outside region of interest reported'
+        self.assertEqual(self.__calls, [], err_msg)
+
+        mask = make_roi_mask(TEST_RESOLUTION, [(0, 0.5, 1, 0.5)], exclude=True)
+        err_msg = 'Excluded mask should be the complement'
+        self.assertEqual(mask.sum(), TEST_RESOLUTION[0] * TEST_RESOLUTION[1] // 2, err_msg)
+
+    def test_only_nth_frames_processed(self):
+        """
+        Test that only every nth frame is processed
+        """
+        detector = self.__detector(every_nth=3)
+        for x in range(0, 90, 10):
+            detector.process(self.__frame(x % 60))
+        stats = detector.get_stats()
+        err_msg = 'Wrong number of frames processed'
+        self.assertEqual((stats['frames'], stats['processed']), (9, 3), err_msg)
+
+    def test_padded_yuv_frames(self):
+        """
+        Test that the Y plane of padded YUV frames is read, and frame motion can drive a combined sensor
+        """
+        detector = FrameMotionDetector(resolution=TEST_RESOLUTION, every_nth=1)
+        output = FrameMotionOutput(detector, resolution=TEST_RESOLUTION)
+        pir = SimpleNamespace(when_motion=None, when_no_motion=None)
+        combined = CombinedSensor([pir, detector], require_all=True)
+        combined.when_motion = lambda: self.__calls.append('motion')
+
+        frames, moving = make_frames(TEST_RESOLUTION, 30)
+        err_msg = 'Wrong padded YUV frame size'
+        self.assertEqual(len(frames[0]), 128 * 64 * 3 // 2, err_msg)
+
+        pir.when_motion()
+        for frame in frames[:10]:
+            self.assertEqual(output.write(frame), len(frame))
+        err_msg = 'Motion reported before square moved'
+        self.assertEqual(self.__calls, [], err_msg)
+        for frame in frames[10:16]:
+            output.write(frame)
+        err_msg = 'PIR & frame motion together not reported'
+        self.assertEqual(self.__calls, ['motion'], err_msg)
+
+
+class TestCombinedSensor(TestCase):
+    """
+    Test methods of CombinedSensor
+    Methods
+    -------
+    test_any_and_all()
+    """
+
+    def test_any_and_all(self):
+        """
+        Test that 'any' reports motion while either sensor is active and 'all' only while both are
+        """
+        for require_all, expected in ((False, ['motion', 'no_motion']), (True, ['motion', 'no_motion'])):
+            calls = []
+            a = SimpleNamespace(when_motion=None, when_no_motion=None)
+            b = SimpleNamespace(when_motion=None, when_no_motion=None)
+            combined = CombinedSensor([a, b], require_all=require_all)
+            combined.when_motion = lambda: calls.append('motion')
+            combined.when_no_motion = lambda: calls.append('no_motion')
+
+            a.when_motion()
+            err_msg = 'Wrong state with one sensor active (require_all={})'.format(require_all)
+            self.assertEqual(calls, [] if require_all else ['motion'], err_msg)
+            b.when_motion()
+            a.when_no_motion()
+            b.when_no_motion()
+            err_msg = 'Wrong callbacks (require_all={})'.format(require_all)
+            self.assertEqual(calls, expected, err_msg)
+
+            combined.close()
+            err_msg = 'Callbacks not detached'
+            self.assertIsNone(a.when_motion, err_msg)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format=c.LOGGING_FORMAT, level=c.LOGGING_TEST_LEVEL)
+    main()
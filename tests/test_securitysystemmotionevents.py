@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+"""
+MotionEvents.py tests
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from types import SimpleNamespace
+from unittest import TestCase, main
+from motionevents import MotionEventSource, CombinedSensor
+import constants as c
+
+TEST_HOLD_OFF_SECS = 0.05
+TEST_TIMEOUT_SECS = 1
+
+
+class TestMotionEventSource(TestCase):
+    """
+    Test methods of MotionEventSource
+    Attributes
+    ----------
+    __sensor : SimpleNamespace
+        Stands in for gpiozero MotionSensor callbacks
+    Methods
+    -------
+    setUp()
+    test_held_motion_is_event()
+    test_glitch_ignored()
+    test_cancelled_hold_off_ignored()
+    test_cooldown_drops_motion()
+    test_cooldown_drop_not_merged()
+    test_close_motion_merged()
+    test_close_ends_iteration()
+    test_close_detaches_combined()
+    test_async_iteration()
+    """
+
+    def setUp(self):
+        """
+        Setup TestMotionEventSource
+        """
+        self.__sensor = SimpleNamespace(when_motion=None, when_no_motion=None)
+
+    def __trigger(self, secs):
+        """
+        Simulate motion lasting secs
+        """
+        self.__sensor.when_motion()
+        time.sleep(secs)
+        self.__sensor.when_no_motion()
+
+    def test_held_motion_is_event(self):
+        """
+        Test that motion lasting past the hold-off is an event with its start time
+        """
+        source = MotionEventSource(self.__sensor, TEST_HOLD_OFF_SECS, 0, 0)
+        start = time.time()
+        self.__trigger(TEST_HOLD_OFF_SECS * 2)
+        event = source.get(timeout=TEST_TIMEOUT_SECS)
+
+        err_msg = 'Held motion not reported'
+        self.assertIsNotNone(event, err_msg)
+        err_msg = 'Event time is not when motion started'
+        self.assertAlmostEqual(event.timestamp, start, delta=TEST_HOLD_OFF_SECS, msg=err_msg)
+        self.assertEqual(len(event.date.split('-')) + len(event.time.split(':')), 6, err_msg)
+
+    def test_glitch_ignored(self):
+        """
+        Test that motion shorter than the hold-off is not an event
+        """
+        source = MotionEventSource(self.__sensor, TEST_HOLD_OFF_SECS * 4, 0, 0)
+        self.__trigger(0)
+        err_msg = 'Glitch reported as motion'
+        self.assertIsNone(source.get(timeout=TEST_HOLD_OFF_SECS * 8), err_msg)
+        self.assertEqual(source.get_stats()['glitches'], 1, err_msg)
+
+    def test_cancelled_hold_off_ignored(self):
+        """
+        Test that a cancelled hold-off timer firing late (it was waiting for the lock) does not report newer motion early
+        """
+        source = MotionEventSource(self.__sensor, TEST_TIMEOUT_SECS * 10, 0, 0)
+        self.__trigger(0)
+        self.__sensor.when_motion()  # newer motion, with its own hold-off pending
+        # the first, cancelled timer's callback runs now, as if it got the lock just after being cancelled
+        stale = threading.Thread(target=source._MotionEventSource__hold_off_passed, args=(time.time(),))
+        stale.start()
+        stale.join()
+
+        err_msg = 'Cancelled hold-off reported newer motion before its hold-off'
+        self.assertIsNone(source.get(timeout=TEST_HOLD_OFF_SECS), err_msg)
+        self.assertEqual(source.get_stats()['events'], 0, err_msg)
+        source.close()
+
+    def test_cooldown_drops_motion(self):
+        """
+        Test that motion during the cooldown after an event is dropped, and counted again after it
+        """
+        cooldown = 0.3
+        source = MotionEventSource(self.__sensor, 0, cooldown, 0)
+        self.__sensor.when_motion()
+        self.__sensor.when_no_motion()
+        time.sleep(0.01)
+        self.__sensor.when_motion()
+        self.__sensor.when_no_motion()
+        time.sleep(cooldown)
+        self.__sensor.when_motion()
+
+        events = [source.get(timeout=TEST_TIMEOUT_SECS) for _ in range(2)]
+        err_msg = 'Motion after cooldown not reported'
+        self.assertNotIn(None, events, err_msg)
+        err_msg = 'Motion in cooldown not dropped'
+        self.assertEqual(source.get_stats()['cooldown'], 1, err_msg)
+        self.assertIsNone(source.get(timeout=0.05), err_msg)
+
+    def test_cooldown_drop_not_merged(self):
+        """
+        Test that motion dropped in the cooldown does not extend the ended event, so later motion is a new event
+        """
+        cooldown = 0.8
+        merge = 0.3
+        source = MotionEventSource(self.__sensor, 0, cooldown, merge)
+        self.__sensor.when_motion()
+        self.__sensor.when_no_motion()
+        time.sleep(0.4)  # past the merge window, in the cooldown
+        self.__sensor.when_motion()
+        time.sleep(0.3)
+        self.__sensor.when_no_motion()
+        time.sleep(0.2)  # past the cooldown, in the merge window of the dropped motion
+        self.__sensor.when_motion()
+
+        events = [source.get(timeout=TEST_TIMEOUT_SECS) for _ in range(2)]
+        err_msg = 'Motion after a cooldown drop merged into the ended event'
+        self.assertNotIn(None, events, err_msg)
+        self.assertEqual(source.get_stats()['merged'], 0, err_msg)
+        source.close()
+
+    def test_close_motion_merged(self):
+        """
+        Test that motion soon after the last motion extends the event, even past the merge window from its start
+        """
+        merge = 0.2
+        source = MotionEventSource(self.__sensor, 0, 0, merge)
+        for _ in range(4):
+            self.__sensor.when_motion()
+            self.__sensor.when_no_motion()
+            time.sleep(merge / 2)
+
+        err_msg = 'Back to back motion not merged into one event'
+        self.assertIsNotNone(source.get(timeout=TEST_TIMEOUT_SECS), err_msg)
+        self.assertIsNone(source.get(timeout=0.05), err_msg)
+        self.assertEqual(source.get_stats()['merged'], 3, err_msg)
+
+        time.sleep(merge)
+        self.__sensor.when_motion()
+        err_msg = 'Motion after merge window not reported'
+        self.assertIsNotNone(source.get(timeout=TEST_TIMEOUT_SECS), err_msg)
+
+    def test_close_ends_iteration(self):
+        """
+        Test that iterating ends when closed and callbacks are detached
+        """
+        source = MotionEventSource(self.__sensor, 0, 0, 0)
+        self.__sensor.when_motion()
+        threading.Timer(0.05, source.close).start()
+
+        err_msg = 'Iteration did not end on close'
+        self.assertEqual(len(list(source)), 1, err_msg)
+        err_msg = 'Callbacks not detached'
+        self.assertIsNone(self.__sensor.when_motion, err_msg)
+
+    def test_close_detaches_combined(self):
+        """
+        Test that closing detaches from the sensors a combined sensor combines
+        """
+        other = SimpleNamespace(when_motion=None, when_no_motion=None)
+        source = MotionEventSource(CombinedSensor([self.__sensor, other]), 0, 0, 0)
+        source.close()
+
+        err_msg = 'Combined sensors still attached after close'
+        self.assertEqual([self.__sensor.when_motion, other.when_motion, other.when_no_motion], [None] * 3, err_msg)
+
+    def test_async_iteration(self):
+        """
+        Test that events can be read with async for
+        """
+        source = MotionEventSource(self.__sensor, 0, 0, 0)
+
+        async def read():
+            return [event async for event in source]
+
+        self.__sensor.when_motion()
+        threading.Timer(0.05, source.close).start()
+        err_msg = 'Event not read asynchronously'
+        self.assertEqual(len(asyncio.run(read())), 1, err_msg)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format=c.LOGGING_FORMAT, level=c.LOGGING_TEST_LEVEL)
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+"""
+Mp4mux.py tests
+"""
+
+import logging
+import os
+import struct
+import tempfile
+from unittest import TestCase, main
+import mp4mux
+import constants as c
+
+CONTAINER_BOXES = (b'moov', b'trak', b'mdia', b'minf', b'stbl')
+
+
+class BitWriter:
+    """
+    Writes bits & Exp-Golomb codes to build test parameter sets
+    Attributes
+    ----------
+    __bits : list
+        Bits written
+    Methods
+    -------
+    bits(value, n)
+        Writes n bits of value
+    ue(value)
+        Writes an unsigned Exp-Golomb code
+    to_bytes()
+        Gets bytes written, with RBSP trailing bits
+    """
+    def __init__(self):
+        """
+        Initializes the BitWriter
+        """
+        self.__bits = []
+
+    def bits(self, value, n):
+        """
+        Writes n bits of value
+        """
+        self.__bits += [(value >> (n - 1 - i)) & 1 for i in range(n)]
+        return self
+
+    def ue(self, value):
+        """
+        Writes an unsigned Exp-Golomb code
+        """
+        n = (value + 1).bit_length()
+        return self.bits(0, n - 1).bits(value + 1, n)
+
+    def to_bytes(self):
+        """
+        Gets bytes written, with RBSP trailing bits
+        """
+        bits = self.__bits + [1]
+        bits += [0] * (-len(bits) % 8)
+        return bytes(int(''.join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8))
+
+
+def baseline_sps():
+    """
+    SPS of a 640x480 baseline stream
+    """
+    writer = BitWriter().bits(66, 8).bits(0xC0, 8).bits(30, 8).ue(0)
+    writer.ue(0).ue(2).ue(1).bits(0, 1)  # frame num, poc type 2, ref frames, gaps
+    writer.ue(39).ue(29).bits(1, 1).bits(1, 1).bits(0, 1).bits(0, 1)  # size, frame_mbs_only, no cropping/VUI
+    return b'\x67' + writer.to_bytes()
+
+
+def high_sps():
+    """
+    SPS of a cropped 1920x1080 high profile stream
+    """
+    writer = BitWriter().bits(100, 8).bits(0, 8).bits(40, 8).ue(0)
+    writer.ue(1).ue(0).ue(0).bits(0, 1).bits(0, 1)  # 4:2:0, 8 bit, no scaling matrix
+    writer.ue(0).ue(0).ue(4).ue(1).bits(0, 1)  # frame num, poc type 0, ref frames, gaps
+    writer.ue(119).ue(67).bits(1, 1).bits(1, 1)  # 1920x1088
+    writer.bits(1, 1).ue(0).ue(0).ue(0).ue(4).bits(0, 1)  # crop 8 lines to 1080
+    return b'\x67' + writer.to_bytes()
+
+
+PPS = b'\x68\xce\x38\x80'
+IDR = b'\x65\x88\x84\x21\xa0'
+SLICE = b'\x41\x9a\x02\x10'
+SEI = b'\x06\x05\x01\x80'
+
+
+def read_boxes(data, offset=0, end=None):
+    """
+    Parses MP4 boxes, descending into containers
+    Returns
+    -------
+    boxes : dict
+        Box payload (offset, bytes) keyed by type
+    """
+    boxes = {}
+    end = len(data) if end is None else end
+    while offset < end:
+        size, box_type = struct.unpack('>I4s', data[offset:offset + 8])
+        boxes[box_type] = (offset + 8, data[offset + 8:offset + size])
+        if box_type in CONTAINER_BOXES:
+            boxes.update(read_boxes(data, offset + 8, offset + size))
+        offset += size
+    return boxes
+
+
+class TestMp4Mux(TestCase):
+    """
+    Test methods for mp4mux
+    Attributes
+    ----------
+    __dir : TemporaryDirectory
+        Directory of test files
+    Methods
+    -------
+    setUp()
+    tearDown()
+    test_parse_sps()
+    test_mux_boxes()
+    test_stream_split_across_reads()
+    test_no_parameter_sets()
+    """
+
+    def setUp(self):
+        """
+        Setup TestMp4Mux
+        """
+        self.__dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """
+        Teardown TestMp4Mux
+        """
+        self.__dir.cleanup()
+
+    def __mux(self, nal_units, fps=mp4mux.DEFAULT_FPS):
+        """
+        Write nal_units as an Annex B stream & mux it
+        Returns
+        -------
+        frames : int
+            Number of frames muxed
+        data : bytes
+            The MP4 file
+        """
+        h264_file = os.path.join(self.__dir.name, 'clip.h264')
+        mp4_file = os.path.join(self.__dir.name, 'clip.mp4')
+        with open(h264_file, 'wb') as f:
+            for i, nal in enumerate(nal_units):
+                f.write((b'\x00\x00\x00\x01' if i % 2 else b'\x00\x00\x01') + nal)
+        frames = mp4mux.mux_h264_to_mp4(h264_file, mp4_file, fps)
+        with open(mp4_file, 'rb') as f:
+            return frames, f.read()
+
+    def test_parse_sps(self):
+        """
+        Test that dimensions are read from baseline & cropped high profile SPS
+        """
+        info = mp4mux.parse_sps(baseline_sps())
+        err_msg = 'Wrong baseline dimensions'
+        self.assertEqual((info['width'], info['height']), (640, 480), err_msg)
+
+        info = mp4mux.parse_sps(high_sps())
+        err_msg = 'Cropping not applied'
+        self.assertEqual((info['width'], info['height']), (1920, 1080), err_msg)
+        err_msg = 'Wrong profile'
+        self.assertEqual(info['profile'], 100, err_msg)
+
+    def test_mux_boxes(self):
+        """
+        Test that frames, keyframes & timing are indexed and samples are length-prefixed
+        """
+        sps = baseline_sps()
+        nal_units = [sps, PPS, SEI, IDR, SLICE, SLICE, sps, PPS, IDR, SLICE]
+        frames, data = self.__mux(nal_units, fps=25)
+        boxes = read_boxes(data)
+
+        err_msg = 'Wrong number of frames'
+        self.assertEqual(frames, 5, err_msg)
+        err_msg = 'Missing box'
+        for box_type in (b'ftyp', b'mdat', b'mvhd', b'tkhd', b'mdhd', b'hdlr', b'stsd', b'stts', b'stss', b'stsz', b'stco'):
+            self.assertIn(box_type, boxes, err_msg)
+
+        sizes = struct.unpack('>5I', boxes[b'stsz'][1][12:])
+        err_msg = 'SEI not kept with its frame, or parameter sets kept in samples'
+        self.assertEqual(sizes[0], 8 + len(SEI) + len(IDR), err_msg)
+        err_msg = 'mdat size does not match samples'
+        self.assertEqual(len(boxes[b'mdat'][1]), sum(sizes), err_msg)
+
+        err_msg = 'Wrong keyframes'
+        self.assertEqual(struct.unpack('>3I', boxes[b'stss'][1][4:]), (2, 1, 4), err_msg)
+        err_msg = 'Wrong frame duration'
+        self.assertEqual(struct.unpack('>3I', boxes[b'stts'][1][4:]), (1, 5, mp4mux.TIMESCALE // 25), err_msg)
+        tkhd = boxes[b'tkhd'][1]
+        err_msg = 'tkhd not 84 bytes (version 0)'
+        self.assertEqual(len(tkhd), 84, err_msg)
+        err_msg = 'Wrong track duration'
+        movie_duration = 5 * (mp4mux.TIMESCALE // 25) * mp4mux.MOVIE_TIMESCALE // mp4mux.TIMESCALE
+        self.assertEqual(struct.unpack('>I', tkhd[20:24])[0], movie_duration, err_msg)
+        err_msg = 'Wrong dimensions'
+        self.assertEqual(struct.unpack('>II', tkhd[76:84]), (640 << 16, 480 << 16), err_msg)
+
+        offset = struct.unpack('>I', boxes[b'stco'][1][8:])[0]
+        err_msg = 'Chunk offset does not point at first sample'
+        self.assertEqual(offset, boxes[b'mdat'][0], err_msg)
+        self.assertEqual(data[offset:offset + 4 + len(SEI)], struct.pack('>I', len(SEI)) + SEI, err_msg)
+
+        avcc = boxes[b'stsd'][1][8 + 8 + 78 + 8:]
+        err_msg = 'SPS not in avcC'
+        self.assertEqual(avcc[8:8 + len(sps)], sps, err_msg)
+
+    def test_stream_split_across_reads(self):
+        """
+        Test that start codes & NAL units split across reads are found
+        """
+        read_bytes = mp4mux.READ_BYTES
+        nal_units = [high_sps(), PPS] + [IDR] + [SLICE] * 9
+        try:
+            expected = self.__mux(nal_units)
+            for mp4mux.READ_BYTES in (1, 2, 3, 7):
+                err_msg = 'Output changed with {} byte reads'.format(mp4mux.READ_BYTES)
+                self.assertEqual(self.__mux(nal_units), expected, err_msg)
+        finally:
+            mp4mux.READ_BYTES = read_bytes
+
+        boxes = read_boxes(expected[1])
+        err_msg = 'stss written although every frame is a keyframe'
+        self.assertNotIn(b'stss', read_boxes(self.__mux([high_sps(), PPS, IDR, IDR])[1]), err_msg)
+        err_msg = 'Wrong frame count'
+        self.assertEqual(struct.unpack('>I', boxes[b'stsz'][1][8:12])[0], 10, err_msg)
+
+    def test_no_parameter_sets(self):
+        """
+        Test that a stream without SPS/PPS is rejected
+        """
+        with self.assertRaises(ValueError):
+            self.__mux([IDR, SLICE])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format=c.LOGGING_FORMAT, level=c.LOGGING_TEST_LEVEL)
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+"""
+Notifier.py tests
+"""
+
+import logging
+import smtplib
+import time
+from unittest import TestCase, main
+from unittest.mock import MagicMock
+from notifier import NotificationDispatcher, SmsChannel, EmailChannel
+import constants as c
+
+TEST_WINDOW_SECS = 0.2
+
+
+class RecordingChannel:
+    """
+    Channel recording each message sent
+    Attributes
+    ----------
+    sent : list
+        Messages (lists of alerts) sent, with time sent
+    closed : bool
+        True once closed
+    """
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+
+    def send(self, messages):
+        self.sent.append((messages, time.monotonic()))
+
+    def close(self):
+        self.closed = True
+
+
+class TestNotificationDispatcher(TestCase):
+    """
+    Test methods of NotificationDispatcher
+    Attributes
+    ----------
+    __sms : RecordingChannel
+    __email : RecordingChannel
+    Methods
+    -------
+    setUp()
+    test_alerts_coalesced_in_window()
+    test_rate_limit_between_messages()
+    test_stop_sends_queued_alerts()
+    test_email_connection_reused()
+    test_sms_client_reused()
+    """
+
+    def setUp(self):
+        """
+        Setup TestNotificationDispatcher
+        """
+        self.__sms = RecordingChannel()
+        self.__email = RecordingChannel()
+
+    def __dispatcher(self, min_interval_secs={}):
+        """
+        Make a started dispatcher on the recording channels
+        """
+        dispatcher = NotificationDispatcher({'sms': self.__sms, 'email': self.__email},
+                                            window_secs=TEST_WINDOW_SECS, min_interval_secs=min_interval_secs)
+        dispatcher.start()
+        return dispatcher
+
+    def test_alerts_coalesced_in_window(self):
+        """
+        Test that a burst of alerts is sent as one message per channel after the window
+        """
+        dispatcher = self.__dispatcher()
+        start = time.monotonic()
+        for i in range(5):
+            dispatcher.notify('sms', 'Motion {}'.format(i))
+        dispatcher.notify('email', 'link', subject='Video')
+        time.sleep(TEST_WINDOW_SECS * 3)
+
+        err_msg = 'Burst not coalesced into one SMS'
+        self.assertEqual(len(self.__sms.sent), 1, err_msg)
+        messages, sent = self.__sms.sent[0]
+        self.assertEqual([text for _, text in messages], ['Motion {}'.format(i) for i in range(5)], err_msg)
+        err_msg = 'Sent before digest window'
+        self.assertGreaterEqual(sent - start, TEST_WINDOW_SECS, err_msg)
+        err_msg = 'Email subject lost'
+        self.assertEqual(self.__email.sent[0][0], [('Video', 'link')], err_msg)
+
+        dispatcher.stop()
+        stats = dispatcher.get_stats()
+        err_msg = 'Wrong stats'
+        self.assertEqual(stats['sms'], {'queued': 5, 'sent': 1, 'failed': 0, 'coalesced': 4}, err_msg)
+        err_msg = 'Channels not closed'
+        self.assertTrue(self.__sms.closed and self.__email.closed, err_msg)
+
+    def test_rate_limit_between_messages(self):
+        """
+        Test that a channel waits its min interval after a message before sending again
+        """
+        min_interval = TEST_WINDOW_SECS * 3
+        dispatcher = self.__dispatcher({'sms': min_interval})
+        dispatcher.notify('sms', 'first')
+        time.sleep(TEST_WINDOW_SECS * 1.5)
+        dispatcher.notify('sms', 'second')
+        dispatcher.notify('sms', 'third')
+        time.sleep(min_interval * 1.5)
+        dispatcher.stop()
+
+        err_msg = 'Rate limit not applied'
+        self.assertEqual(len(self.__sms.sent), 2, err_msg)
+        self.assertGreaterEqual(self.__sms.sent[1][1] - self.__sms.sent[0][1], min_interval * 0.99, err_msg)
+        err_msg = 'Alerts held by rate limit not merged'
+        self.assertEqual(len(self.__sms.sent[1][0]), 2, err_msg)
+
+    def test_stop_sends_queued_alerts(self):
+        """
+        Test that stopping sends alerts still in their window
+        """
+        dispatcher = self.__dispatcher()
+        dispatcher.notify('email', 'link')
+        dispatcher.stop()
+
+        err_msg = 'Queued alert lost on stop'
+        self.assertEqual(len(self.__email.sent), 1, err_msg)
+
+    def test_email_connection_reused(self):
+        """
+        Test that one SMTP connection sends several emails, reconnecting once dropped
+        """
+        sessions = []
+        def connect():
+            sessions.append(MagicMock())
+            return sessions[-1]
+        channel = EmailChannel(connect)
+
+        channel.send([('Video', 'link')])
+        channel.send([('Video', 'link 1'), ('Video', 'link 2')])
+        err_msg = 'SMTP connection not reused'
+        self.assertEqual(len(sessions), 1, err_msg)
+        self.assertEqual(sessions[0].sendmail.call_count, 2, err_msg)
+
+        sessions[0].sendmail.side_effect = smtplib.SMTPServerDisconnected()
+        channel.send([('Video', 'link')])
+        err_msg = 'Dropped connection not replaced'
+        self.assertEqual(len(sessions), 2, err_msg)
+        self.assertEqual(sessions[1].sendmail.call_count, 1, err_msg)
+
+        channel.close()
+        err_msg = 'Connection not quit'
+        self.assertEqual(sessions[1].quit.call_count, 1, err_msg)
+
+    def test_sms_client_reused(self):
+        """
+        Test that one SMS client sends digests of several alerts
+        """
+        client = MagicMock()
+        client.send_message.return_value = {'messages': [{'status': '0'}]}
+        channel = SmsChannel(client)
+
+        channel.send([('Motion 1', 'Motion 1')])
+        channel.send([('Motion 2', 'Motion 2'), ('Motion 3', 'Motion 3')])
+        err_msg = 'Digest missing alerts'
+        self.assertIn('Motion 2\nMotion 3', client.send_message.call_args[0][0]['text'], err_msg)
+
+        client.send_message.return_value = {'messages': [{'status': '2', 'error-text': 'Missing to'}]}
+        with self.assertRaises(Exception):
+            channel.send([('Motion 4', 'Motion 4')])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format=c.LOGGING_FORMAT, level=c.LOGGING_TEST_LEVEL)
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+"""
+Patrol.py tests
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase, main
+from patrol import PresetStore, PatrolScheduler, RECORDING
+import constants as c
+
+TEST_DWELL_SECS = 0.05
+TEST_TIMEOUT_SECS = 2
+
+
+class FakeController:
+    """
+    Records move_to calls in place of ServoController
+    Attributes
+    ----------
+    moves : list
+        (axis, angle, monotonic time) of each move
+    __lock : Lock
+        Guards moves
+    Methods
+    -------
+    move_to(axis, angle)
+        Records a move
+    pans()
+        Gets pan angles moved to
+    """
+
+    def __init__(self):
+        """
+        Initializes the FakeController
+        """
+        self.moves = []
+        self.__lock = threading.Lock()
+
+    def move_to(self, axis, angle):
+        """
+        Records a move
+        """
+        with self.__lock:
+            self.moves.append((axis, angle, time.monotonic()))
+        return angle
+
+    def pans(self):
+        """
+        Gets pan angles moved to
+        """
+        with self.__lock:
+            return [angle for axis, angle, _ in self.moves if axis == 'pan']
+
+
+class TestPresetStore(TestCase):
+    """
+    Test methods of PresetStore
+    Attributes
+    ----------
+    __dir : TemporaryDirectory
+        Holds the test DB
+    __store : PresetStore
+        Store under test
+    Methods
+    -------
+    setUp()
+    tearDown()
+    test_presets_saved_in_order()
+    test_update_keeps_order()
+    test_presets_persisted()
+    test_holds()
+    """
+
+    def setUp(self):
+        """
+        Setup TestPresetStore
+        """
+        self.__dir = tempfile.TemporaryDirectory()
+        self.__db_file = os.path.join(self.__dir.name, 'patrol.db')
+        self.__store = PresetStore(self.__db_file)
+
+    def tearDown(self):
+        """
+        Remove the test DB
+        """
+        self.__dir.cleanup()
+
+    def test_presets_saved_in_order(self):
+        """
+        Test that presets are returned in the order saved, with angles clamped
+        """
+        self.__store.save_preset('door', 30, 90)
+        self.__store.save_preset('window', 200, -10, dwell_secs=5)
+        presets = self.__store.get_presets()
+
+        err_msg = 'Presets not in patrol order'
+        self.assertEqual([p['name'] for p in presets], ['door', 'window'], err_msg)
+        err_msg = 'Preset angles not clamped'
+        self.assertEqual((presets[1]['pan'], presets[1]['tilt']), (180, 0), err_msg)
+        err_msg = 'Dwell not saved'
+        self.assertEqual(presets[1]['dwell_secs'], 5, err_msg)
+
+    def test_update_keeps_order(self):
+        """
+        Test that updating a preset changes its angles but not its place in the patrol
+        """
+        self.__store.save_preset('door', 30, 90)
+        self.__store.save_preset('window', 150, 90)
+        self.__store.save_preset('door', 45, 80)
+
+        err_msg = 'Updated preset moved in patrol'
+        self.assertEqual([p['name'] for p in self.__store.get_presets()], ['door', 'window'], err_msg)
+        err_msg = 'Preset not updated'
+        self.assertEqual(self.__store.get_preset('door')['pan'], 45, err_msg)
+        err_msg = 'Preset not deleted'
+        self.assertTrue(self.__store.delete_preset('door'), err_msg)
+        self.assertIsNone(self.__store.get_preset('door'), err_msg)
+        self.assertFalse(self.__store.delete_preset('door'), err_msg)
+
+    def test_presets_persisted(self):
+        """
+        Test that presets & holds are seen by another store on the same DB (e.g. the node's)
+        """
+        self.__store.save_preset('door', 30, 90)
+        other = PresetStore(self.__db_file)
+        other.hold(RECORDING, 10)
+
+        err_msg = 'Preset not persisted'
+        self.assertEqual(other.get_preset('door')['pan'], 30, err_msg)
+        err_msg = 'Hold not shared'
+        self.assertIsNotNone(self.__store.get_hold_until(), err_msg)
+
+    def test_holds(self):
+        """
+        Test that holds extend, expire and can be released
+        """
+        self.__store.hold(RECORDING, 10)
+        until = self.__store.get_hold_until()
+        self.__store.hold(RECORDING, 1)
+
+        err_msg = 'Shorter hold cut the hold short'
+        self.assertEqual(self.__store.get_hold_until(), until, err_msg)
+        err_msg = 'Released hold still held'
+        self.__store.release(RECORDING)
+        self.assertIsNone(self.__store.get_hold_until(), err_msg)
+        err_msg = 'Expired hold still held'
+        self.__store.hold(RECORDING, -1)
+        self.assertIsNone(self.__store.get_hold_until(), err_msg)
+
+
+class TestPatrolScheduler(TestCase):
+    """
+    Test methods of PatrolScheduler
+    Attributes
+    ----------
+    __dir : TemporaryDirectory
+        Holds the test DB
+    __store : PresetStore
+        Presets of the patrol
+    __controller : FakeController
+        Stands in for ServoController
+    __patrol : PatrolScheduler
+        Scheduler under test
+    Methods
+    -------
+    setUp()
+    tearDown()
+    test_patrol_cycles_presets()
+    test_patrol_keeps_schedule()
+    test_hold_pauses_patrol()
+    test_goto_preset_pauses_patrol()
+    """
+
+    def setUp(self):
+        """
+        Setup TestPatrolScheduler
+        """
+        self.__dir = tempfile.TemporaryDirectory()
+        self.__store = PresetStore(os.path.join(self.__dir.name, 'patrol.db'))
+        self.__store.save_preset('door', 10, 90)
+        self.__store.save_preset('window', 20, 90)
+        self.__store.save_preset('yard', 30, 90)
+        self.__controller = FakeController()
+        self.__patrol = PatrolScheduler(self.__controller, self.__store, dwell_secs=TEST_DWELL_SECS,
+                                        manual_hold_secs=TEST_TIMEOUT_SECS * 10)
+
+    def tearDown(self):
+        """
+        Stop the patrol thread & remove the test DB
+        """
+        self.__patrol.stop()
+        self.__dir.cleanup()
+
+    def __wait_for_pans(self, count):
+        """
+        Wait until count pan moves are made or the timeout passes
+        """
+        deadline = time.monotonic() + TEST_TIMEOUT_SECS
+        while len(self.__controller.pans()) < count and time.monotonic() < deadline:
+            time.sleep(TEST_DWELL_SECS / 10)
+        return self.__controller.pans()
+
+    def test_patrol_cycles_presets(self):
+        """
+        Test that patrol moves to each preset in turn, then starts over
+        """
+        self.__patrol.start()
+        pans = self.__wait_for_pans(4)
+
+        err_msg = 'Patrol did not cycle presets'
+        self.assertEqual(pans[:4], [10, 20, 30, 10], err_msg)
+        err_msg = 'Tilt not moved with pan'
+        self.assertIn(('tilt', 90), [(axis, angle) for axis, angle, _ in self.__controller.moves], err_msg)
+
+    def test_patrol_keeps_schedule(self):
+        """
+        Test that moves are a dwell apart without drift
+        """
+        self.__patrol.start()
+        self.__wait_for_pans(6)
+        self.__patrol.stop()
+        times = [when for axis, _, when in self.__controller.moves if axis == 'pan']
+
+        err_msg = 'Patrol drifted from schedule'
+        self.assertAlmostEqual(times[5] - times[0], TEST_DWELL_SECS * 5, delta=TEST_DWELL_SECS / 2, msg=err_msg)
+
+    def test_hold_pauses_patrol(self):
+        """
+        Test that a recording hold (set by another store, like the node's) pauses patrol until it ends
+        """
+        self.__patrol.start()
+        self.__wait_for_pans(1)
+        PresetStore(os.path.join(self.__dir.name, 'patrol.db')).hold(RECORDING, TEST_DWELL_SECS * 6)
+        time.sleep(TEST_DWELL_SECS * 4)
+        pans = self.__controller.pans()
+
+        err_msg = 'Patrol moved during recording'
+        self.assertLessEqual(len(pans), 2, err_msg)
+        err_msg = 'Patrol not paused'
+        self.assertTrue(self.__patrol.get_stats()['paused'], err_msg)
+        err_msg = 'Patrol did not resume after hold'
+        self.assertGreater(len(self.__wait_for_pans(len(pans) + 1)), len(pans), err_msg)
+
+    def test_goto_preset_pauses_patrol(self):
+        """
+        Test that moving to a preset pauses patrol there until resumed
+        """
+        self.__patrol.start()
+        self.__wait_for_pans(1)
+        err_msg = 'Unknown preset moved to'
+        self.assertIsNone(self.__patrol.goto_preset('garage'), err_msg)
+        err_msg = 'Preset not moved to'
+        self.assertEqual(self.__patrol.goto_preset('yard')['pan'], 30, err_msg)
+        time.sleep(TEST_DWELL_SECS * 3)
+        pans = self.__controller.pans()
+        err_msg = 'Patrol moved away from preset'
+        self.assertEqual(pans[-1], 30, err_msg)
+
+        self.__patrol.resume()
+        err_msg = 'Patrol not resumed'
+        self.assertGreater(len(self.__wait_for_pans(len(pans) + 1)), len(pans), err_msg)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format=c.LOGGING_FORMAT, level=c.LOGGING_TEST_LEVEL)
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+"""
+Pipeline.py tests
+"""
+
+import logging
+import threading
+from unittest import TestCase, main
+from pipeline import Pipeline
+import constants as c
+
+
+class TestPipeline(TestCase):
+    """
+    Test methods for Pipeline
+    Attributes
+    ----------
+    __pipeline : Pipeline
+    __done : list
+        Stages each event passed through, in order
+    __lock : Lock
+        Guards __done
+    Methods
+    -------
+    setUp()
+    tearDown()
+    test_events_pass_through_stages()
+    test_failed_stage_stops_event()
+    test_slow_stage_does_not_block_submit()
+    """
+
+    def setUp(self):
+        """
+        Setup TestPipeline
+        """
+        self.__pipeline = Pipeline()
+        self.__done = []
+        self.__lock = threading.Lock()
+
+    def tearDown(self):
+        """
+        Teardown TestPipeline
+        """
+        self.__pipeline.stop()
+
+    def __record(self, name):
+        """
+        Make a stage function recording that an event passed through
+        Parameters
+        ----------
+        name : str
+            Name of stage
+        Returns
+        -------
+        function
+            Stage function
+        """
+        def stage(event):
+            with self.__lock:
+                self.__done.append((name, event['id']))
+        return stage
+
+    def test_events_pass_through_stages(self):
+        """
+        Test that every event passes through each branch in order
+        """
+        report = self.__pipeline.add_stage('report', self.__record('report'))
+        convert = self.__pipeline.add_stage('convert', self.__record('convert'), workers=2)
+        self.__pipeline.add_stage('upload', self.__record('upload'), after=convert)
+        self.__pipeline.start()
+
+        for i in range(5):
+            self.__pipeline.submit({'id': i})
+        self.__pipeline.stop()
+
+        for i in range(5):
+            err_msg = 'Event {} skipped a stage'.format(i)
+            self.assertIn(('report', i), self.__done, err_msg)
+            err_msg = 'Event {} uploaded before being converted'.format(i)
+            self.assertLess(self.__done.index(('convert', i)), self.__done.index(('upload', i)), err_msg)
+
+        metrics = self.__pipeline.get_metrics()
+        err_msg = 'Processed events not counted'
+        self.assertEqual(metrics['upload']['processed'], 5, err_msg)
+        err_msg = 'Queue not empty'
+        self.assertEqual(metrics['upload']['depth'], 0, err_msg)
+
+    def test_failed_stage_stops_event(self):
+        """
+        Test that a failed stage (even calling exit()) doesn't pass the event on
+        or end its worker
+        """
+        def convert(event):
+            if event['id'] == 0:
+                exit()
+        convert = self.__pipeline.add_stage('convert', convert)
+        self.__pipeline.add_stage('upload', self.__record('upload'), after=convert)
+        self.__pipeline.start()
+
+        self.__pipeline.submit({'id': 0})
+        self.__pipeline.submit({'id': 1})
+        self.__pipeline.stop()
+
+        err_msg = 'Only the converted event should be uploaded'
+        self.assertEqual(self.__done, [('upload', 1)], err_msg)
+        err_msg = 'Failed event not counted'
+        self.assertEqual(self.__pipeline.get_metrics()['convert']['failed'], 1, err_msg)
+
+    def test_slow_stage_does_not_block_submit(self):
+        """
+        Test that submitting returns while an earlier event is still processing
+        """
+        release = threading.Event()
+        self.__pipeline.add_stage('upload', lambda event: release.wait())
+        self.__pipeline.start()
+
+        self.__pipeline.submit({'id': 0})
+        self.__pipeline.submit({'id': 1})
+        metrics = self.__pipeline.get_metrics()
+        release.set()
+
+        err_msg = 'Second event should be waiting in queue'
+        self.assertGreaterEqual(metrics['upload']['depth'], 1, err_msg)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format=c.LOGGING_FORMAT, level=c.LOGGING_TEST_LEVEL)
+    main()
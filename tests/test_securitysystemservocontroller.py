@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+"""
+ServoController.py tests
+"""
+
+import logging
+import threading
+import time
+from unittest import TestCase, main
+from servocontroller import ServoController, MIN_ANGLE, MAX_ANGLE
+import constants as c
+
+TEST_STEP_DEGREES = 5
+TEST_STEP_SECS = 0.001
+TEST_SETTLE_SECS = 0.05
+TEST_TIMEOUT_SECS = 2
+
+
+class FakeServo:
+    """
+    Records set_angle & release calls in place of PanTilt
+    Attributes
+    ----------
+    calls : list
+        ('set', axis, angle) & ('release', axis, None) in order
+    __lock : Lock
+        Guards calls
+    Methods
+    -------
+    set_angle(axis, angleInDegrees)
+        Records an angle
+    release(axis)
+        Records a release
+    angles(axis)
+        Gets angles set on an axis
+    """
+
+    def __init__(self):
+        """
+        Initializes the FakeServo
+        """
+        self.calls = []
+        self.__lock = threading.Lock()
+
+    def set_angle(self, axis, angleInDegrees):
+        """
+        Records an angle
+        """
+        with self.__lock:
+            self.calls.append(('set', axis, angleInDegrees))
+
+    def release(self, axis):
+        """
+        Records a release
+        """
+        with self.__lock:
+            self.calls.append(('release', axis, None))
+
+    def angles(self, axis):
+        """
+        Gets angles set on an axis
+        """
+        with self.__lock:
+            return [angle for call, call_axis, angle in self.calls if call == 'set' and call_axis == axis]
+
+
+class TestServoController(TestCase):
+    """
+    Test methods of ServoController
+    Attributes
+    ----------
+    __servo : FakeServo
+        Stands in for PanTilt
+    __controller : ServoController
+        Controller under test
+    Methods
+    -------
+    setUp()
+    tearDown()
+    test_targets_clamped()
+    test_commands_coalesced()
+    test_moves_in_steps()
+    test_released_after_settle()
+    test_move_returns_immediately()
+    test_concurrent_moves_add_up()
+    test_unknown_axis()
+    """
+
+    def setUp(self):
+        """
+        Setup TestServoController
+        """
+        self.__servo = FakeServo()
+        self.__controller = ServoController(self.__servo, initial_angle=90, step_degrees=TEST_STEP_DEGREES,
+                                            step_secs=TEST_STEP_SECS, settle_secs=TEST_SETTLE_SECS)
+
+    def tearDown(self):
+        """
+        Stop the controller thread
+        """
+        self.__controller.stop()
+
+    def __wait_for(self, condition):
+        """
+        Wait until condition() is true or the timeout passes
+        """
+        deadline = time.monotonic() + TEST_TIMEOUT_SECS
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(TEST_STEP_SECS)
+        return condition()
+
+    def test_targets_clamped(self):
+        """
+        Test that targets are clamped to the servo range
+        """
+        err_msg = 'Target not clamped to servo range'
+        self.assertEqual(self.__controller.move_to('pan', 500), MAX_ANGLE, err_msg)
+        self.assertEqual(self.__controller.move_by('tilt', -500), MIN_ANGLE, err_msg)
+        self.assertEqual(self.__controller.move_by('pan', 10), MAX_ANGLE, err_msg)
+
+    def test_commands_coalesced(self):
+        """
+        Test that moves queued before the thread reads them add up to one target
+        """
+        for _ in range(5):
+            self.__controller.move_by('pan', 10)
+        self.__controller.start()
+        self.__controller.stop()
+
+        err_msg = 'Moves did not add up to the latest target'
+        self.assertEqual(self.__controller.get_targets()['pan'], 140, err_msg)
+        self.assertEqual(self.__controller.get_positions()['pan'], 140, err_msg)
+        err_msg = 'Queued moves not coalesced'
+        self.assertEqual(self.__controller.get_stats()['coalesced'], 5, err_msg)
+        err_msg = 'Servo moved to superseded targets'
+        self.assertEqual(self.__servo.angles('pan'), [140], err_msg)
+
+    def test_moves_in_steps(self):
+        """
+        Test that servos step towards a new target instead of jumping
+        """
+        self.__controller.start()
+        self.__wait_for(lambda: self.__controller.get_positions()['tilt'] == 90)
+        self.__controller.move_to('tilt', 112)
+        self.__controller.stop()
+
+        err_msg = 'Servo did not step to target'
+        self.assertEqual(self.__servo.angles('tilt'), [90, 95, 100, 105, 110, 112], err_msg)
+
+    def test_released_after_settle(self):
+        """
+        Test that PWM is released once a servo has settled at its target
+        """
+        self.__controller.start()
+        released = self.__wait_for(lambda: ('release', 'pan', None) in self.__servo.calls)
+
+        err_msg = 'Servo not released after settling'
+        self.assertTrue(released, err_msg)
+        err_msg = 'Servo released before settling'
+        self.assertLess(self.__servo.calls.index(('set', 'pan', 90)), self.__servo.calls.index(('release', 'pan', None)), err_msg)
+
+    def test_move_returns_immediately(self):
+        """
+        Test that a long move is queued without waiting for the servo
+        """
+        self.__controller = ServoController(self.__servo, initial_angle=0, step_degrees=1, step_secs=0.01,
+                                            settle_secs=TEST_SETTLE_SECS)
+        self.__controller.start()
+        start = time.monotonic()
+        target = self.__controller.move_to('pan', 180)
+        took = time.monotonic() - start
+
+        err_msg = 'Move waited for the servo'
+        self.assertLess(took, 0.1, err_msg)
+        err_msg = 'Target angle not returned'
+        self.assertEqual(target, 180, err_msg)
+        self.__controller.stop()
+        err_msg = 'Stop did not finish the move'
+        self.assertEqual(self.__controller.get_positions()['pan'], 180, err_msg)
+
+    def test_concurrent_moves_add_up(self):
+        """
+        Test that relative moves from concurrent requests all add up
+        """
+        self.__controller = ServoController(self.__servo, initial_angle=0, step_degrees=TEST_STEP_DEGREES,
+                                            step_secs=TEST_STEP_SECS, settle_secs=TEST_SETTLE_SECS)
+        threads = [threading.Thread(target=lambda: [self.__controller.move_by('pan', 1) for _ in range(20)])
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        err_msg = 'Concurrent relative moves lost'
+        self.assertEqual(self.__controller.get_targets()['pan'], 160, err_msg)
+        self.__controller.start()
+        self.__controller.stop()
+        err_msg = 'Servo did not end at the latest target'
+        self.assertEqual(self.__controller.get_positions()['pan'], 160, err_msg)
+
+    def test_unknown_axis(self):
+        """
+        Test that moving an unknown axis is an error
+        """
+        err_msg = 'Unknown axis accepted'
+        with self.assertRaises(ValueError, msg=err_msg):
+            self.__controller.move_to('zoom', 90)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format=c.LOGGING_FORMAT, level=c.LOGGING_TEST_LEVEL)
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+"""
+UploadManager.py tests
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase, main
+from sqlitepool import DB_POOL
+from uploadmanager import UploadManager, LocalDirectoryBackend, Throttle, DONE, FAILED
+import constants as c
+
+TEST_CHUNK_BYTES = 1024
+TEST_BACKOFF_SECS = 0.01
+
+
+class FlakyBackend(LocalDirectoryBackend):
+    """
+    LocalDirectoryBackend failing chunk appends on request
+    Attributes
+    ----------
+    failures : int
+        Number of appends left to fail
+    fail_offset : int
+        Appends fail from this offset on
+    appended : list
+        Offsets of chunks appended
+    """
+    def __init__(self, directory, failures=0, fail_offset=0):
+        super().__init__(directory)
+        self.failures = failures
+        self.fail_offset = fail_offset
+        self.appended = []
+
+    def append(self, session, offset, data):
+        if self.failures and offset >= self.fail_offset:
+            self.failures -= 1
+            raise ConnectionError('Network down')
+        self.appended.append(offset)
+        return super().append(session, offset, data)
+
+
+class TestUploadManager(TestCase):
+    """
+    Test methods of UploadManager
+    Attributes
+    ----------
+    __dir : TemporaryDirectory
+        Holds videos, uploaded files & queue DB
+    __uploaded : list
+        (meta, link) of each upload callback
+    Methods
+    -------
+    setUp()
+    tearDown()
+    test_uploads_drain_in_parallel()
+    test_failed_chunk_resumes()
+    test_queue_survives_restart()
+    test_gives_up_after_max_attempts()
+    test_throttle_limits_rate()
+    """
+
+    def setUp(self):
+        """
+        Setup TestUploadManager
+        """
+        self.__dir = tempfile.TemporaryDirectory()
+        self.__db_file = os.path.join(self.__dir.name, 'uploads.db')
+        self.__remote = os.path.join(self.__dir.name, 'remote')
+        self.__uploaded = []
+        self.__lock = threading.Lock()
+
+    def tearDown(self):
+        """
+        Teardown TestUploadManager
+        """
+        DB_POOL.close_all()
+        self.__dir.cleanup()
+
+    def __manager(self, backend, **kwargs):
+        """
+        Make an UploadManager on the test queue DB
+        """
+        def on_uploaded(meta, link):
+            with self.__lock:
+                self.__uploaded.append((meta, link))
+        kwargs.setdefault('chunk_bytes', TEST_CHUNK_BYTES)
+        kwargs.setdefault('backoff_secs', TEST_BACKOFF_SECS)
+        return UploadManager(backend, db_file=self.__db_file, on_uploaded=on_uploaded, **kwargs)
+
+    def __video(self, name, size):
+        """
+        Make a local video file
+        Returns
+        -------
+        file : str
+            File name
+        """
+        file = os.path.join(self.__dir.name, name)
+        with open(file, 'wb') as f:
+            f.write(os.urandom(size))
+        return file
+
+    def __assert_uploaded(self, file, link):
+        """
+        Assert uploaded file matches local file
+        """
+        remote = os.path.join(self.__remote, os.path.basename(file))
+        err_msg = 'Wrong link'
+        self.assertTrue(link.endswith(os.path.basename(file)), err_msg)
+        with open(file, 'rb') as local, open(remote, 'rb') as uploaded:
+            err_msg = 'Uploaded file differs'
+            self.assertEqual(local.read(), uploaded.read(), err_msg)
+
+    def test_uploads_drain_in_parallel(self):
+        """
+        Test that a burst of uploads is sent by several workers & each is reported once
+        """
+        backend = LocalDirectoryBackend(self.__remote)
+        manager = self.__manager(backend, workers=3)
+        files = [self.__video('clip{}.mp4'.format(i), TEST_CHUNK_BYTES * 3 + 1 + i) for i in range(6)]
+        ids = [manager.enqueue(file, meta={'clip': i}) for i, file in enumerate(files)]
+        manager.start()
+        links = [manager.wait(upload_id, timeout=10) for upload_id in ids]
+        manager.stop()
+
+        for file, link in zip(files, links):
+            self.__assert_uploaded(file, link)
+        err_msg = 'Each upload should be reported once'
+        self.assertEqual(sorted(meta['clip'] for meta, _ in self.__uploaded), list(range(6)), err_msg)
+        stats = manager.get_stats()
+        err_msg = 'Wrong stats'
+        self.assertEqual(stats[DONE], 6, err_msg)
+        self.assertEqual(stats['chunks_sent'], 6 * 4, err_msg)
+        err_msg = 'Partial files left behind'
+        self.assertEqual(len(os.listdir(self.__remote)), 6, err_msg)
+
+    def test_failed_chunk_resumes(self):
+        """
+        Test that a failed chunk is retried without resending earlier chunks
+        """
+        backend = FlakyBackend(self.__remote, failures=2, fail_offset=TEST_CHUNK_BYTES * 2)
+        manager = self.__manager(backend, workers=1)
+        file = self.__video('clip.mp4', TEST_CHUNK_BYTES * 4)
+        upload_id = manager.enqueue(file)
+        manager.start()
+        link = manager.wait(upload_id, timeout=10)
+        manager.stop()
+
+        self.__assert_uploaded(file, link)
+        err_msg = 'Chunks resent after failure'
+        self.assertEqual(backend.appended, [i * TEST_CHUNK_BYTES for i in range(4)], err_msg)
+        err_msg = 'Retries not counted'
+        self.assertEqual(manager.get_stats()['retries'], 2, err_msg)
+
+    def test_queue_survives_restart(self):
+        """
+        Test that uploads queued (or interrupted) before a restart are sent after it
+        """
+        backend = LocalDirectoryBackend(self.__remote)
+        file = self.__video('clip.mp4', TEST_CHUNK_BYTES * 2)
+        upload_id = self.__manager(backend).enqueue(file, meta={'date': '2020-11-23'})
+        DB_POOL.close_all()
+
+        manager = self.__manager(backend)
+        err_msg = 'Queued file not pending'
+        self.assertEqual(manager.get_pending_files(), {file}, err_msg)
+        manager.start()
+        link = manager.wait(upload_id, timeout=10)
+        manager.stop()
+
+        self.__assert_uploaded(file, link)
+        err_msg = 'Metadata not kept'
+        self.assertEqual(self.__uploaded, [({'date': '2020-11-23'}, link)], err_msg)
+
+    def test_gives_up_after_max_attempts(self):
+        """
+        Test that an upload failing every attempt is marked failed
+        """
+        backend = FlakyBackend(self.__remote, failures=100)
+        manager = self.__manager(backend, max_attempts=3)
+        upload_id = manager.enqueue(self.__video('clip.mp4', TEST_CHUNK_BYTES))
+        manager.start()
+        link = manager.wait(upload_id, timeout=10)
+        manager.stop()
+
+        err_msg = 'Failed upload should have no link'
+        self.assertIsNone(link, err_msg)
+        err_msg = 'Upload not marked failed'
+        self.assertEqual(manager.get_stats()[FAILED], 1, err_msg)
+        err_msg = 'Failed upload reported'
+        self.assertEqual(self.__uploaded, [], err_msg)
+
+    def test_throttle_limits_rate(self):
+        """
+        Test that sending past the allowance waits
+        """
+        throttle = Throttle(TEST_CHUNK_BYTES * 10)
+        start = time.monotonic()
+        for _ in range(13):
+            throttle.consume(TEST_CHUNK_BYTES)
+        err_msg = 'Throttle did not wait'
+        self.assertGreaterEqual(time.monotonic() - start, 0.2, err_msg)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format=c.LOGGING_FORMAT, level=c.LOGGING_TEST_LEVEL)
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import logging
+from unittest import TestCase, main
+import fancontrol
+from fancontrol import FanControl, HysteresisControl, PIDControl, make_control, MAX_DUTY, PID
+import thingspeakinfo as c
+
+TEST_SETPOINT = 25
+TEST_BAND = 1.0
+TEST_DWELL_SEC = 60
+
+class TestHysteresisControl(TestCase):
+	def setUp(self):
+		self.__control = HysteresisControl(TEST_SETPOINT, band=TEST_BAND, min_on_sec=TEST_DWELL_SEC, min_off_sec=TEST_DWELL_SEC)
+
+	def test_no_chatter_in_band(self):
+		"""
+		Testing readings inside the band keep the fan as it was
+		"""
+		duties = [self.__control.update(temp, now=i * TEST_DWELL_SEC) for i, temp in enumerate([24.9, 25.1, 24.8, 25.2])]
+		err_msg = "Fan flipped inside the hysteresis band"
+		self.assertEqual(duties, [0, 0, 0, 0], err_msg)
+
+	def test_band_edges(self):
+		"""
+		Testing the fan turns ON above the band and OFF below it
+		"""
+		err_msg = "Fan not ON above the band"
+		self.assertEqual(self.__control.update(25.5, now=0), MAX_DUTY, err_msg)
+		self.assertEqual(self.__control.update(25.0, now=TEST_DWELL_SEC), MAX_DUTY, err_msg)
+		err_msg = "Fan not OFF below the band"
+		self.assertEqual(self.__control.update(24.5, now=TEST_DWELL_SEC * 2), 0, err_msg)
+
+	def test_dwell_time(self):
+		"""
+		Testing the fan stays ON for the minimum dwell time
+		"""
+		self.__control.update(26, now=0)
+		err_msg = "Fan turned OFF before the dwell time"
+		self.assertEqual(self.__control.update(20, now=TEST_DWELL_SEC - 1), MAX_DUTY, err_msg)
+		err_msg = "Fan not turned OFF after the dwell time"
+		self.assertEqual(self.__control.update(20, now=TEST_DWELL_SEC), 0, err_msg)
+		err_msg = "Stats do not count flips and held flips"
+		stats = self.__control.get_stats()
+		self.assertEqual((stats['flips'], stats['held']), (2, 1), err_msg)
+
+class TestPIDControl(TestCase):
+	def test_duty_follows_error(self):
+		"""
+		Testing the duty grows with the temperature above the setpoint
+		"""
+		control = PIDControl(TEST_SETPOINT, kp=20, ki=0, kd=0, min_duty=30, min_on_sec=0, min_off_sec=0)
+		err_msg = "Duty not proportional to error"
+		self.assertEqual(control.update(27, now=0), 40, err_msg)
+		self.assertEqual(control.update(40, now=1), MAX_DUTY, err_msg)
+		err_msg = "Duty below the stall duty not turned OFF"
+		self.assertEqual(control.update(26, now=2), 0, err_msg)
+
+	def test_integral_bounded(self):
+		"""
+		Testing the integral does not wind up while the fan is saturated
+		"""
+		control = PIDControl(TEST_SETPOINT, kp=0, ki=1, kd=0, min_duty=0, min_on_sec=0, min_off_sec=0)
+		for i in range(100):
+			control.update(35, now=i)
+		err_msg = "Integral wound up past full duty"
+		self.assertEqual(control.update(25, now=100), MAX_DUTY, err_msg)
+		self.assertLess(control.update(15, now=110), MAX_DUTY, err_msg)
+
+class TestFanControl(TestCase):
+	def test_engine_required(self):
+		"""
+		Testing a control without an engine cannot be constructed
+		"""
+		err_msg = "Control without an engine was constructed"
+		with self.assertRaises(TypeError, msg = err_msg):
+			FanControl()
+
+class TestMakeControl(TestCase):
+	def tearDown(self):
+		fancontrol.LOCATION_CONTROLS.clear()
+
+	def test_per_location(self):
+		"""
+		Testing a location gets its own control settings, and overrides win
+		"""
+		fancontrol.LOCATION_CONTROLS['test_location'] = {'mode': PID, 'setpoint': 22}
+		control = make_control('test_location')
+		err_msg = "Location settings not used"
+		self.assertIsInstance(control, PIDControl, err_msg)
+		self.assertEqual(control.setpoint, 22, err_msg)
+		err_msg = "Override not used"
+		self.assertEqual(make_control('test_location', setpoint=20, mode=None).setpoint, 20, err_msg)
+		self.assertIsInstance(make_control('other_location'), HysteresisControl, err_msg)
+
+if __name__ == '__main__':
+	logging.basicConfig(format=c.LOGGING_FORMAT, level = c.LOGGING_TEST_LEVEL)
+	main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import logging
+from unittest import TestCase, main
+from reportpolicy import ReportPolicy, FIRST, FAN_CHANGED, TEMP_CHANGED, HEARTBEAT
+import thingspeakinfo as c
+
+TEST_DEADBAND = 0.5
+TEST_SILENCE_SEC = 60
+
+class TestReportPolicy(TestCase):
+	def setUp(self):
+		self.__policy = ReportPolicy(abs_deadband=TEST_DEADBAND, max_silence=TEST_SILENCE_SEC)
+		self.__policy.check(20.0, c.OFF_INT, now=0)
+
+	def test_first_reading_reported(self):
+		"""
+		Testing the first reading is always reported
+		"""
+		err_msg = "First reading was not reported"
+		self.assertEqual(ReportPolicy().check(20.0, c.OFF_INT, now=0), FIRST, err_msg)
+
+	def test_small_change_suppressed(self):
+		"""
+		Testing readings inside the deadband are not reported
+		"""
+		err_msg = "Reading inside the deadband was reported"
+		self.assertIsNone(self.__policy.check(20.3, c.OFF_INT, now=5), err_msg)
+		self.assertIsNone(self.__policy.check(19.6, c.OFF_INT, now=10), err_msg)
+		err_msg = "Suppressed readings not counted"
+		self.assertEqual(self.__policy.get_stats()['suppressed'], 2, err_msg)
+
+	def test_drift_reported(self):
+		"""
+		Testing a slow drift is reported once it leaves the deadband of the last report
+		"""
+		self.__policy.check(20.3, c.OFF_INT, now=5)
+		err_msg = "Drift past the deadband was not reported"
+		self.assertEqual(self.__policy.check(20.6, c.OFF_INT, now=10), TEMP_CHANGED, err_msg)
+
+	def test_fan_change_reported(self):
+		"""
+		Testing a fan change is reported right away
+		"""
+		err_msg = "Fan change was not reported"
+		self.assertEqual(self.__policy.check(20.0, c.ON_INT, now=5), FAN_CHANGED, err_msg)
+
+	def test_heartbeat_reported(self):
+		"""
+		Testing a steady reading is reported after the max silence
+		"""
+		err_msg = "Steady reading reported before the max silence"
+		self.assertIsNone(self.__policy.check(20.0, c.OFF_INT, now=TEST_SILENCE_SEC - 1), err_msg)
+		err_msg = "Heartbeat was not reported"
+		self.assertEqual(self.__policy.check(20.0, c.OFF_INT, now=TEST_SILENCE_SEC), HEARTBEAT, err_msg)
+
+	def test_relative_deadband(self):
+		"""
+		Testing the relative deadband is used when wider than the absolute one
+		"""
+		policy = ReportPolicy(abs_deadband=TEST_DEADBAND, rel_deadband=0.1)
+		policy.check(20.0, c.OFF_INT, now=0)
+		err_msg = "Relative deadband was not used"
+		self.assertEqual(policy.deadband(), 2.0, err_msg)
+		self.assertIsNone(policy.check(21.5, c.OFF_INT, now=5), err_msg)
+
+if __name__ == '__main__':
+	logging.basicConfig(format=c.LOGGING_FORMAT, level = c.LOGGING_TEST_LEVEL)
+	main()
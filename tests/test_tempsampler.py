@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+import time
+from unittest import TestCase, main
+from sampler import RingBuffer, Sampler
+import thingspeakinfo as c
+
+TEST_PERIOD_SEC = 0.01
+TEST_TIMEOUT_SEC = 2
+TEST_FIELDS = ('temperature', 'humidity')
+
+class FakeSensor:
+	def __init__(self, values):
+		self.__values = list(values)
+		self.__lock = threading.Lock()
+		self.reads = 0
+
+	def read(self):
+		"""
+		Returns the next value for each field, the last one once all are read
+		"""
+		with self.__lock:
+			self.reads += 1
+			value = self.__values[min(self.reads, len(self.__values)) - 1]
+		if value is None:
+			raise OSError('I2C read failed')
+		return value, value * 2
+
+class TestRingBuffer(TestCase):
+	def test_keeps_newest(self):
+		"""
+		Testing a full buffer overwrites the oldest value
+		"""
+		buffer = RingBuffer(3)
+		for value in range(5):
+			buffer.append(value)
+		err_msg = "Ring buffer did not keep the newest values in order"
+		self.assertEqual(buffer.values(), [2, 3, 4], err_msg)
+		self.assertEqual(len(buffer), 3, err_msg)
+
+	def test_median(self):
+		"""
+		Testing the median ignores a spike
+		"""
+		buffer = RingBuffer(5)
+		for value in [20, 21, 90, 20, 21]:
+			buffer.append(value)
+		err_msg = "Median did not reject the spike"
+		self.assertEqual(buffer.median(), 21, err_msg)
+
+class TestSampler(TestCase):
+	def wait_for_reads(self, sensor, count):
+		"""
+		Waiting until count samples are read or the timeout passes
+		"""
+		deadline = time.monotonic() + TEST_TIMEOUT_SEC
+		while sensor.reads < count and time.monotonic() < deadline:
+			time.sleep(TEST_PERIOD_SEC)
+
+	def test_first_sample_on_start(self):
+		"""
+		Testing a reading is available as soon as the sampler starts
+		"""
+		sampler = Sampler(FakeSensor([20]).read, TEST_FIELDS, period=TEST_TIMEOUT_SEC * 10)
+		err_msg = "Reading available before the first sample"
+		self.assertIsNone(sampler.get_latest(), err_msg)
+		sampler.start()
+		err_msg = "First sample not taken on start"
+		self.assertEqual(sampler.get_latest(), {'temperature': 20, 'humidity': 40}, err_msg)
+		sampler.stop()
+
+	def test_filtered_in_background(self):
+		"""
+		Testing the sampler keeps sampling in the background, filtering out a spike
+		"""
+		sensor = FakeSensor([20, 20, 90, 20, 20])
+		sampler = Sampler(sensor.read, TEST_FIELDS, period=TEST_PERIOD_SEC, window=3, alpha=1)
+		sampler.start()
+		self.wait_for_reads(sensor, 5)
+		sampler.stop()
+
+		err_msg = "Sampler did not sample in the background"
+		self.assertGreaterEqual(sampler.get_stats()['samples'], 5, err_msg)
+		err_msg = "Spike was not filtered out"
+		self.assertEqual(sampler.get_latest()['temperature'], 20, err_msg)
+
+	def test_ema_smooths(self):
+		"""
+		Testing the moving average approaches a step change
+		"""
+		sensor = FakeSensor([20, 30])
+		sampler = Sampler(sensor.read, TEST_FIELDS, period=TEST_PERIOD_SEC, window=1, alpha=0.5)
+		sampler.start()
+		self.wait_for_reads(sensor, 2)
+		sampler.stop()
+
+		err_msg = "Step change was not smoothed"
+		temperature = sampler.get_latest()['temperature']
+		self.assertGreater(temperature, 20, err_msg)
+		self.assertLess(temperature, 30, err_msg)
+
+	def test_failed_read_kept_last(self):
+		"""
+		Testing a failed read keeps the last reading and is counted
+		"""
+		sensor = FakeSensor([20, None])
+		sampler = Sampler(sensor.read, TEST_FIELDS, period=TEST_PERIOD_SEC)
+		sampler.start()
+		self.wait_for_reads(sensor, 3)
+		sampler.stop()
+
+		err_msg = "Failed read changed the reading"
+		self.assertEqual(sampler.get_latest()['temperature'], 20, err_msg)
+		err_msg = "Failed reads not counted"
+		self.assertGreater(sampler.get_stats()['errors'], 0, err_msg)
+
+	def test_age_grows_while_failing(self):
+		"""
+		Testing the age of the last good sample grows past stale while reads fail
+		"""
+		sensor = FakeSensor([20, None])
+		sampler = Sampler(sensor.read, TEST_FIELDS, period=TEST_PERIOD_SEC)
+		err_msg = "Age given before the first sample"
+		self.assertIsNone(sampler.get_age(), err_msg)
+		sampler.start()
+		err_msg = "Fresh sample reported stale"
+		self.assertLess(sampler.get_age(), sampler.stale_secs, err_msg)
+		time.sleep(sampler.stale_secs * 2)
+		sampler.stop()
+
+		err_msg = "Failing sensor not reported stale"
+		self.assertGreater(sampler.get_age(), sampler.stale_secs, err_msg)
+
+if __name__ == '__main__':
+	logging.basicConfig(format=c.LOGGING_FORMAT, level = c.LOGGING_TEST_LEVEL)
+	main()
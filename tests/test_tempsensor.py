@@ -65,6 +65,18 @@ class TestFan(TestCase):
 		calls = [call(self.pin, GPIO.HIGH), call(self.pin, GPIO.LOW)]
 		mock_output.assert_has_calls(calls)
 
+	def test_set_duty(self, mock_output):
+		"""
+		TESTING FAN DUTY WITHOUT PWM
+		"""
+		self.fan.set_duty(60)
+		self.fan.set_duty(0)
+		err_msg = "FAN was not turned on for a duty and off for none"
+		self.assertEqual(self.fan.get_status(), 0, err_msg)
+
+		calls = [call(self.pin, GPIO.HIGH), call(self.pin, GPIO.LOW)]
+		mock_output.assert_has_calls(calls)
+
 @patch("RPi.GPIO.output", autospec = True)
 class TestTemperature(TestCase):
 	def setUp(self):
@@ -1,7 +1,9 @@
 import logging
 import os
+import sqlite3
 from unittest import TestCase, main, skipIf
-from tempDB import TempDB
+from tempDB import TempDB, SCHEMA_VERSION
+from sqlitepool import DB_POOL
 
 TEMP_DB = 'temp_tempsensor.db'
 TEMP_TABLE = 'temp_tempsensor'
@@ -15,6 +17,7 @@ class TestTempDB(TestCase):
 
 	def tearDown(self):
 		self.__db.manual_exit()
+		DB_POOL.close_all()
 		if os.path.exists(TEMP_DB):
 			os.remove(TEMP_DB)
 
@@ -53,6 +56,120 @@ class TestTempDB(TestCase):
 
 		self.assertRaises(Exception, self.__db.add_record, record)
 
+	def test_add_records(self):
+		record_1 = {'date': '2020-11-22',
+			    'time': '13:51:42',
+			    'location': 'test_location',
+			    'nodeID': 'test_node1',
+			    'fanStatus': 1,
+			    'tempVal': 24.3}
+		record_2 = {'date': '2020-11-22',
+			    'time': '13:51:57',
+			    'location': 'test_location',
+			    'nodeID': 'test_node1',
+			    'fanStatus': 0,
+			    'tempVal': 24.1}
+
+		self.__db.create_table()
+		self.__db.create_unique_index()
+		self.__db.add_record(record_1)
+
+		added = self.__db.add_records([record_1, record_2, record_2])
+		error_msg = 'Only the new record should be added'
+		self.assertEqual(added, 1, error_msg)
+		error_msg = 'Records in DB table do not match'
+		self.assertEqual(self.__db.get_records(), [record_1, record_2], error_msg)
+
+	def test_migrate_legacy_table(self):
+		record = {'date': '2020-11-22',
+			  'time': '13:51:42',
+			  'location': 'test_location',
+			  'nodeID': 'test_node1',
+			  'fanStatus': 1,
+			  'tempVal': 24.3}
+		row = tuple(record.values())
+
+		legacy_db = sqlite3.connect(TEMP_DB)
+		legacy_db.execute("create table {} (date text, time text, location text, \
+			nodeID text, fanStatus integer, tempVal float)".format(TEMP_TABLE))
+		legacy_db.executemany("insert into {} values(?, ?, ?, ?, ?, ?)".format(TEMP_TABLE), [row, row])
+		legacy_db.commit()
+		legacy_db.close()
+
+		with self.assertLogs(level='WARNING') as logs:
+			self.__db.migrate()
+		error_msg = 'Deleted duplicate records not logged'
+		self.assertIn('Deleted 1 duplicate records', ' '.join(logs.output), error_msg)
+		error_msg = 'Table not upgraded to latest schema'
+		self.assertEqual(self.__db.get_schema_version(), SCHEMA_VERSION, error_msg)
+		error_msg = 'Duplicate records not removed'
+		self.assertEqual(self.__db.get_records(), [record], error_msg)
+		error_msg = 'Existing record added again'
+		self.assertEqual(self.__db.add_records([record]), 0, error_msg)
+
+	def test_migrate_tables_in_one_file(self):
+		record = {'date': '2020-11-22',
+			  'time': '13:51:42',
+			  'location': 'test_location',
+			  'nodeID': 'test_node1',
+			  'fanStatus': 1,
+			  'tempVal': 24.3}
+		legacy_table = TEMP_TABLE + '_legacy'
+
+		self.__db.migrate()
+		self.__db.manual_exit()
+		legacy_db = sqlite3.connect(TEMP_DB)
+		legacy_db.execute("create table {} (date text, time text, location text, \
+			nodeID text, fanStatus integer, tempVal float)".format(legacy_table))
+		legacy_db.commit()
+		legacy_db.close()
+		self.__db.manual_enter()
+
+		other_db = TempDB(db_file = TEMP_DB, name = legacy_table)
+		other_db.manual_enter()
+		other_db.migrate()
+		version = other_db.get_schema_version()
+		added = [other_db.add_records([record]) for _ in range(2)]
+		other_db.manual_exit()
+
+		error_msg = 'Table not upgraded to latest schema'
+		self.assertEqual(version, SCHEMA_VERSION, error_msg)
+		error_msg = 'Table not given its unique index'
+		self.assertEqual(added, [1, 0], error_msg)
+
+	def test_migrate_enables_wal(self):
+		self.__db.migrate()
+		self.__db.manual_exit()
+
+		with sqlite3.connect(TEMP_DB) as db:
+			journal_mode = db.execute('PRAGMA journal_mode').fetchone()[0]
+		error_msg = 'DB file not in WAL mode'
+		self.assertEqual(journal_mode, 'wal', error_msg)
+		self.__db.manual_enter()
+
+	def test_pooled_connection_reused(self):
+		self.__db.create_table()
+		self.__db.manual_exit()
+		hits = DB_POOL.get_stats()['hits']
+
+		self.__db.manual_enter()
+		error_msg = 'Pooled connection not reused'
+		self.assertEqual(DB_POOL.get_stats()['hits'], hits + 1, error_msg)
+		error_msg = 'Table does not exist'
+		self.assertTrue(self.__db.table_exists(), error_msg)
+
+	def test_stale_connection_dropped(self):
+		self.__db.create_table()
+		self.__db.manual_exit()
+		os.remove(TEMP_DB)
+		stale = DB_POOL.get_stats()['stale']
+
+		self.__db.manual_enter()
+		error_msg = 'Stale pooled connection reused'
+		self.assertEqual(DB_POOL.get_stats()['stale'], stale + 1, error_msg)
+		error_msg = 'Table exists unexpectedly'
+		self.assertFalse(self.__db.table_exists(), error_msg)
+
 	@skipIf(not os.path.exists(PREMADE_DB), 'Run test in top level directory')
 	def test_get_records(self):
 		self.__db = TempDB(db_file = PREMADE_DB, name = PREMADE_TABLE)
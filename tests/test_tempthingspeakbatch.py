@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+ThingSpeakWriter keep-alive, WriteScheduler, BatchWriter & Outbox tests (against a local fake ThingSpeak)
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, main
+from thingspeakwriter import ThingSpeakWriter, BatchWriter, Outbox, WriteScheduler
+import thingspeakinfo as c
+
+TEST_KEY = 'TESTKEY'
+TEST_CHANNEL = '42'
+TEST_TIMEOUT_SECS = 2
+TEST_SLOT_SECS = 0.05
+POLL_SECS = 0.01
+
+
+class FakeThingSpeakHandler(BaseHTTPRequestHandler):
+	"""
+	Records POSTs and answers like ThingSpeak (keep-alive unless server.drop_connections)
+	"""
+	protocol_version = 'HTTP/1.1'
+
+	def do_POST(self):
+		"""
+		Records a request and responds with server.status
+		"""
+		body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+		with self.server.lock:
+			self.server.requests.append((self.path, body, self.client_address))
+			status = self.server.status
+		reply = b'1'
+		self.send_response(status)
+		self.send_header('Content-Length', str(len(reply)))
+		self.end_headers()
+		self.wfile.write(reply)
+		# like a server timing out an idle keep-alive connection, without saying so
+		self.close_connection = self.server.drop_connections
+
+	def log_message(self, format, *args):
+		"""
+		Quiet
+		"""
+
+
+class TestBatchWriter(TestCase):
+	"""
+	Test methods of ThingSpeakWriter, WriteScheduler & BatchWriter
+	"""
+
+	def setUp(self):
+		"""
+		Start fake ThingSpeak
+		"""
+		self.__server = ThreadingHTTPServer(('127.0.0.1', 0), FakeThingSpeakHandler)
+		self.__server.lock = threading.Lock()
+		self.__server.requests = []
+		self.__server.status = c.GOOD_STATUS
+		self.__server.drop_connections = False
+		threading.Thread(target=self.__server.serve_forever, args=(POLL_SECS,), daemon=True).start()
+		self.__dir = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		"""
+		Stop fake ThingSpeak
+		"""
+		self.__server.shutdown()
+		self.__server.server_close()
+		self.__dir.cleanup()
+
+	def __writer(self, channel=TEST_CHANNEL, scheduler=None):
+		"""
+		ThingSpeakWriter pointed at the fake server, not rate limited unless given a scheduler
+		"""
+		scheduler = scheduler if scheduler is not None else WriteScheduler(interval_secs=0)
+		return ThingSpeakWriter(TEST_KEY, channel, host='127.0.0.1', port=self.__server.server_address[1],
+								scheduler=scheduler)
+
+	def __batch_writer(self, channel=TEST_CHANNEL, max_rows=1000, scheduler=None, **kwargs):
+		"""
+		BatchWriter with its outbox in the test directory
+		"""
+		outbox = Outbox(os.path.join(self.__dir.name, 'outbox.db'), max_rows=max_rows)
+		return BatchWriter(self.__writer(channel, scheduler), outbox, **kwargs)
+
+	def __requests(self):
+		"""
+		Requests received so far
+		"""
+		with self.__server.lock:
+			return list(self.__server.requests)
+
+	def __wait_for_requests(self, count):
+		"""
+		Wait until count requests are received or the timeout passes
+		"""
+		deadline = time.monotonic() + TEST_TIMEOUT_SECS
+		while len(self.__requests()) < count and time.monotonic() < deadline:
+			time.sleep(POLL_SECS)
+		return self.__requests()
+
+	def test_connection_kept_alive(self):
+		"""
+		Test that writes reuse one connection
+		"""
+		writer = self.__writer()
+		for i in range(3):
+			status, reason = writer.write_to_channel({c.TEST_FIELD: i})
+			err_msg = 'Status of write was unexpected!'
+			self.assertEqual(status, c.GOOD_STATUS, err_msg)
+		writer.close()
+
+		err_msg = 'Connection not kept alive'
+		self.assertEqual(writer.get_stats()['connections'], 1, err_msg)
+		self.assertEqual(len({address for _, _, address in self.__requests()}), 1, err_msg)
+
+	def test_reconnects_when_dropped(self):
+		"""
+		Test that a write on a connection the server dropped is retried on a new one
+		"""
+		self.__server.drop_connections = True
+		writer = self.__writer()
+		statuses = [writer.write_to_channel({c.TEST_FIELD: i})[0] for i in range(3)]
+		writer.close()
+
+		err_msg = 'Write on dropped connection failed'
+		self.assertEqual(statuses, [c.GOOD_STATUS] * 3, err_msg)
+		self.assertEqual(len(self.__requests()), 3, err_msg)
+
+	def test_batch_flushed_by_size(self):
+		"""
+		Test that a full batch is sent as one bulk update JSON
+		"""
+		batch_writer = self.__batch_writer(batch_size=3, max_age_secs=60)
+		self.__server.status = c.QUEUED_STATUS
+		for i in range(3):
+			status, reason = batch_writer.write_to_channel({c.TEST_FIELD: i})
+			err_msg = 'Write was not queued'
+			self.assertEqual(status, c.QUEUED_STATUS, err_msg)
+		requests = self.__wait_for_requests(1)
+		batch_writer.close()
+
+		err_msg = 'Batch not sent as one bulk update'
+		self.assertEqual(len(requests), 1, err_msg)
+		path, body, _ = requests[0]
+		self.assertEqual(path, '/channels/{}/bulk_update.json'.format(TEST_CHANNEL), err_msg)
+		body = json.loads(body)
+		self.assertEqual(body['write_api_key'], TEST_KEY, err_msg)
+		self.assertEqual([update[c.TEST_FIELD] for update in body['updates']], [0, 1, 2], err_msg)
+		err_msg = 'Update not timestamped'
+		self.assertTrue(all('created_at' in update for update in body['updates']), err_msg)
+		err_msg = 'Stats do not count sent readings'
+		self.assertEqual(batch_writer.get_stats()['sent'], 3, err_msg)
+
+	def test_batch_flushed_by_age(self):
+		"""
+		Test that a part batch is sent once its oldest reading is old enough, and the rest on close
+		"""
+		batch_writer = self.__batch_writer(batch_size=100, max_age_secs=0.05)
+		self.__server.status = c.QUEUED_STATUS
+		batch_writer.write_to_channel({c.TEST_FIELD: 'a'})
+		requests = self.__wait_for_requests(1)
+		err_msg = 'Old reading not flushed'
+		self.assertEqual(len(requests), 1, err_msg)
+
+		batch_writer.write_to_channel({c.TEST_FIELD: 'b'})
+		batch_writer.close()
+		err_msg = 'Buffered reading not flushed on close'
+		self.assertEqual(len(self.__requests()), 2, err_msg)
+
+	def test_failed_batch_kept(self):
+		"""
+		Test that readings of a failed bulk update stay buffered, in order, for the next flush
+		"""
+		batch_writer = self.__batch_writer(batch_size=100, max_age_secs=60)
+		self.__server.status = 500
+		batch_writer.write_to_channel({c.TEST_FIELD: 1})
+		batch_writer.write_to_channel({c.TEST_FIELD: 2})
+
+		err_msg = 'Failed flush reported as sent'
+		self.assertFalse(batch_writer.flush(), err_msg)
+		err_msg = 'Failed readings not kept'
+		self.assertEqual(batch_writer.get_stats()['pending'], 2, err_msg)
+
+		batch_writer.write_to_channel({c.TEST_FIELD: 3})
+		self.__server.status = c.QUEUED_STATUS
+		batch_writer.close()
+		updates = json.loads(self.__requests()[-1][1])['updates']
+		err_msg = 'Kept readings not resent in order'
+		self.assertEqual([update[c.TEST_FIELD] for update in updates], [1, 2, 3], err_msg)
+
+	def test_without_channel_writes_each(self):
+		"""
+		Test that without a channel ID waiting readings are merged into one update, later fields winning
+		"""
+		batch_writer = self.__batch_writer(channel=None, batch_size=3, max_age_secs=60)
+		batch_writer.write_to_channel({c.TEST_FIELD: 1})
+		batch_writer.write_to_channel({'field2': 2})
+		batch_writer.write_to_channel({c.TEST_FIELD: 3})
+		requests = self.__wait_for_requests(1)
+		batch_writer.close()
+
+		err_msg = 'Readings not merged into one update'
+		self.assertEqual([path for path, _, _ in requests], ['/update'], err_msg)
+		fields = urllib.parse.parse_qs(requests[0][1])
+		self.assertEqual((fields[c.TEST_FIELD], fields['field2']), (['3'], ['2']), err_msg)
+		err_msg = 'Stats do not count merged readings'
+		self.assertEqual(batch_writer.get_stats()['merged'], 2, err_msg)
+
+	def test_outbox_survives_restart(self):
+		"""
+		Test that readings not sent before closing are sent, in order, by the next run
+		"""
+		self.__server.status = 500
+		batch_writer = self.__batch_writer(batch_size=100, max_age_secs=60)
+		batch_writer.write_to_channel({c.TEST_FIELD: 1})
+		batch_writer.write_to_channel({c.TEST_FIELD: 2})
+		batch_writer.close()
+		err_msg = 'Unsent readings not kept in outbox'
+		self.assertEqual(batch_writer.get_stats()['pending'], 2, err_msg)
+
+		self.__server.status = c.QUEUED_STATUS
+		batch_writer = self.__batch_writer(batch_size=100, max_age_secs=60)
+		batch_writer.write_to_channel({c.TEST_FIELD: 3})
+		requests = self.__wait_for_requests(2)
+		batch_writer.close()
+		updates = json.loads(requests[-1][1])['updates']
+		err_msg = 'Readings of last run not sent in order'
+		self.assertEqual([update[c.TEST_FIELD] for update in updates], [1, 2, 3], err_msg)
+		err_msg = 'Outbox not emptied'
+		self.assertEqual(batch_writer.get_stats()['pending'], 0, err_msg)
+
+	def test_outbox_bounded(self):
+		"""
+		Test that a full outbox drops the oldest readings
+		"""
+		self.__server.status = 500
+		batch_writer = self.__batch_writer(max_rows=3, batch_size=100, max_age_secs=60)
+		for i in range(5):
+			batch_writer.write_to_channel({c.TEST_FIELD: i})
+		stats = batch_writer.get_stats()
+
+		err_msg = 'Outbox not bounded'
+		self.assertEqual(stats['pending'], 3, err_msg)
+		self.assertEqual(stats['dropped'], 2, err_msg)
+		self.__server.status = c.QUEUED_STATUS
+		batch_writer.close()
+		updates = json.loads(self.__requests()[-1][1])['updates']
+		err_msg = 'Newest readings not kept'
+		self.assertEqual([update[c.TEST_FIELD] for update in updates], [2, 3, 4], err_msg)
+
+	def test_failed_flush_backs_off(self):
+		"""
+		Test that a failed flush is not retried before the retry delay
+		"""
+		self.__server.status = 500
+		batch_writer = self.__batch_writer(batch_size=1, max_age_secs=0, retry_secs=60)
+		batch_writer.write_to_channel({c.TEST_FIELD: 1})
+		self.__wait_for_requests(1)
+		batch_writer.write_to_channel({c.TEST_FIELD: 2})
+		time.sleep(POLL_SECS * 10)
+
+		err_msg = 'Failed flush retried without backing off'
+		self.assertEqual(len(self.__requests()), 1, err_msg)
+		self.assertEqual(batch_writer.get_stats()['failed'], 1, err_msg)
+
+	def test_scheduler_spaces_writes(self):
+		"""
+		Test that writers sharing a scheduler wait for a slot per write API key
+		"""
+		scheduler = WriteScheduler(interval_secs=TEST_SLOT_SECS)
+		writers = [self.__writer(scheduler=scheduler) for _ in range(2)]
+		start = time.monotonic()
+		for writer in writers + writers[:1]:
+			writer.write_to_channel({c.TEST_FIELD: 1})
+		took = time.monotonic() - start
+		for writer in writers:
+			writer.close()
+
+		err_msg = 'Writes not spaced by the update interval'
+		self.assertGreaterEqual(took, TEST_SLOT_SECS * 1.5, err_msg)
+		self.assertEqual(scheduler.get_stats()['waits'], 2, err_msg)
+		err_msg = 'Other write API key rate limited'
+		self.assertEqual(scheduler.get_wait_secs('OTHERKEY'), 0, err_msg)
+
+	def test_readings_merged_per_slot(self):
+		"""
+		Test that readings within an update interval are sent as one update, later fields winning
+		"""
+		batch_writer = self.__batch_writer(scheduler=WriteScheduler(interval_secs=60), batch_size=3, max_age_secs=60)
+		self.__server.status = c.QUEUED_STATUS
+		batch_writer.write_to_channel({c.TEST_FIELD: 1})
+		batch_writer.write_to_channel({'field2': 2})
+		batch_writer.write_to_channel({c.TEST_FIELD: 3})
+		requests = self.__wait_for_requests(1)
+		batch_writer.close()
+
+		err_msg = 'Readings of a slot not merged'
+		updates = json.loads(requests[0][1])['updates']
+		self.assertEqual(len(updates), 1, err_msg)
+		self.assertEqual((updates[0][c.TEST_FIELD], updates[0]['field2']), (3, 2), err_msg)
+		stats = batch_writer.get_stats()
+		err_msg = 'Stats do not count merged readings'
+		self.assertEqual((stats['sent'], stats['merged']), (3, 2), err_msg)
+
+if __name__ == '__main__':
+	logging.basicConfig(format=c.LOGGING_FORMAT, level=c.LOGGING_TEST_LEVEL)
+	main()
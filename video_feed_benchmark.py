@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""Benchmark /video_feed streaming with the fake camera backend.
+
+Serves the same Camera/mjpeg_stream route as main.py (main.py itself
+needs the pan/tilt GPIO) on werkzeug's threaded server, then reads the
+stream with N clients in a separate process so the server's CPU time
+isn't mixed with the clients'. Reports per-client frame rate, throughput
+& capture-to-client latency, and server CPU per client.
+
+    python video_feed_benchmark.py -c 1 2 4 8 -d 10
+"""
+import argparse
+import logging
+import http.client
+import multiprocessing
+import statistics
+import threading
+import time
+
+from flask import Flask, Response, request
+from werkzeug.serving import make_server
+
+import camera_pi
+from camera_pi import (Camera, FakeCameraBackend, MAX_FPS, MJPEG_MIMETYPE,
+                       FRAME_HEADER, FRAME_TRAILER, mjpeg_stream)
+
+HOST = '127.0.0.1'
+READ_SIZE = 64 * 1024
+DEFAULT_DURATION_SECS = 10
+DEFAULT_CLIENTS = [1, 2, 4, 8]
+CLIENT_START_TIMEOUT = 30
+SOI = b'\xff\xd8'
+EOI = b'\xff\xd9'
+
+
+def create_app():
+    app = Flask(__name__)
+
+    @app.route("/video_feed")
+    def video_feed():
+        max_fps = request.args.get('fps', MAX_FPS, type=int)
+        return Response(mjpeg_stream(Camera(max_fps=max(max_fps, 0))),
+                        mimetype=MJPEG_MIMETYPE)
+
+    return app
+
+
+def read_stream(port, max_fps, duration, results):
+    """Client thread: read /video_feed for duration seconds."""
+    conn = http.client.HTTPConnection(HOST, port)
+    conn.request('GET', '/video_feed?fps={:d}'.format(max_fps))
+    response = conn.getresponse()
+
+    frames = 0
+    total_bytes = 0
+    latencies = []
+    buffer = b''
+    start = None
+    while start is None or time.time() - start < duration:
+        chunk = response.read1(READ_SIZE)
+        if not chunk:
+            break
+        total_bytes += len(chunk)
+        buffer += chunk
+
+        # a frame ends at the next header, or at its EOI & trailer
+        parts = buffer.split(FRAME_HEADER)
+        buffer = parts.pop()
+        if buffer.endswith(EOI + FRAME_TRAILER):
+            parts.append(buffer)
+            buffer = b''
+        for part in parts:
+            if not part:
+                continue
+            if start is None:
+                start = time.time()  # skip warm-up & first frame
+                continue
+            frames += 1
+            if part.startswith(SOI):
+                # synthetic frame: SOI, "<count> <publish time>\n", ...
+                published = float(part[len(SOI):part.index(b'\n')].split()[1])
+                latencies.append(time.time() - published)
+    conn.close()
+
+    elapsed = time.time() - start if start else 0
+    results.append({'fps': frames / elapsed if elapsed else 0,
+                    'mbps': total_bytes * 8 / elapsed / 1e6 if elapsed else 0,
+                    'latencies': latencies})
+
+
+def run_clients(port, clients, max_fps, duration, queue):
+    """Client process: read the stream with clients threads."""
+    results = []
+    threads = [threading.Thread(target=read_stream,
+                                args=(port, max_fps, duration, results))
+               for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    queue.put(results)
+
+
+def benchmark(port, clients, max_fps, duration):
+    """Stream to clients & return a summary of one run."""
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=run_clients, args=(port, clients, max_fps, duration, queue))
+
+    cpu_start = time.process_time()
+    wall_start = time.time()
+    process.start()
+    results = queue.get(timeout=duration + CLIENT_START_TIMEOUT)
+    process.join()
+    cpu = time.process_time() - cpu_start
+    wall = time.time() - wall_start
+
+    latencies = sorted(l for r in results for l in r['latencies'])
+    p95 = latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0
+    return {'clients': clients,
+            'fps': statistics.mean(r['fps'] for r in results),
+            'mbps': sum(r['mbps'] for r in results),
+            'latency_ms': statistics.mean(latencies) * 1000 if latencies else 0,
+            'p95_ms': p95 * 1000,
+            'cpu_pct': cpu / wall * 100,
+            'cpu_pct_per_client': cpu / wall * 100 / clients}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-c', '--clients', type=int, nargs='+',
+                        default=DEFAULT_CLIENTS, help='client counts to run')
+    parser.add_argument('-d', '--duration', type=float,
+                        default=DEFAULT_DURATION_SECS, help='seconds per run')
+    parser.add_argument('--source-fps', type=int, default=camera_pi.FAKE_FPS,
+                        help='fake camera frame rate')
+    parser.add_argument('--max-fps', type=int, default=0,
+                        help='per-client frame rate cap (0 for none)')
+    parser.add_argument('--frames', help='directory of .jpg frames to replay '
+                        '(no latency measurement)')
+    parser.add_argument('-l', '--logging-level', default='WARNING')
+    args = parser.parse_args()
+    logging.basicConfig(level=args.logging_level)
+    logging.getLogger('werkzeug').setLevel(args.logging_level)
+
+    if args.frames:
+        Camera.backend = FakeCameraBackend.from_directory(
+            args.frames, fps=args.source_fps)
+    else:
+        Camera.backend = FakeCameraBackend(fps=args.source_fps)
+
+    server = make_server(HOST, 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    print('{:>7} {:>7} {:>8} {:>11} {:>8} {:>6} {:>11}'.format(
+        'clients', 'fps', 'Mbit/s', 'latency ms', 'p95 ms', 'cpu %',
+        'cpu %/client'))
+    for clients in args.clients:
+        result = benchmark(server.port, clients, args.max_fps, args.duration)
+        print('{clients:>7} {fps:>7.1f} {mbps:>8.1f} {latency_ms:>11.1f} '
+              '{p95_ms:>8.1f} {cpu_pct:>6.1f} {cpu_pct_per_client:>11.2f}'
+              .format(**result))
+
+    server.shutdown()
+    Camera.lifecycle.stop()
+
+
+if __name__ == '__main__':
+    main()